@@ -0,0 +1,116 @@
+"""\
+:mod:`ptemplate.aio` -- asynchronous rendering
+----------------------------------------------
+
+This module renders templates with data dictionaries whose values may be
+awaitables (coroutines, tasks, futures) or asynchronous iterables. Before the
+template is rendered, :func:`resolve` awaits every such value concurrently and
+replaces it with its result (or, for asynchronous iterables, a list of the
+items they produce). Values that turn out to contain further awaitables are
+resolved in the same way, so independent data sources are always fetched in
+parallel rather than one after another.
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import asyncio
+from inspect import isawaitable
+
+__all__ = ["render", "resolve"]
+
+def pending(value):
+    """Return True if *value* must be awaited or iterated asynchronously."""
+    return isawaitable(value) or hasattr(value, "__aiter__")
+
+async def settle(value):
+    """Await *value* until it is neither awaitable nor asynchronously iterable."""
+    while pending(value):
+        if isawaitable(value):
+            value = await value
+        else:
+            value = [item async for item in value]
+    return value
+
+def scan(value, slots, copies):
+    """Return *value*, or a copy of it if it holds pending values.
+
+    Only the dictionaries, lists and tuples on the way to a pending value
+    are copied; everything else is shared with the original. Each pending
+    value is replaced by None in its copied container and recorded in
+    *slots* as a (container, key, value) tuple. Tuples are copied into
+    lists (so their slots can be filled); *copies* maps the id of each copy
+    to the type of the original, for :func:`freeze`.
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    else:
+        return value
+
+    copy = None
+    for key, item in items:
+        if pending(item):
+            new = None
+        else:
+            new = scan(item, slots, copies)
+            if new is item:
+                continue
+        if copy is None:
+            copy = dict(value) if isinstance(value, dict) else list(value)
+            copies[id(copy)] = value.__class__
+        copy[key] = new
+        if new is None:
+            slots.append((copy, key, item))
+    return value if copy is None else copy
+
+def freeze(value, copies):
+    """Turn the copies of tuples made by :func:`scan` in *value* back into tuples."""
+    cls = copies.get(id(value))
+    if cls is None:
+        return value
+    keys = list(value) if isinstance(value, dict) else range(len(value))
+    for key in keys:
+        value[key] = freeze(value[key], copies)
+    if issubclass(cls, tuple):
+        return cls._make(value) if hasattr(cls, "_make") else tuple(value)
+    return value
+
+async def resolve(data):
+    """Return *data* with all pending values resolved.
+
+    *data* is not modified: containers holding pending values are copied,
+    and the rest is shared with *data* (which is returned as it is if
+    nothing in it is pending). Pending values found at the same time are
+    awaited concurrently with :func:`asyncio.gather`.
+    """
+    slots = []
+    copies = {}
+    data = scan(await settle(data), slots, copies)
+    while slots:
+        values = await asyncio.gather(*[settle(value) for _, _, value in slots])
+        resolved, slots = slots, []
+        for (container, key, _), value in zip(resolved, values):
+            container[key] = scan(value, slots, copies)
+    return freeze(data, copies)
+
+async def render(template, data):
+    """Resolve *data* (see :func:`resolve`) and render *template* with it.
+
+    *template* is a :class:`ptemplate.template.Template` instance.
+    """
+    return template.render(await resolve(data))
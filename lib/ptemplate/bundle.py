@@ -0,0 +1,260 @@
+"""\
+:mod:`ptemplate.bundle` -- single-file template bundles
+-------------------------------------------------------
+
+A bundle packs a directory of templates into one file: each template's source
+and its compiled form (as stored by :class:`ptemplate.cache.DiskCache`),
+followed by an index. :func:`pack` (or ``python -m ptemplate.bundle``) writes
+bundles. At runtime, a :class:`Bundle` maps the file into memory, reads the
+index and decodes templates only when they are first used, so starting a
+process costs a handful of system calls however many templates there are,
+and processes using the same bundle share its pages.
+
+A :class:`BundleLoader` loads templates from a bundle. It also makes the
+bundle the templates' :attr:`ptemplate.template.Template.cache`, so templates
+compiled the same way as when the bundle was packed (same template class,
+converters, engine and so on) are never compiled again; others are compiled
+from their source::
+
+    engine = Template()
+    engine.loader = BundleLoader(Bundle("templates.ptb"), engine.derive)
+    engine.load_template("pages.index").render(data)
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import argparse
+import importlib
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+
+from ptemplate.cache import DiskCache, dumps, loads
+from ptemplate.loader import Entry, Loader
+from ptemplate.util import logger
+
+__all__ = ["Bundle", "BundleLoader", "pack"]
+
+MAGIC = b"PTBUNDLE"
+VERSION = 1
+"""The version of the bundle format."""
+HEADER = struct.Struct("<8sIQQ")
+"""The bundle header: magic, version, index offset and index length."""
+
+class Recorder(object):
+    """A template cache that keeps the entries stored in it (for :func:`pack`)."""
+    key = DiskCache.key
+    version = DiskCache.version
+
+    def __init__(self):
+        self.entries = {}
+
+    def load(self, key):
+        return None
+
+    def store(self, key, tree, code=None, included={}):
+        self.entries[key] = dumps(tree, code, included)
+
+def names(directory, extensions):
+    """Yield the names of the template files in *directory*.
+
+    Names are paths relative to *directory* with '/' separators; only files
+    ending with one of *extensions* are included.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(tuple(extensions)):
+                path = os.path.relpath(os.path.join(root, name), directory)
+                yield path.replace(os.sep, '/')
+
+def pack(directory, filename, factory=None):
+    """Pack the templates in *directory* into the bundle *filename*.
+
+    Each template is compiled with a :class:`ptemplate.loader.Loader`
+    searching *directory* and using *factory* (see
+    :class:`ptemplate.loader.Loader`); templates should be loaded from the
+    bundle with the same factory to use their compiled forms. The bundle is
+    written to a temporary file and then renamed into place. Returns the
+    names of the packed templates.
+    """
+    loader = Loader([directory], factory)
+    recorder = Recorder()
+    sources = {}
+    for name in names(directory, loader.extensions):
+        sources[name] = source = loader.source(name)
+        template = loader.create(source)
+        template.cache = recorder
+        template.compile()
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            index = {"sources": {}, "entries": {}}
+            for table, blobs in ((index["sources"], sorted(sources.items())),
+                    (index["entries"], sorted(recorder.entries.items()))):
+                for key, blob in blobs:
+                    if isinstance(blob, str):
+                        blob = blob.encode("utf-8")
+                    table[key] = (f.tell(), len(blob))
+                    f.write(blob)
+            offset = f.tell()
+            data = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+            f.write(data)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, offset, len(data)))
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return sorted(sources)
+
+class Bundle(object):
+    """A bundle of templates written by :func:`pack`.
+
+    The file *filename* is mapped into memory when the bundle is opened;
+    only the index is decoded then. A :class:`Bundle` can be used as a
+    template's :attr:`ptemplate.template.Template.cache` (it never stores
+    anything).
+    """
+    key = DiskCache.key
+    version = DiskCache.version
+
+    def __init__(self, filename):
+        self.log = logger(__name__, self)
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, offset, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError("%r is not a version %d template bundle" %
+                (filename, VERSION))
+        index = pickle.loads(self.data[offset:offset + length])
+        self.sources = index["sources"]
+        """The (offset, length) of each template's source, keyed by name."""
+        self.entries = index["entries"]
+        """The (offset, length) of each compiled template, keyed by cache key."""
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def __iter__(self):
+        return iter(sorted(self.sources))
+
+    def blob(self, table, key):
+        offset, length = table[key]
+        return self.data[offset:offset + length]
+
+    def source(self, name):
+        """Return the source of the template *name*."""
+        return self.blob(self.sources, name).decode("utf-8")
+
+    def load(self, key):
+        """Return the compiled template stored for *key* (or None).
+
+        See :meth:`ptemplate.cache.DiskCache.load`.
+        """
+        if key not in self.entries:
+            return None
+        return loads(self.blob(self.entries, key))
+
+    def store(self, key, tree, code=None, included={}):
+        """Do nothing; bundles are read-only."""
+
+    def close(self):
+        """Unmap the bundle."""
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class BundleLoader(Loader):
+    """A :class:`ptemplate.loader.Loader` loading templates from a :class:`Bundle`.
+
+    Names are resolved like file names relative to a search path (see
+    :meth:`ptemplate.loader.Loader.candidates`). A bundle never changes, so
+    templates aren't checked for changes.
+    """
+
+    def __init__(self, bundle, factory=None, maxsize=128, maxbytes=None):
+        super(BundleLoader, self).__init__((), factory, maxsize, maxbytes)
+        self.bundle = bundle
+
+    def find(self, name):
+        """Return the name of the template *name* in the bundle."""
+        for candidate in self.candidates(name):
+            candidate = candidate.replace(os.sep, '/')
+            if candidate in self.bundle:
+                return candidate
+        raise IOError("template %r not found in %r" % (name, self.bundle.filename))
+
+    def source(self, name):
+        return self.bundle.source(self.find(name))
+
+    def create(self, source):
+        """Return a new template for *source* using the bundle as its cache."""
+        template = super(BundleLoader, self).create(source)
+        if getattr(template, "cache", False) is None:
+            template.cache = self.bundle
+        return template
+
+    def read(self, name):
+        source = self.source(name)
+        template = self.create(source)
+        template.compile()
+        return Entry(template, {}, len(source), self.clock())
+
+def factory(spec, engine=None, autoescape=False):
+    """Return a template factory for :func:`pack` from the command line.
+
+    *spec* names a template class as "module:Class".
+    """
+    module, _, name = spec.partition(':')
+    template = getattr(importlib.import_module(module), name)()
+    if engine is not None:
+        template.engine = engine
+    template.autoescape = autoescape
+    return template.derive
+
+def main(argv=None):
+    """Pack a directory of templates: ``python -m ptemplate.bundle DIR FILE``."""
+    parser = argparse.ArgumentParser(prog="python -m ptemplate.bundle",
+        description="Pack a directory of templates into a bundle.")
+    parser.add_argument("directory")
+    parser.add_argument("filename")
+    parser.add_argument("--template", default="ptemplate.template:Template",
+        help="the template class (default: %(default)s)")
+    parser.add_argument("--engine", choices=["interpreter", "python"])
+    parser.add_argument("--autoescape", action="store_true")
+    args = parser.parse_args(argv)
+
+    packed = pack(args.directory, args.filename,
+        factory(args.template, args.engine, args.autoescape))
+    sys.stdout.write("%d templates packed into %s\n" % (len(packed), args.filename))
+    return 0
+
+if __name__ == "__main__": # pragma: nocover
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""\
+:mod:`ptemplate.cache` -- persistent template cache
+---------------------------------------------------
+
+This module stores compiled templates on disk so that a freshly started
+process can load them instead of compiling them again. Entries are keyed by a
+hash of everything that affects the compiled form: the template source, the
+formatter, the preprocessor, the converters, the rendering engine and the
+versions of :mod:`ptemplate` and the interpreter. Changing any of these simply
+produces a new key; stale entries are never loaded. The sources of included
+templates aren't part of the key; entries record digests of them instead.
+Templates compiled with callables that can't be described the same way in
+every process (see :func:`describe`) aren't cached at all.
+
+Entries are written to a temporary file in the cache directory and then
+renamed into place, so concurrent processes sharing a cache directory never
+see partially written entries.
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import hashlib
+import marshal
+import os
+import pickle
+import tempfile
+import re
+import types
+from functools import partial
+from importlib.util import MAGIC_NUMBER
+
+import ptemplate
+from ptemplate.util import logger
+
+__all__ = ["DiskCache"]
+
+# Callables described by name (and code, where they have any).
+functions = (types.FunctionType, types.MethodType, types.BuiltinFunctionType,
+    types.MethodDescriptorType, types.WrapperDescriptorType,
+    types.MethodWrapperType, types.ClassMethodDescriptorType)
+
+def describe(obj, seen=None):
+    """Return a string identifying *obj* for use in a cache key.
+
+    Functions are described by their qualified name and (where available) a
+    hash of their code (byte code, constants and names), default arguments
+    and closure, so editing a preprocessor or converter invalidates entries
+    compiled with the old version. Methods bound to an object also describe
+    the object, and :func:`functools.partial` objects are described by their
+    function and arguments. Other callables (like instances of classes
+    defining :meth:`__call__`) can't be described the same way in every
+    process; :exc:`ValueError` is raised for them.
+    """
+    if obj is None:
+        return "None"
+    if seen is None:
+        seen = set()
+    if isinstance(obj, partial):
+        return "partial(%s, %s, %s)" % (describe(obj.func, seen),
+            stable(obj.args, seen), stable(obj.keywords, seen))
+    if isinstance(obj, type):
+        return "%s.%s" % (obj.__module__, obj.__qualname__)
+    if not isinstance(obj, functions):
+        raise ValueError("can't describe %r for a cache key" % (obj,))
+    func = getattr(obj, "__func__", obj)
+    name = "%s.%s" % (getattr(func, "__module__", None),
+        getattr(func, "__qualname__", type(func).__name__))
+    owner = getattr(obj, "__self__", None)
+    if owner is not None and not isinstance(owner, (type, types.ModuleType)):
+        name = "%s.%s" % (stable(owner, seen), name)
+    code = getattr(func, "__code__", None)
+    if code is not None:
+        if id(func) in seen:
+            return name
+        seen.add(id(func))
+        cells = []
+        for cell in getattr(func, "__closure__", None) or ():
+            try:
+                cells.append(cell.cell_contents)
+            except ValueError:
+                cells.append(None)
+        kwdefaults = getattr(func, "__kwdefaults__", None) or {}
+        parts = (code, getattr(func, "__defaults__", None), kwdefaults, cells)
+        name += ":" + hashlib.sha1(stable(parts, seen).encode("utf-8")).hexdigest()
+    return name
+
+def stable(obj, seen):
+    """Return a representation of *obj* that doesn't vary between processes.
+
+    Only the built in scalar types are represented by their :func:`repr`.
+    Code objects are represented by their byte code, names and constants,
+    containers by their (sorted, where unordered) members, compiled regular
+    expressions by their pattern and flags and everything else by
+    :func:`describe` (so objects whose :func:`repr` might hold an address
+    raise :exc:`ValueError`).
+    """
+    if obj is None or type(obj) in (bool, int, float, complex, str, bytes):
+        return repr(obj)
+    elif isinstance(obj, types.CodeType):
+        return "code(%s, %r, %s)" % (hashlib.sha1(obj.co_code).hexdigest(),
+            obj.co_names, stable(obj.co_consts, seen))
+    elif isinstance(obj, (tuple, list)):
+        return "(%s)" % ", ".join(stable(item, seen) for item in obj)
+    elif isinstance(obj, (set, frozenset)):
+        return "{%s}" % ", ".join(sorted(stable(item, seen) for item in obj))
+    elif isinstance(obj, dict):
+        return "{%s}" % ", ".join(sorted("%s: %s" % (stable(k, seen),
+            stable(v, seen)) for k, v in obj.items()))
+    elif isinstance(obj, re.Pattern):
+        return "re.compile(%r, %d)" % (obj.pattern, obj.flags)
+    return describe(obj, seen)
+
+def dumps(tree, code=None, included={}):
+    """Return the bytes of an entry holding *tree*, *code* and *included*."""
+    if code is not None:
+        code = marshal.dumps(code)
+    return pickle.dumps((tree, code, dict(included)), pickle.HIGHEST_PROTOCOL)
+
+def loads(data):
+    """Return the (tree, code, included) tuple of the entry in *data*."""
+    tree, code, included = pickle.loads(data)
+    if code is not None:
+        code = marshal.loads(code)
+    return tree, code, included
+
+class DiskCache(object):
+    """A directory of compiled templates.
+
+    Each entry holds the section tree produced by
+    :meth:`ptemplate.formatter.Formatter.compile` (pickled) and, optionally,
+    the code object produced by :meth:`ptemplate.codegen.Generator.compile`
+    (marshalled) and the digests of the sources of the templates it includes.
+    """
+    version = 4
+    """The version of the on-disk entry format."""
+    suffix = ".ptc"
+    """The file name suffix of cache entries."""
+
+    def __init__(self, directory):
+        self.log = logger(__name__, self)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source, formatter=None, preprocessor=None, converters={},
+            engine=None, autoescape=False):
+        """Return the cache key for a template.
+
+        *source* is the template string before preprocessing. The remaining
+        arguments describe how it is compiled; see :meth:`ptemplate.template.Template.compile`.
+        Returns None if the preprocessor or a converter can't be described
+        (see :func:`describe`); such templates aren't cached.
+        """
+        try:
+            described = [
+                describe(type(formatter)),
+                describe(preprocessor),
+                repr(sorted((k, describe(v)) for k, v in converters.items())),
+            ]
+        except ValueError:
+            return None
+        parts = [
+            str(self.version),
+            ptemplate.__version__,
+            MAGIC_NUMBER.hex(),
+            repr(sorted(getattr(formatter, "markers", {}).items())),
+            repr(engine),
+            repr(autoescape),
+            source,
+        ] + described
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, key):
+        """Return the path of the entry for *key*."""
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, key):
+        """Load the entry for *key*.
+
+        Returns a (tree, code, included) tuple or None if there is no usable
+        entry. *code* is None if the entry was stored without a code object.
+        *included* maps the names of included templates to the digests of
+        their sources (see :attr:`ptemplate.template.Template.included`); the
+        caller should check them before using the entry.
+        """
+        try:
+            with open(self.path(key), "rb") as f:
+                return loads(f.read())
+        except Exception:
+            # A missing, damaged or foreign entry is as good as no entry.
+            return None
+
+    def store(self, key, tree, code=None, included={}):
+        """Atomically store *tree*, *code* and *included* as the entry for *key*."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dumps(tree, code, included))
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def clear(self):
+        """Remove all entries from the cache directory."""
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
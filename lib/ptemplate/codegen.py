@@ -0,0 +1,249 @@
+"""\
+:mod:`ptemplate.codegen` -- Python code generation
+--------------------------------------------------
+
+This module translates templates compiled by
+:meth:`ptemplate.formatter.Formatter.compile` into Python source for a
+dedicated render function. Sections become ``for`` loops, simple fields become
+direct scope lookups and converters are bound once, when the code is loaded,
+instead of being dispatched through
+:meth:`ptemplate.formatter.Formatter.convert_field` for every field. The
+generated function produces the same output as
+:meth:`ptemplate.formatter.Formatter.formatsection` without walking the tree.
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import string
+from _string import formatter_field_name_split
+
+from ptemplate.formatter import Formatter, Scopes, Section, Token
+from ptemplate.util import logger
+
+__all__ = ["Generator"]
+
+def getter(formatter):
+    """Return a function that binds a field lookup function to some scopes.
+
+    Unless *formatter* overrides
+    :meth:`ptemplate.formatter.Formatter.get_value`, fields are looked up
+    with :meth:`ptemplate.formatter.Scopes.get` directly.
+    """
+    if type(formatter).get_value is Formatter.get_value:
+        return lambda scopes: scopes.get
+    get_value = formatter.get_value
+    return lambda scopes: lambda field: get_value(field, (), scopes)
+
+class Generator(object):
+    """A Python code generator.
+
+    :meth:`generate` translates a compiled template into the source of two
+    functions named :attr:`name` and :attr:`streamname`; :meth:`compile` turns
+    that source into a code object and :meth:`load` binds the code object to a
+    formatter. The resulting functions take the same *data* and *scopes*
+    arguments as :meth:`ptemplate.formatter.Formatter.formatsection` and
+    :meth:`ptemplate.formatter.Formatter.iterformat`, respectively.
+    """
+    name = "render"
+    """The name of the generated function that returns a string."""
+    streamname = "generate"
+    """The name of the generated function that yields chunks of output."""
+    filename = "<ptemplate>"
+    """The file name reported in tracebacks from generated code."""
+    indent = "    "
+    """The indentation used for each block of generated code."""
+
+    def __init__(self):
+        self.log = logger(__name__, self)
+
+    def generate(self, nodes):
+        """Return Python source that renders the compiled template *nodes*.
+
+        The source defines two functions: :attr:`name` collects the output in
+        a list and returns it as a string and :attr:`streamname` yields it as
+        it is produced.
+        """
+        self.lines = []
+        self.conversions = {}
+        self.fragments = []
+        self.section(nodes, 2, 0, "append0")
+        render, self.lines = self.lines, []
+        self.section(nodes, 2, 0, None)
+        stream, self.lines = self.lines, []
+
+        self.write(0, "converter = formatter.converter")
+        for conversion, name in sorted(self.conversions.items()):
+            self.write(0, "_%s = converter(%r)" % (name, conversion))
+        for i, node in enumerate(self.fragments):
+            self.write(0, "_fragment%d = %r" % (i, node))
+        self.function(self.name, render, True)
+        self.function(self.streamname, stream, False)
+
+        return '\n'.join(self.lines) + '\n'
+
+    def function(self, name, body, collect):
+        """Wrap *body* in a function called *name*.
+
+        If *collect* is True, the function returns its output as a string.
+        Otherwise, it is a generator yielding its output.
+        """
+        self.write(0, "")
+        self.write(0, "def %s(data, scopes=None):" % name)
+        self.write(1, "if scopes is None:")
+        self.write(2, "scopes = Scopes()")
+        self.write(1, "get = getter(scopes)")
+        self.write(1, "get_field = formatter.get_field")
+        self.write(1, "rows = formatter.rows")
+        self.write(1, "push = scopes.push")
+        self.write(1, "pop = scopes.pop")
+        for conversion, local in sorted(self.conversions.items()):
+            self.write(1, "%s = _%s" % (local, local))
+        if collect:
+            self.write(1, "result = []")
+            self.write(1, "append0 = result.append")
+        self.write(1, "depth = len(scopes)")
+        self.write(1, "push(data)")
+        self.write(1, "try:")
+        self.lines.extend(body)
+        self.write(2, "pass")
+        self.write(1, "finally:")
+        self.write(2, "scopes.truncate(depth)")
+        if collect:
+            self.write(1, "return ''.join(result)")
+        else:
+            # Keep the function a generator even if the template has no output.
+            self.write(1, "return")
+            self.write(1, "yield")
+
+    def compile(self, nodes):
+        """Return a code object for the compiled template *nodes*."""
+        return compile(self.generate(nodes), self.filename, "exec")
+
+    def load(self, code, formatter):
+        """Bind *code* (from :meth:`compile`) to *formatter*.
+
+        The converters used by the template are resolved from *formatter*
+        here. Returns the functions named by :attr:`name` and
+        :attr:`streamname`.
+        """
+        namespace = {
+            "formatter": formatter,
+            "format_field": formatter.format_field,
+            "getter": getter(formatter),
+            "Scopes": Scopes,
+            "Section": Section,
+            "Token": Token,
+        }
+        if type(formatter).format_field is string.Formatter.format_field:
+            namespace["format_field"] = format
+        exec(code, namespace)
+        return namespace[self.name], namespace[self.streamname]
+
+    def build(self, nodes, formatter):
+        """Generate, compile and load the functions for *nodes*."""
+        return self.load(self.compile(nodes), formatter)
+
+    def write(self, depth, line):
+        self.lines.append(self.indent * depth + line)
+
+    def conversion(self, conversion):
+        """Return the name of the local bound to the converter for *conversion*."""
+        name = self.conversions.get(conversion)
+        if name is None:
+            name = self.conversions[conversion] = "convert%d" % len(self.conversions)
+        return name
+
+    def lookup(self, field):
+        """Return an expression that looks up *field* in the current scopes."""
+        first, rest = formatter_field_name_split(field)
+        if not list(rest):
+            return "get(%r)" % (first,)
+        return "get_field(%r, (), scopes)[0]" % (field,)
+
+    def emit(self, depth, append, value):
+        """Pass the expression *value* to *append* (or yield it if None)."""
+        if append is None:
+            self.write(depth, "yield %s" % value)
+        else:
+            self.write(depth, "%s(%s)" % (append, value))
+
+    def section(self, nodes, depth, level, append):
+        """Generate code for *nodes* at indentation *depth* and scope *level*.
+
+        Output is passed to the local function named *append* or, if *append*
+        is None, yielded.
+        """
+        for node in nodes:
+            if isinstance(node, str):
+                self.emit(depth, append, repr(node))
+            elif isinstance(node, Section):
+                self.subsection(node, depth, level, append)
+            else:
+                self.emit(depth, append, self.expression(node))
+
+    def subsection(self, node, depth, level, append):
+        if node.cache is not None:
+            # Cached sections are rendered (and cached) by the formatter when
+            # it has fragments.
+            if node not in self.fragments:
+                self.fragments.append(node)
+            name = "_fragment%d" % self.fragments.index(node)
+            self.write(depth, "if formatter.fragments is not None:")
+            self.emit(depth + 1, append, "formatter.formatfragment(%s, %s, scopes)" %
+                (name, self.lookup(node.name)))
+            self.write(depth, "else:")
+            depth += 1
+
+        inner = level + 1
+        self.write(depth, "for data%d in rows(%s):" % (inner, self.lookup(node.name)))
+        self.write(depth + 1, "push(data%d)" % inner)
+        if not (node.conversion or node.format):
+            self.section(node.tokens, depth + 1, inner, append)
+            self.write(depth + 1, "pop()")
+            return
+
+        # Converted or formatted sections need each iteration's output as a
+        # single string.
+        self.write(depth + 1, "result%d = []" % inner)
+        self.write(depth + 1, "append%d = result%d.append" % (inner, inner))
+        self.section(node.tokens, depth + 1, inner, "append%d" % inner)
+        self.write(depth + 1, "pop()")
+        self.write(depth + 1, "content = ''.join(result%d)" % inner)
+        if node.conversion:
+            self.write(depth + 1, "content = %s(content)" %
+                self.conversion(node.conversion))
+        if node.format:
+            self.write(depth + 1, "content = format_field(content, %r)" % node.format)
+        self.emit(depth + 1, append, "content")
+
+    def expression(self, token):
+        """Return an expression that formats the field *token*.
+
+        Constant format specifications are inlined; specifications with nested
+        fields are built from their compiled nodes when the field is rendered.
+        """
+        value = self.lookup(token.field)
+        if token.conversion:
+            value = "%s(%s)" % (self.conversion(token.conversion), value)
+        spec = token.spec
+        if isinstance(spec, str):
+            spec = repr(spec)
+        else:
+            spec = "''.join([%s])" % ", ".join(
+                repr(node) if isinstance(node, str) else self.expression(node)
+                for node in spec)
+        return "format_field(%s, %s)" % (value, spec)
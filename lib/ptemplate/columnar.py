@@ -0,0 +1,144 @@
+"""\
+:mod:`ptemplate.columnar` -- columnar section data
+--------------------------------------------------
+
+Sections are normally fed with a list of data dictionaries, one per row. For
+wide tables that means building (and later walking) one dictionary per row.
+This module lets a section be fed with columns instead: a mapping of column
+name to a sequence (a list, a tuple, a NumPy array or anything else that can
+be iterated and sliced, but not a string) holding that column's values. :class:`Columns` wraps
+such a mapping and builds each row's data dictionary only while the row is
+rendered, so the per-row dictionaries are never all held in memory at once.
+
+:class:`ptemplate.formatter.Formatter` treats a plain dictionary used as a
+section value as a mapping of columns; a dictionary holding anything
+but columns (like a single record, ``{"name": "bob"}``) raises
+:exc:`ValueError` instead of being iterated. Fields formatted with a constant
+specification from a numeric NumPy column are formatted a column at a time
+with :func:`formatcolumn` rather than cell by cell.
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import re
+from itertools import chain, repeat
+
+__all__ = ["Columns", "formatblocks", "formatcolumn", "numeric"]
+
+printf = {
+    'f': re.compile(r"[+ ]?0?\d*(\.\d+)?[eEfFgG]$"),
+    'i': re.compile(r"[+ ]?0?\d*[dxXo]$"),
+    'u': re.compile(r"[+ ]?0?\d*[dxXo]$"),
+}
+"""Format specifications that printf-style formatting renders identically.
+
+Keys are NumPy dtype kinds.
+"""
+
+def numeric(column):
+    """Return True if *column* is a NumPy array of integers or floats."""
+    dtype = getattr(column, "dtype", None)
+    return getattr(dtype, "kind", None) in printf and hasattr(column, "tolist")
+
+def formatcolumn(column, spec):
+    """Return a list of the values in the numeric NumPy *column* formatted by *spec*.
+
+    The result matches calling :func:`format` on each value. The column is
+    converted to Python numbers in one call; specifications that printf-style
+    formatting supports (see :data:`printf`) are then applied to all of them
+    with a single `%` operation.
+    """
+    values = column.tolist()
+    if not values:
+        return []
+    if printf[column.dtype.kind].match(spec):
+        return ('\0'.join(['%' + spec] * len(values)) % tuple(values)).split('\0')
+    return [format(value, spec) for value in values]
+
+def formatblocks(columns, pieces, size):
+    """Format the rows in *columns* (a :class:`Columns` instance) in blocks.
+
+    *pieces* describes the output of a row: each piece is either a literal
+    string or a (name, spec) tuple naming a numeric column formatted by
+    *spec*. Yields strings holding the output of *size* rows each; the rows
+    of a block are formatted with :func:`formatcolumn` and interleaved by
+    joining the formatted columns.
+    """
+    names = set(piece[0] for piece in pieces if piece.__class__ is tuple)
+    columns = Columns(dict((name, columns.columns[name]) for name in names))
+    for chunk in columns.chunks(size):
+        formatted = {}
+        parts = []
+        for piece in pieces:
+            if piece.__class__ is str:
+                parts.append(repeat(piece, len(chunk)))
+                continue
+            part = formatted.get(piece)
+            if part is None:
+                part = formatted[piece] = formatcolumn(chunk.columns[piece[0]], piece[1])
+            parts.append(part)
+        yield ''.join(chain.from_iterable(zip(*parts)))
+
+def sequence(column):
+    """Return True if *column* can be a column of a :class:`Columns` instance.
+
+    Strings and mappings are sized and sliceable too, but they aren't columns.
+    """
+    if isinstance(column, (str, bytes, dict)):
+        return False
+    return hasattr(column, "__len__") and hasattr(column, "__getitem__")
+
+class Columns(object):
+    """A section data source made of columns.
+
+    *columns* is a mapping of column names to sequences of equal length.
+    Iterating over a :class:`Columns` instance yields a data dictionary for
+    each position in the columns. Each dictionary is built only when the row
+    is reached and can be discarded as soon as the row is rendered, so a
+    section fed with columns never holds more than one row's dictionary.
+    """
+
+    def __init__(self, columns):
+        for name, column in columns.items():
+            if not sequence(column):
+                raise ValueError("column %r is not a sequence: %r" % (name, column))
+        self.columns = columns
+        self.names = list(columns)
+        lengths = set(len(column) for column in columns.values())
+        if len(lengths) > 1:
+            raise ValueError("columns have different lengths: %s" %
+                ", ".join("%s=%d" % (name, len(column))
+                    for name, column in columns.items()))
+        self.length = lengths and lengths.pop() or 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        names = self.names
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+    def slice(self, start, stop):
+        """Return a :class:`Columns` instance holding rows *start* to *stop*."""
+        return Columns(dict((name, column[start:stop])
+            for name, column in self.columns.items()))
+
+    def chunks(self, size):
+        """Yield consecutive slices (see :meth:`slice`) of *size* rows."""
+        for start in range(0, self.length, size):
+            yield self.slice(start, start + size)
@@ -6,10 +6,16 @@ This module implements a templating interface similar Google's `ctemplate
 <http://google-ctemplate.googlecode.com/>`_ with a few important exceptions:
 
 * templates may not change the field delimiter
-* modifiers are marked with '!'
-* comments are marked with '%'
+* conversions marked with '!' and :pep:`3101` format specifications may be
+  used in addition to ctemplate's modifiers (see :mod:`ptemplate.modifiers`)
+* the short modifier names 'o' and 'c' are also :pep:`3101` presentation
+  types, which they remain when used alone ('{{VAR:o}}' is octal); spell
+  them out ('{{VAR:json_escape}}', '{{VAR:cleanse_css}}') instead
+* comments may also be marked with '%'
 * the templater does not strip whitespace (except by modifiers)
-* includes are not supported
+* includes ('{{>NAME}}') name template files (found by the templater's
+  loader) and are inlined when the template is compiled, so they share the
+  including template's dictionary and can't have modifiers
 * pragmas/macros are not supported
 * separator sections are not supported
 
@@ -38,10 +44,161 @@ OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 """
 
+import re
+
+from ptemplate import modifiers
+from ptemplate.formatter import Formatter, Scopes, Token, conversions
 from ptemplate.template import Template
 from ptemplate.util import logger
 
-__all__ = ["CTemplate"]
+__all__ = ["CFormatter", "CTemplate"]
+
+class CFormatter(Formatter):
+    """A formatter for Google's ctemplate syntax.
+
+    :class:`CFormatter` replaces :meth:`ptemplate.formatter.Formatter.tokenize`
+    with a lexer for ctemplate markers ('{{' and '}}'). Everything else,
+    including the rendering of the compiled template, is inherited.
+    """
+    markers = {
+        '#': "startsection",
+        '/': "endsection",
+        '!': "comment",
+        '%': "comment",
+        '>': "include",
+    }
+    """A dictionary mapping marker indicators to marker type names.
+
+    In addition to the markers understood by
+    :class:`ptemplate.formatter.Formatter`, '!' marks a comment (as in
+    ctemplate).
+    """
+    start = "{{"
+    """The string that opens a marker."""
+    end = "}}"
+    """The string that closes a marker."""
+    modifiers = modifiers.modifiers
+    """A dictionary of ctemplate modifiers keyed by their full names.
+
+    Each :class:`CFormatter` starts with its own copy of
+    :data:`ptemplate.modifiers.modifiers`. Custom modifiers (like
+    'x-shout') can be added as functions taking and returning a string.
+    """
+    modifierpattern = re.compile(r"([a-zA-Z][-\w]*(=[^:]*)?)(:[a-zA-Z][-\w]*(=[^:]*)?)*$")
+    formattypes = frozenset("bcdeEfFgGnosxX")
+    """The :pep:`3101` presentation types.
+
+    A format specification made of one of these alone (like 'o' or 'c') is a
+    format specification, not a modifier; use the full modifier name (like
+    'json_escape' or 'cleanse_css') instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CFormatter, self).__init__(*args, **kwargs)
+        self.modifiers = dict(self.modifiers)
+
+    def tokenize(self, string):
+        """Tokenize a ctemplate *string*.
+
+        :meth:`tokenize` scans *string* once, yielding a
+        :class:`ptemplate.formatter.Token` for each marker. Like ctemplate, it
+        treats the last '{{' in a run of braces as the start of the marker and
+        the first following '}}' as its end; other braces are literal text.
+        Comments end at the first '}}' regardless of their content. The
+        contents of other markers are parsed as :pep:`3101` fields, so they may
+        include conversions and format specifications. A specification made
+        of modifiers (see :meth:`ismodifiers`) becomes the field's conversion,
+        prefixed with ':' (so '{{VAR:h:j}}' has the conversion ':h:j').
+        """
+        start, end = self.start, self.end
+        pos = 0
+        length = len(string)
+
+        while True:
+            begin = string.find(start, pos)
+            if begin < 0:
+                break
+
+            # Skip to the last opening brace pair in a run of braces.
+            inside = begin + len(start)
+            while inside < length and string[inside] == start[-1]:
+                inside += 1
+            begin = inside - len(start)
+
+            close = string.find(end, inside)
+            if close < 0:
+                raise ValueError("unterminated marker at position %d" % begin)
+
+            text = string[pos:begin]
+            content = string[inside:close]
+            pos = close + len(end)
+
+            if self.markers.get(content[:self.markerlen]) == "comment":
+                yield Token(text, content[self.markerlen:], content, "comment",
+                    '', None)
+                continue
+
+            for _, field, spec, conversion in self.parse("{%s}" % content):
+                if conversion is None and self.ismodifiers(spec):
+                    spec, conversion = '', ':' + spec
+                yield self.token(text, field, spec, conversion)
+
+        if pos < length:
+            yield Token(string[pos:], None, None, None, None, None)
+
+    def ismodifiers(self, spec):
+        """Return True if the format specification *spec* is a modifier chain.
+
+        A chain is a list of modifier names separated by ':', each optionally
+        followed by '=' and an argument. It is only a chain if the first
+        modifier is known (or has a name starting with 'x-'); otherwise *spec*
+        is an ordinary format specification. A lone presentation type (see
+        :attr:`formattypes`) is never a chain, so "{{n:o}}" formats *n* in
+        octal as in :pep:`3101`. Unknown modifiers later in the chain raise
+        :exc:`ValueError`.
+        """
+        if not spec or spec in self.formattypes:
+            return False
+        if self.modifierpattern.match(spec) is None:
+            return False
+        names = [modifiers.canonical(name) for name in spec.split(':')]
+        if names[0] not in self.modifiers and not names[0].startswith("x-"):
+            return False
+        for name in names:
+            if name not in self.modifiers:
+                raise ValueError("unknown modifier %r" % name)
+        return True
+
+    def prepare(self, tokens):
+        """Fuse the modifier chains used by *tokens* into :attr:`converters`.
+
+        Each chain (like ':h:j') is fused by :func:`ptemplate.modifiers.fuse`
+        when the template is compiled (or loaded from a cache) and is then
+        dispatched like any other converter while rendering.
+        """
+        self.fuse(c for c in conversions(tokens) if c[0] == ':')
+
+    def fuse(self, chains):
+        """Add the fused modifier chains named by *chains* to :attr:`converters`."""
+        for chain in chains:
+            if chain not in self.converters:
+                self.converters[chain] = modifiers.fuse(chain[1:].split(':'),
+                    self.modifiers)
+
+    def __getstate__(self):
+        # Fused chains are closures, which can't be pickled; fuse them again
+        # when unpickling.
+        state = super(CFormatter, self).__getstate__()
+        converters = state["converters"] = dict(state["converters"])
+        state["chains"] = [k for k in converters if k.startswith(':')]
+        for chain in state["chains"]:
+            del converters[chain]
+        return state
+
+    def __setstate__(self, state):
+        chains = state.pop("chains", ())
+        self.__dict__.update(state)
+        self.fuse(chains)
 
 class CTemplate(Template):
     """A (somewhat) ctemplate-compatible templater.
@@ -50,6 +207,7 @@ class CTemplate(Template):
     :mod:`ptemplate.ctemplate`. Construction of a :class:`CTemplate` instance
     is the same as with :class:`ptemplate.template.Template`.
     """
+    formatterclass = CFormatter
     globals = {
         "BI_NEWLINE": '\n',
         "BI_SPACE": ' ',
@@ -66,29 +224,21 @@ class CTemplate(Template):
         super(CTemplate, self).__init__(*args, **kwargs)
         self.log = logger(__name__, self)
 
-    def preprocessor(self, input):
-        """Convert Google's ctemplate syntax.
+    def compile(self):
+        """Compile the template.
 
-        Since ctemplate and :mod:`ptemplate.template` are quite similar
-        internally, a simple translation can make a document (mostly) legible.
-        At the moment, the preprocessor only converts the marker indicators
-        ('{{' and '}}') and comment character ('!').
+        Modifier chains fused for an earlier compilation are discarded, so
+        changes to :attr:`CFormatter.modifiers` take effect.
         """
-        input = input.replace("{", "{{")
-        input = input.replace("{{{{", "{")
-        input = input.replace("}", "}}")
-        input = input.replace("}}}}", "}")
-
-        input = input.replace("{!", "{%")
-
-        return input
+        converters = self.formatter.converters
+        self.formatter.converters = dict((k, v) for k, v in converters.items()
+            if not k.startswith(':'))
+        return super(CTemplate, self).compile()
 
-    def render(self, data, format="html", fragment=False, template=None):
-        """Render the template.
+    def scopes(self):
+        """Return the scopes that enclose the data dictionary while rendering.
 
-        Here, :class:`CTemplate` adds the :attr:`globals` dictionary to the *data*
-        dictionary before calling :meth:`ptemplate.template.Template.render`.
+        Here, :class:`CTemplate` places the :attr:`globals` dictionary outside
+        the *data* dictionary, so keys in *data* take precedence.
         """
-        globals = self.globals.copy()
-        globals.update(data)
-        return super(CTemplate, self).render(globals)
+        return Scopes(self.globals)
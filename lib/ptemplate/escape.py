@@ -0,0 +1,407 @@
+"""\
+:mod:`ptemplate.escape` -- context-aware escaping
+-------------------------------------------------
+
+This module escapes the fields of HTML templates automatically. When a
+template is compiled, :func:`autoescape` follows the static text around each
+field with a small HTML lexer (:class:`Lexer`) to learn where the field's
+output will land -- in text, in an attribute value, in a URL attribute, in a
+string in a script or in script code -- and binds the field to the escaper
+for that context (see :data:`escapers`). Nothing is decided while rendering;
+escaped fields are ordinary fields with a conversion, which
+:class:`ptemplate.template.Template` resolves to the escaper once, when the
+template is compiled or loaded (see
+:meth:`ptemplate.formatter.Formatter.bind`).
+
+Fields that already have a conversion are left alone, so ``{field!s}`` (or
+any registered converter) can be used to bypass escaping. Fields whose
+context can't be escaped safely (inside a tag but outside an attribute value,
+in an event handler or style attribute, or in a style element) raise
+:exc:`ValueError` when the template is compiled, as do sections that don't
+end in the context they start in (since a section may be rendered any number
+of times, including none). Fields are escaped before they are formatted, so a
+precision that could cut a string short (like ``{field:.3}``, which could
+leave ``&am`` of ``&amp;``) is rejected too; numbers can still be given one
+along with a numeric type (``{price:.2f}``).
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import json
+import re
+from numbers import Number
+from urllib.parse import quote
+
+from ptemplate.formatter import Section
+
+__all__ = ["Lexer", "autoescape", "escapers"]
+
+# Translation tables from characters to their escaped forms in each context.
+TEXT = {
+    ord('&'): "&amp;",
+    ord('<'): "&lt;",
+    ord('>'): "&gt;",
+    ord('"'): "&#34;",
+    ord("'"): "&#39;",
+}
+"""The translation table for HTML text."""
+ATTRIBUTE = dict(TEXT)
+ATTRIBUTE.update({
+    ord('='): "&#61;",
+    ord('`'): "&#96;",
+    ord(' '): "&#32;",
+    ord('\t'): "&#9;",
+    ord('\n'): "&#10;",
+    ord('\f'): "&#12;",
+    ord('\r'): "&#13;",
+})
+"""The translation table for attribute values (quoted or not)."""
+SCRIPT = {
+    ord('\\'): "\\\\",
+    ord('"'): "\\u0022",
+    ord("'"): "\\u0027",
+    ord('`'): "\\u0060",
+    ord('<'): "\\u003c",
+    ord('>'): "\\u003e",
+    ord('&'): "\\u0026",
+    ord('\n'): "\\n",
+    ord('\r'): "\\r",
+    0x2028: "\\u2028",
+    0x2029: "\\u2029",
+}
+"""The translation table for strings in scripts."""
+SCRIPT_VALUE = dict((k, v) for k, v in SCRIPT.items() if chr(k) not in "\\\"")
+"""The translation table for JSON encoded values in scripts.
+
+JSON already escapes backslashes and double quotes.
+"""
+URLSAFE = "/:?#[]@!$&'()*+,;=%~"
+"""Characters left alone by the URL escaper (besides letters and digits)."""
+SCHEME = re.compile(r"\s*([^/?#:]*):")
+SCHEMES = frozenset(["http", "https", "mailto", "ftp"])
+"""URL schemes allowed at the start of URL attribute values."""
+
+def replacer(table):
+    """Return a function that replaces characters as described by *table*.
+
+    *table* is a translation table (as used by :meth:`str.translate`). The
+    function replaces one character at a time with :meth:`str.replace`, which
+    is much faster than :meth:`str.translate` for tables that map characters
+    to longer strings. Ampersands and backslashes are replaced first so the
+    replacements themselves aren't escaped again.
+    """
+    pairs = sorted(((chr(k), v) for k, v in table.items()),
+        key=lambda pair: pair[0] not in "&\\")
+    def replace(value):
+        for old, new in pairs:
+            if old in value:
+                value = value.replace(old, new)
+        return value
+    return replace
+
+replacetext = replacer(TEXT)
+replaceattribute = replacer(ATTRIBUTE)
+replacestring = replacer(SCRIPT)
+replacescript = replacer(SCRIPT_VALUE)
+
+def plain(value):
+    """Return True if *value* is a number (which never needs escaping).
+
+    Numbers are left for :meth:`ptemplate.formatter.Formatter.format_field`,
+    so format specifications like '.2f' still work on escaped fields.
+    """
+    return value.__class__ in (int, float) or isinstance(value, Number)
+
+def text(value):
+    """Escape *value* for HTML text."""
+    if value.__class__ is not str:
+        if plain(value):
+            return value
+        value = str(value)
+    return replacetext(value)
+
+def attribute(value):
+    """Escape *value* for an HTML attribute value."""
+    if value.__class__ is not str:
+        if plain(value):
+            return value
+        value = str(value)
+    return replaceattribute(value)
+
+def url(value):
+    """Escape *value* for the start of a URL attribute value (like href).
+
+    Characters that aren't allowed in URLs are percent-encoded and the
+    result is escaped for HTML. URLs with schemes other than those
+    in :data:`SCHEMES` (like "javascript:") are replaced by "#".
+    """
+    if value.__class__ is not str:
+        if plain(value):
+            return value
+        value = str(value)
+    scheme = SCHEME.match(value)
+    if scheme is not None and scheme.group(1).lower() not in SCHEMES:
+        return "#"
+    return replacetext(quote(value, safe=URLSAFE))
+
+def urlpart(value):
+    """Escape *value* for a URL attribute value after its start.
+
+    Everything but letters, digits and "_.-~" is percent-encoded, so the
+    value can't change the structure of the URL (and is safe in a query
+    string).
+    """
+    if value.__class__ is not str:
+        if plain(value):
+            return value
+        value = str(value)
+    return quote(value, safe='')
+
+def string(value):
+    """Escape *value* for a quoted string in a script."""
+    if value.__class__ is not str:
+        if plain(value):
+            return value
+        value = str(value)
+    return replacestring(value)
+
+def script(value):
+    """Encode *value* as a JavaScript value (in JSON) for script code."""
+    if value.__class__ is not bool and value.__class__ is not str and plain(value):
+        return value
+    return replacescript(json.dumps(value, default=str))
+
+escapers = {
+    "text": text,
+    "attribute": attribute,
+    "url": url,
+    "urlpart": urlpart,
+    "string": string,
+    "script": script,
+}
+"""The escapers used by :func:`autoescape`, keyed by context.
+
+:class:`ptemplate.template.Template` registers these as converters (under
+their context names) when autoescaping is enabled.
+"""
+
+class Lexer(object):
+    """A minimal HTML lexer that tracks the context of the text it reads.
+
+    :meth:`feed` consumes static template text; :attr:`context` then names
+    the context a field following that text would be in (a key of
+    :data:`escapers`), or is None if the field can't be escaped.
+    """
+    urlattributes = frozenset(["action", "background", "cite", "formaction",
+        "href", "poster", "src"])
+    """Attributes whose values are URLs."""
+    codeattributes = re.compile(r"on|style$")
+    """A pattern matching attributes whose values are code (not text)."""
+    tagpattern = re.compile(r"</?([a-zA-Z][-a-zA-Z0-9]*)")
+    attributepattern = re.compile(r"\s*([^\s\"'>/=]+)\s*=\s*(['\"]?)")
+
+    def __init__(self):
+        self.state = "text"
+        self.tagname = None
+        self.closing = False
+        self.attrname = None
+        self.quote = None
+        self.empty = False
+
+    @property
+    def context(self):
+        """The context of the text following the text read so far."""
+        if self.state in ("text", "comment"):
+            return "text"
+        elif self.state == "value":
+            if self.codeattributes.match(self.attrname):
+                return None
+            elif self.attrname in self.urlattributes:
+                return self.empty and "url" or "urlpart"
+            return "attribute"
+        elif self.state in ("script", "string"):
+            return self.state
+        return None
+
+    @property
+    def position(self):
+        """The part of the lexer's state that decides how it reads more text."""
+        if self.state in ("text", "comment", "script", "style"):
+            return (self.state,)
+        elif self.state == "string":
+            return (self.state, self.quote)
+        elif self.state == "tag":
+            return (self.state, self.tagname, self.closing)
+        return (self.state, self.tagname, self.closing, self.attrname, self.quote)
+
+    def feed(self, text):
+        """Advance the lexer over *text*."""
+        i = 0
+        while i < len(text):
+            i = getattr(self, "lex" + self.state)(text, i)
+
+    def lextext(self, text, i):
+        start = text.find('<', i)
+        if start < 0:
+            return len(text)
+        if text.startswith("<!--", start):
+            self.state = "comment"
+            return start + 4
+        match = self.tagpattern.match(text, start)
+        if match is None:
+            return start + 1
+        self.state = "tag"
+        self.tagname = match.group(1).lower()
+        self.closing = text[start + 1] == '/'
+        return match.end()
+
+    def lexcomment(self, text, i):
+        end = text.find("-->", i)
+        if end < 0:
+            return len(text)
+        self.state = "text"
+        return end + 3
+
+    def lextag(self, text, i):
+        if text[i] == '>':
+            if self.tagname in ("script", "style") and not self.closing:
+                self.state = self.tagname
+            else:
+                self.state = "text"
+            return i + 1
+        match = self.attributepattern.match(text, i)
+        if match is None:
+            return i + 1
+        self.state = "value"
+        self.attrname = match.group(1).lower()
+        self.quote = match.group(2) or None
+        self.empty = True
+        return match.end()
+
+    def lexvalue(self, text, i):
+        if self.quote is not None:
+            end = text.find(self.quote, i)
+            if end < 0:
+                end = len(text)
+        else:
+            # Unquoted values end at whitespace or the end of the tag.
+            end = i
+            while end < len(text) and not text[end].isspace() and text[end] != '>':
+                end += 1
+        if end > i:
+            self.empty = False
+        if end == len(text):
+            return end
+        self.state = "tag"
+        if self.quote is not None:
+            return end + 1
+        return end
+
+    def lexscript(self, text, i):
+        while i < len(text):
+            if text[i] in "\"'`":
+                self.state = "string"
+                self.quote = text[i]
+                return i + 1
+            elif text[i:i + 8].lower() == "</script":
+                self.state = "tag"
+                self.tagname = "script"
+                self.closing = True
+                return i + 8
+            i += 1
+        return i
+
+    def lexstyle(self, text, i):
+        end = text.lower().find("</style", i)
+        if end < 0:
+            return len(text)
+        self.state = "tag"
+        self.tagname = "style"
+        self.closing = True
+        return end + 7
+
+    def lexstring(self, text, i):
+        while i < len(text):
+            if text[i] == '\\':
+                i += 2
+            elif text[i] == self.quote:
+                self.state = "script"
+                return i + 1
+            else:
+                i += 1
+        return len(text)
+
+specpattern = re.compile(r"(?:.?[<>=^])?[-+ ]?z?#?0?\d*[,_]?(\.\d+)?([a-zA-Z%]?)$", re.S)
+"""Matches a :pep:`3101` format specification, capturing its precision and type."""
+
+def truncates(spec):
+    """Return True if the format specification *spec* can truncate a string.
+
+    Fields in a dynamic *spec* (a list of nodes) are assumed to expand to a
+    number.
+    """
+    if spec.__class__ is not str:
+        spec = ''.join(node if isinstance(node, str) else "1" for node in spec)
+    match = specpattern.match(spec)
+    return match is not None and match.group(1) is not None and \
+        match.group(2) in ('', 's')
+
+def autoescape(nodes, lexer=None):
+    """Return a copy of the compiled template *nodes* with escaped fields.
+
+    Each field without a conversion is given the conversion named by the
+    context it is found in (see :class:`Lexer`). A section's contents are
+    lexed from the context at its start and must end in the same context, so
+    the text after the section is lexed correctly however many times the
+    section is rendered. Raises :exc:`ValueError` for fields that can't be
+    escaped, fields whose precision could truncate the escaped string (see
+    :func:`truncates`) and sections that change the context.
+    """
+    if lexer is None:
+        lexer = Lexer()
+    escaped = []
+    for node in nodes:
+        if isinstance(node, str):
+            lexer.feed(node)
+        elif isinstance(node, Section):
+            position, empty = lexer.position, lexer.empty
+            node = node._replace(tokens=autoescape(node.tokens, lexer))
+            if lexer.position != position:
+                raise ValueError("section %r doesn't end in the context it "
+                    "starts in" % node.name)
+            # Fields after the section start a URL only if they do whether or
+            # not the section is rendered.
+            lexer.empty = empty and lexer.empty
+        elif not node.conversion:
+            context = lexer.context
+            if context is None:
+                if lexer.state == "value":
+                    raise ValueError("can't escape field %r in attribute %r" %
+                        (node.field, lexer.attrname))
+                elif lexer.state == "style":
+                    raise ValueError("can't escape field %r in a style element" %
+                        (node.field,))
+                raise ValueError("can't escape field %r in tag %r" %
+                    (node.field, lexer.tagname))
+            if truncates(node.spec):
+                raise ValueError("precision of field %r could truncate its "
+                    "escaped value; give it a numeric type (like '.2f')" %
+                    (node.field,))
+            node = node._replace(conversion=context)
+            lexer.empty = False
+        escaped.append(node)
+    return escaped
@@ -4,7 +4,8 @@
 
 This module extends the advanced string formatter (:pep:`3101`) available in
 Python versions greater than 2.5. In addition to regular variable substitution
-and formatting, :class:`Formatter` supports sections and in-template comments.
+and formatting, :class:`Formatter` supports sections, includes and in-template
+comments.
 """
 
 __license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
@@ -23,32 +24,44 @@ OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 """
 
+import copy
+import hashlib
+import os
+import pickle
 import string
-from collections import namedtuple
+from _string import formatter_field_name_split
+from collections import deque, namedtuple
+from functools import partial
+from itertools import chain, islice
 
-from ptemplate.util import logger
+from ptemplate import profiling
+from ptemplate.cache import describe
+from ptemplate.columnar import Columns, formatblocks, formatcolumn, numeric
+from ptemplate.util import LRU, logger
 
-__all__ = ["Formatter", "Section", "Token"]
+__all__ = ["Formatter", "Rendered", "Scopes", "Section", "Token"]
 
-Section = namedtuple("Section", "name tokens data scopes conversion format")
-"""A template section.
+Section = namedtuple("Section", "name tokens conversion format cache",
+    defaults=(None,))
+"""A compiled template section.
 
 Constructor arguments should be passed as keywords and include:
 
 *name* is the name of the section (not including the section marker).
 
-*tokens* is a list of :class:`Token` instances that belong in the section.
-
-*data* is a template data dictionary applicable to the section.
-
-*scopes* is a list of data dictionaries that should be searched successively
-when resolving variables in the section.
+*tokens* is a list of compiled nodes that belong in the section (see
+:meth:`Formatter.compile`).
 
 *conversion* is a conversion string. If not None, it will be passed with the
 output of the section to :meth:`Formatter.convert_field`.
 
 *format* is a format string. If not None, it will be passed with the output of
 the section to :meth:`Formatter.format_field`.
+
+*cache* is None unless the section's output may be kept in
+:attr:`Formatter.fragments`. Cached sections have an (identity, field) tuple:
+a digest identifying the section and the name of the field whose value keys
+the cached output (or '' to key it by the data the section uses).
 """
 Token = namedtuple("Token", "text field fieldname marker spec conversion")
 """A template token.
@@ -71,6 +84,85 @@ indicator.
 :meth:`Formatter.convert_field`.
 """
 
+Rendered = namedtuple("Rendered", "data parts")
+"""The output of a render by :meth:`Formatter.formatincremental`.
+
+*data* is a shallow copy of the data dictionary that was rendered.
+
+*parts* holds the output of each node of the compiled template. The output of
+a section is a (rows, outputs) tuple: the data dictionaries of its rows and
+the output of each row.
+"""
+
+class Scopes(object):
+    """A stack of data dictionaries.
+
+    Fields are resolved by searching the data dictionary of the innermost
+    section first and then the dictionaries of each enclosing section.
+    :class:`Scopes` keeps these dictionaries on a stack: a dictionary is
+    pushed when an iteration of a section begins and popped when it ends.
+
+    The enclosing dictionaries don't change while an inner section is
+    expanded, so names resolved in them are memoized for the rest of the
+    render. Fields that come from an outer scope (and are used in each
+    iteration of a large section) are thus found with one or two dictionary
+    lookups instead of a walk over every scope.
+    """
+
+    def __init__(self, *maps):
+        self.maps = list(maps)
+        self.memos = [None] * len(self.maps)
+
+    def __len__(self):
+        return len(self.maps)
+
+    def push(self, data):
+        """Push a new innermost data dictionary."""
+        self.maps.append(data)
+        self.memos.append(None)
+
+    def pop(self):
+        """Pop and return the innermost data dictionary."""
+        self.memos.pop()
+        return self.maps.pop()
+
+    def truncate(self, depth):
+        """Pop data dictionaries until only *depth* remain."""
+        del self.maps[depth:]
+        del self.memos[depth:]
+
+    def get(self, field, default=''):
+        """Return the value of *field* in the innermost scope defining it.
+
+        Values equal to the empty string are treated as missing. If no scope
+        defines *field*, *default* is returned.
+        """
+        depth = len(self.maps) - 1
+        if depth < 0:
+            return default
+        value = self.maps[depth].get(field, '')
+        if value.__class__ is str and not value and depth:
+            value = self.resolve(field, depth - 1)
+        if value.__class__ is str and not value:
+            return default
+        return value
+
+    def resolve(self, field, depth):
+        """Resolve *field* in the scopes up to and including *depth*."""
+        memo = self.memos[depth]
+        if memo is None:
+            memo = self.memos[depth] = {}
+        elif field in memo:
+            return memo[field]
+
+        value = ''
+        for scope in reversed(self.maps[:depth + 1]):
+            value = scope.get(field, '')
+            if value.__class__ is not str or value:
+                break
+        memo[field] = value
+        return value
+
 class Formatter(string.Formatter):
     """A string formatter.
 
@@ -85,7 +177,9 @@ class Formatter(string.Formatter):
     """A dictionary of converter functions keyed by conversion strings.
 
     If a token's conversion string matches a key in this dictionary, :meth:`convert_field`
-    will use the converter instead of the usual string conversion.
+    will use the converter instead of the usual string conversion. Each
+    :class:`Formatter` starts with its own copy of this dictionary, so
+    converters added to one instance don't affect others.
 
     .. note::
         
@@ -94,8 +188,10 @@ class Formatter(string.Formatter):
     """
     markers = {
         '#': "startsection",
+        '@': "cachedsection",
         '/': "endsection",
         '%': "comment",
+        '>': "include",
     }
     """A dictionary mapping marker indicators to marker type names.
 
@@ -105,10 +201,67 @@ class Formatter(string.Formatter):
     """
     markerlen = 1
     """The length of a marker indicator."""
+    executor = None
+    """An executor used to render large sections in parallel.
+
+    If not None, this should be a :class:`concurrent.futures.Executor`.
+    Sections with at least :attr:`chunksize` rows are split into chunks of
+    :attr:`chunksize` rows that are rendered by the executor and then joined
+    in order; smaller sections are rendered serially. With a
+    :class:`concurrent.futures.ProcessPoolExecutor`, the formatter (including
+    its converters), the rows and the values the section uses from enclosing
+    scopes must be picklable. Templates rendered by the "python" engine of
+    :class:`ptemplate.template.Template` don't use the executor.
+    """
+    chunksize = 1000
+    """The number of rows in each chunk rendered by :attr:`executor`."""
+    window = 2 * (os.cpu_count() or 1)
+    """The maximum number of chunks submitted to :attr:`executor` at once."""
+    blocksize = 1000
+    """The number of rows in each block of output built by :meth:`vectorize`."""
+    fragments = None
+    """A :class:`ptemplate.util.LRU` holding the output of cached sections.
+
+    Sections started with '@' instead of '#' (like '{@nav}...{/nav}') are
+    cached. Their output is kept here, keyed by the value of the field named
+    in the section's format specification (so '{@nav:navversion}' is keyed
+    by the value of 'navversion') or, without one, by a digest of the
+    section's rows and the enclosing values it uses (see
+    :meth:`fragmentkey`). Give the :class:`ptemplate.util.LRU` a *ttl* to
+    bound how long output may be reused. If None, cached sections are
+    rendered like any other section. A :class:`Formatter` doesn't share
+    fragments with other formatters unless they are given the same
+    :class:`ptemplate.util.LRU`.
+    """
+    includes = None
+    """A function returning the source of a template, given its name.
+
+    Include markers (like '{>header}') are replaced by the compiled contents
+    of the template they name when the including template is compiled (see
+    :meth:`include`). The included template's fields are resolved in the
+    scope where it is included. If None, include markers raise
+    :exc:`ValueError`.
+    """
+    memosize = 0
+    """The size of the :attr:`memo` each :class:`Formatter` starts with.
+
+    If 0, formatters start without a memo and converters run for every field.
+    """
 
     def __init__(self, *args, **kwargs):
         super(Formatter, self).__init__(*args, **kwargs)
         self.log = logger(__name__, self)
+        self.converters = dict(self.converters)
+        self.memo = LRU(self.memosize) if self.memosize else None
+        """A :class:`ptemplate.util.LRU` remembering converted values (or None).
+
+        If set, the output of the converters in :attr:`converters` is cached
+        by :meth:`remember`, so a converter runs once for each distinct value
+        (as long as it stays in the cache) rather than once per field. The
+        memo outlives renders; its :attr:`ptemplate.util.LRU.hits` and
+        :attr:`ptemplate.util.LRU.misses` tell how well it works. Converters
+        must return the same output whenever they're given equal values.
+        """
 
     def vformat(self, string, args, kwargs):
         """Format *string* according to data in *args* and *kwargs*.
@@ -121,11 +274,11 @@ class Formatter(string.Formatter):
     def _vformat(self, string, args, kwargs):
         """Do the real string formatting.
 
-        This method tokenizes *string* (:meth:`tokenize`) and passes the stream
-        of tokens to :meth:`formatsection`, returning the templated string.
+        This method compiles *string* (:meth:`compile`) and passes the
+        resulting tree to :meth:`formatsection`, returning the templated
+        string.
         """
-        tokens = self.tokenize(string)
-        return self.formatsection(tokens, kwargs)
+        return self.formatsection(self.compile(string), kwargs)
 
     def tokenize(self, string):
         """Tokenize a template *string*.
@@ -135,100 +288,569 @@ class Formatter(string.Formatter):
         :class:`Token` instances using the parsed data.
         """
         for text, field, spec, conversion in self.parse(string):
-            fieldname = field
-            marker = None
-            if field and len(field) >= self.markerlen:
-                indicator = field[:self.markerlen]
-                if indicator in self.markers:
-                    marker = self.markers[indicator]
-                    field = field[self.markerlen:]
-                
-            yield Token(text, field, fieldname, marker, spec, conversion)
-
-    def formatsection(self, tokens, data, scopes=[]):
-        """Format a section of a token stream according to *data*.
-
-        :meth:`formatsection` builds a formatted string from the iterable *tokens*.
-        If it encounters a section in the stream, it creates a new stream and
-        passes the section (and everything in it) to another invocation of
-        :meth:`formatsection`, adding its output to the formatted string. This
-        continues recursively until there are no more sections and the stream of
-        tokens is finished. Then, the formatted result is returned.
-
-        When a section is completed, its output will be passed to
-        :meth:`convert_field` and :meth:`format_field` if the :attr:`Section.conversion`
-        or :attr:`Section.format` attributes were defined, respectively.
-        """
-        sections = []
-        result = []
-        depth = 0
+            yield self.token(text, field, spec, conversion)
+
+    def token(self, text, field, spec, conversion):
+        """Return a :class:`Token` for a parsed field.
 
+        If *field* begins with an indicator registered in :attr:`markers`, the
+        token's :attr:`Token.marker` is set and the indicator is removed from
+        its :attr:`Token.field`.
+        """
+        fieldname = field
+        marker = None
+        if field and len(field) >= self.markerlen:
+            indicator = field[:self.markerlen]
+            if indicator in self.markers:
+                marker = self.markers[indicator]
+                field = field[self.markerlen:]
+
+        return Token(text, field, fieldname, marker, spec, conversion)
+
+    def compile(self, string, including=()):
+        """Compile a template *string* into a section tree.
+
+        :meth:`compile` folds the stream of tokens produced by :meth:`tokenize`
+        into a list of nodes. Each node is either a literal string, a
+        :class:`Token` describing a field or a :class:`Section` whose
+        :attr:`Section.tokens` hold the nodes between the section's start and
+        end markers. Comments are dropped and adjacent literal strings are
+        merged, so the tree can be passed to :meth:`formatsection` any number of
+        times without further parsing. Format specifications are compiled by
+        :meth:`compilefield`. Sections started with the "cachedsection"
+        marker get a :attr:`Section.cache` (see :meth:`identify`). Include markers are replaced by
+        the nodes of the templates they name (see :meth:`include`);
+        *including* holds the names of the templates being included.
+
+        Unbalanced section markers raise :exc:`ValueError`.
+        """
+        nodes = []
+        parents = []
+
+        for token in self.tokenize(string):
+            if token.text:
+                if nodes and isinstance(nodes[-1], str):
+                    nodes[-1] += token.text
+                else:
+                    nodes.append(token.text)
+
+            if token.marker in ("startsection", "cachedsection"):
+                parents.append((token, nodes))
+                nodes = []
+            elif token.marker == "endsection":
+                if not parents:
+                    raise ValueError(
+                        "end of section %r without start" % token.field)
+                start, parent = parents.pop()
+                if start.field != token.field:
+                    raise ValueError("end of section %r inside section %r" % 
+                        (token.field, start.field))
+                section = Section(name=start.field, tokens=nodes,
+                    conversion=start.conversion, format=start.spec)
+                if start.marker == "cachedsection":
+                    section = section._replace(format='',
+                        cache=(None, start.spec))
+                parent.append(section)
+                nodes = parent
+            elif token.marker == "include":
+                for node in self.include(token, including):
+                    if isinstance(node, str) and nodes and isinstance(nodes[-1], str):
+                        nodes[-1] += node
+                    else:
+                        nodes.append(node)
+            elif token.marker is None and token.field is not None:
+                nodes.append(self.compilefield(token))
+
+        if parents:
+            raise ValueError("unterminated section %r" % parents[-1][0].field)
+
+        self.prepare(nodes)
+        return self.identify(nodes)
+
+    def prepare(self, tokens):
+        """Prepare to format the compiled *tokens*.
+
+        This is called by :meth:`compile` and by
+        :meth:`ptemplate.template.Template.compile` for trees loaded from a
+        cache, before anything is rendered. :class:`Formatter` needs no
+        preparation; subclasses may fill in :attr:`converters` here.
+        """
+
+    def identify(self, tokens):
+        """Return *tokens* with the identities of their cached sections set.
+
+        A cached section's identity (the first item of its
+        :attr:`Section.cache`) is a digest of the section and of the
+        converters its conversions name (see
+        :func:`ptemplate.cache.describe`), so formatters sharing
+        :attr:`fragments` only share output they would render alike. Trees
+        whose fields are changed after :meth:`compile` (like by
+        :func:`ptemplate.escape.autoescape`) must be identified again.
+        """
+        nodes = []
+        for node in tokens:
+            if isinstance(node, Section):
+                node = node._replace(tokens=self.identify(node.tokens))
+                if node.cache is not None:
+                    field = node.cache[1]
+                    node = node._replace(cache=(None, field))
+                    used = sorted((conversion, self.describe(conversion))
+                        for conversion in conversions([node]))
+                    identity = hashlib.sha1(repr((node, used)).encode("utf-8"))
+                    node = node._replace(cache=(identity.hexdigest(), field))
+            nodes.append(node)
+        return nodes
+
+    def describe(self, conversion):
+        """Return a string identifying the converter named *conversion*.
+
+        Converters :func:`ptemplate.cache.describe` can't describe are
+        identified by their address, so they only match themselves.
+        """
+        converter = self.converters.get(conversion)
+        try:
+            return describe(converter)
+        except ValueError:
+            return "%r@%x" % (type(converter), id(converter))
+
+    def bind(self, tokens, conversions):
+        """Return a copy of *tokens* with *conversions* resolved to callables.
+
+        Fields (in sections and format specifications too) whose conversion
+        is one of *conversions* get the callable returned by
+        :meth:`converter` in place of the conversion's name, so
+        :meth:`iterformat` calls it directly instead of dispatching through
+        :meth:`convert_field` for every value. The result is only meant to be
+        rendered; the tree returned by :meth:`compile` is the one to cache,
+        identify or inspect.
+        """
+        nodes = []
+        for node in tokens:
+            if isinstance(node, Section):
+                node = node._replace(tokens=self.bind(node.tokens, conversions))
+            elif isinstance(node, Token):
+                if node.spec.__class__ is not str:
+                    node = node._replace(spec=self.bind(node.spec, conversions))
+                if node.conversion in conversions:
+                    node = node._replace(conversion=self.converter(node.conversion))
+            nodes.append(node)
+        return nodes
+
+    def include(self, token, including=()):
+        """Return the compiled nodes of the template included by *token*.
+
+        The template's source is returned by :attr:`includes` and compiled by
+        :meth:`compile`. *including* holds the names of the templates whose
+        includes led here; including one of them again raises
+        :exc:`ValueError` (as do includes with conversions or format
+        specifications).
+        """
+        name = token.field
+        if token.conversion or token.spec:
+            raise ValueError("include %r can't be converted or formatted" % name)
+        if name in including:
+            raise ValueError("include cycle: %s" %
+                " -> ".join(including + (name,)))
+        if self.includes is None:
+            raise ValueError("can't include %r without includes" % name)
+        return self.compile(self.includes(name), including + (name,))
+
+    def compilefield(self, token):
+        """Compile a field *token*.
+
+        Most format specifications are constant and are left as strings. A
+        specification with nested replacement fields (like '{value:{width}}')
+        is compiled into a list of nodes that :meth:`formatsection` expands
+        when the field is rendered.
+        """
+        if '{' not in token.spec:
+            return token
+        spec = self.compile(token.spec)
+        for node in spec:
+            if isinstance(node, Section):
+                raise ValueError("section %r in format specification of %r" %
+                    (node.name, token.field))
+        return token._replace(spec=spec)
+
+    def formatsection(self, tokens, data, scopes=None):
+        """Format a compiled section according to *data*.
+
+        :meth:`formatsection` joins the output of :meth:`iterformat` into a
+        single formatted string.
+        """
+        return ''.join(self.iterformat(tokens, data, scopes))
+
+    def iterformat(self, tokens, data, scopes=None):
+        """Format a compiled section according to *data*, yielding its output.
+
+        :meth:`iterformat` walks *tokens*, a list of nodes produced by
+        :meth:`compile`. Literal strings are yielded as they are and fields are
+        looked up in *data* (and then the enclosing *scopes*, a :class:`Scopes`
+        instance) and formatted. Each :class:`Section` is expanded by
+        :meth:`formatrows` (or :meth:`formatparallel`), once for each data
+        dictionary in the section's value, and its output is passed along
+        without being joined. The section's value may be any iterable (see
+        :meth:`rows`); it is consumed one data dictionary at a time and never
+        copied.
+        """
+        if scopes is None:
+            scopes = Scopes()
+        scopes.push(data)
+
+        try:
+            for token in tokens:
+                if isinstance(token, str):
+                    yield token
+                elif isinstance(token, Section):
+                    _data, _ = self.get_field(token.name, (), scopes)
+                    if token.cache is not None and self.fragments is not None:
+                        yield self.formatfragment(token, _data, scopes)
+                        continue
+                    section, _data = self.vectorize(token, self.rows(_data))
+                    if self.executor is not None:
+                        yield from self.formatparallel(section, _data, scopes)
+                    else:
+                        yield from self.formatrows(section, _data, scopes)
+                else:
+                    # Perform the usual string formatting on the field.
+                    obj, _ = self.get_field(token.field, (), scopes)
+                    conversion = token.conversion
+                    if callable(conversion):
+                        obj = conversion(obj)
+                    else:
+                        obj = self.convert_field(obj, conversion)
+                    spec = token.spec
+                    if spec.__class__ is not str:
+                        spec = self.formatsection(spec, data, scopes)
+                    yield self.format_field(obj, spec)
+        finally:
+            scopes.pop()
+
+    def formatrows(self, section, rows, scopes):
+        """Format *section* once for each data dictionary in *rows*.
+
+        The output is yielded by :meth:`iterformat`. When an iteration of the
+        section is completed, its output will be passed to
+        :meth:`convert_field` and :meth:`format_field` if the
+        :attr:`Section.conversion` or :attr:`Section.format` attributes were
+        defined, respectively. Only the output of such sections is collected
+        into strings.
+        """
+        if not (section.conversion or section.format):
+            for data in rows:
+                yield from self.iterformat(section.tokens, data, scopes)
+            return
+
+        for data in rows:
+            content = self.formatsection(section.tokens, data, scopes)
+            if section.conversion:
+                content = self.convert_field(content, section.conversion)
+            if section.format:
+                content = self.format_field(content, section.format)
+            yield content
+
+    def formatfragment(self, section, value, scopes):
+        """Return the output of the cached *section* for its *value*.
+
+        The output is looked up in :attr:`fragments` by :meth:`fragmentkey`.
+        If it isn't there, the section is rendered by :meth:`formatrows`
+        and stored.
+        """
+        rows = self.rows(value)
+        key, rows = self.fragmentkey(section, rows, scopes)
+        content = None
+        if key is not None:
+            content = self.fragments.get(key)
+        if content is None:
+            content = ''.join(self.formatrows(section, rows, scopes))
+            if key is not None:
+                self.fragments[key] = content
+        return content
+
+    def fragmentkey(self, section, rows, scopes):
+        """Return the :attr:`fragments` key for the cached *section*.
+
+        If the section names a key field, its value (which must be hashable)
+        is the key. Otherwise, the key is a digest of the pickled *rows* and
+        the values of the names the section uses (see :meth:`names`) in
+        *scopes*, since its output depends on both. Returns the key (or None
+        if the data can't be pickled) and the rows, which are copied into a
+        list if they were an iterator.
+        """
+        identity, field = section.cache
+        if field:
+            value = scopes.get(field)
+            if value != '':
+                return (identity, value), rows
+
+        if isinstance(rows, Columns):
+            data = rows.columns
+        else:
+            if not isinstance(rows, (list, tuple)):
+                rows = list(rows)
+            data = rows
+        outer = [scopes.get(name) for name in sorted(self.names(section.tokens))]
+        try:
+            data = pickle.dumps((data, outer), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return None, rows
+        return (identity, hashlib.sha1(data).hexdigest()), rows
+
+    def formatincremental(self, tokens, data, previous=None, changes=None,
+            scopes=None):
+        """Format *tokens* according to *data*, reusing a previous render.
+
+        *previous* is the :class:`Rendered` returned by an earlier call for
+        the same *tokens* (or None). The nodes of *tokens* whose names (see
+        :meth:`names`) have the same values in *data* as in the previous
+        data are not formatted again; their previous output is reused. The
+        rows of sections are compared one by one, so only the rows that
+        changed are formatted (unless a name the section uses from *data*
+        changed, in which case all of them are).
+
+        Values are compared by identity and equality, so data that was
+        changed in place must be described by *changes* instead: an iterable
+        of the names in *data* that changed and (name, index) tuples naming
+        the changed rows of sections. Everything not mentioned in *changes*
+        is taken to be unchanged.
+
+        Returns the output and the :class:`Rendered` to pass as *previous*
+        next time. Rows are formatted by :meth:`formatrows`, without
+        :attr:`executor`, :meth:`vectorize` or :attr:`fragments`.
+        """
+        if scopes is None:
+            scopes = Scopes()
+        if previous is None:
+            changed, rows = None, None
+        elif changes is not None:
+            changes = list(changes)
+            changed = set(c for c in changes if c.__class__ is not tuple)
+            rows = set(c for c in changes if c.__class__ is tuple)
+        else:
+            olddata = previous.data
+            changed = set(name for name in set(olddata) | set(data)
+                if not same(olddata.get(name, ''), data.get(name, '')))
+            rows = None
+
+        parts = []
+        scopes.push(data)
+        try:
+            for i, token in enumerate(tokens):
+                if token.__class__ is str:
+                    parts.append(token)
+                    continue
+                old = previous.parts[i] if previous is not None else None
+                if isinstance(token, Section):
+                    part = self.formatrowsincremental(token, old, changed, rows,
+                        scopes)
+                elif old is not None and not (self.names([token]) & changed):
+                    part = old
+                else:
+                    # The field is looked up through an empty innermost scope.
+                    part = ''.join(self.iterformat([token], {}, scopes))
+                parts.append(part)
+        finally:
+            scopes.pop()
+
+        output = ''.join(part if part.__class__ is str else ''.join(part[1])
+            for part in parts)
+        return output, Rendered(dict(data), parts)
+
+    def formatrowsincremental(self, section, old, changed, rows, scopes):
+        """Format the rows of *section*, reusing rows that haven't changed.
+
+        *old* is the section's previous (rows, outputs) tuple (or None).
+        *changed* is the set of names that changed in the data and *rows*
+        the set of changed (name, index) rows, if they were given (see
+        :meth:`formatincremental`). Returns the new (rows, outputs) tuple.
+        """
+        name = formatter_field_name_split(section.name)[0]
+        if old is not None and rows is None and name not in changed and \
+                not (self.names(section.tokens) & changed):
+            return old
+
+        value, _ = self.get_field(section.name, (), scopes)
+        # Copy the rows so changes to the list itself are noticed next time.
+        data = list(self.rows(value))
+        if old is None or (self.names(section.tokens) & changed) or \
+                (rows is not None and name in changed):
+            oldrows, oldoutputs = (), ()
+        else:
+            oldrows, oldoutputs = old
+
+        outputs = []
+        for i, row in enumerate(data):
+            if i < len(oldrows) and (same(row, oldrows[i]) if rows is None
+                    else (section.name, i) not in rows):
+                outputs.append(oldoutputs[i])
+            else:
+                outputs.append(''.join(self.formatrows(section, [row], scopes)))
+        return data, outputs
+
+    def formatparallel(self, section, rows, scopes):
+        """Format *section* for *rows* in chunks rendered by :attr:`executor`.
+
+        Chunks are submitted in order and their output yielded in the same
+        order. Each chunk is rendered with a single scope holding the values
+        of the names the section uses (see :meth:`names`), so the rest of the
+        enclosing data isn't sent to the executor. Columnar rows are split by
+        slicing their columns.
+        """
+        if isinstance(rows, Columns):
+            if len(rows) < self.chunksize:
+                yield from self.formatrows(section, rows, scopes)
+                return
+            chunks = rows.chunks(self.chunksize)
+        else:
+            rows = iter(rows)
+            chunk = list(islice(rows, self.chunksize))
+            if len(chunk) < self.chunksize:
+                yield from self.formatrows(section, chunk, scopes)
+                return
+            chunks = chain([chunk],
+                iter(lambda: list(islice(rows, self.chunksize)), []))
+
+        outer = dict((name, scopes.get(name)) for name in self.names(section.tokens))
+        # Chunks are rendered serially: a worker waiting on chunks of a nested
+        # section could otherwise tie up every thread of the executor.
+        serial = copy.copy(self)
+        serial.executor = None
+        pending = deque()
+        for chunk in chunks:
+            pending.append(self.executor.submit(formatchunk, serial, section, chunk, outer))
+            if len(pending) >= self.window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def rows(self, value):
+        """Return the data dictionaries for a section whose value is *value*.
+
+        A dictionary is taken to be a mapping of column names to sequences of
+        equal length and is wrapped in a
+        :class:`ptemplate.columnar.Columns` instance, which yields one data
+        dictionary per row; :exc:`ValueError` is raised if any of its values
+        isn't a sequence (a string or a number, say). Other values are
+        returned unchanged.
+        """
+        if isinstance(value, dict):
+            return Columns(value)
+        return value
+
+    def vectorize(self, section, rows):
+        """Format the numeric columns *section* uses from *rows* in batches.
+
+        If *rows* is a :class:`ptemplate.columnar.Columns` instance, each
+        field directly in *section* that names a numeric NumPy column and has
+        a constant format specification (but no conversion) is formatted for
+        the whole column at once by :func:`ptemplate.columnar.formatcolumn`.
+        The formatted strings are added to the rows as a new column and the
+        field is replaced by one that simply inserts them. If every field in
+        the section can be formatted this way, the section's output is built
+        :attr:`blocksize` rows at a time by
+        :func:`ptemplate.columnar.formatblocks` instead, without visiting
+        each row.
+
+        Returns the (possibly rewritten) section and rows. Formatters that
+        override :meth:`format_field` are left alone, as are templates
+        rendered by the "python" engine of
+        :class:`ptemplate.template.Template`.
+        """
+        if rows.__class__ is not Columns or \
+                type(self).format_field is not string.Formatter.format_field:
+            return section, rows
+
+        columns = rows.columns
+        keys = {}
+        tokens = []
+        pieces = []
+        for token in section.tokens:
+            if token.__class__ is Token and not token.conversion and \
+                    token.spec and token.spec.__class__ is str and \
+                    numeric(columns.get(token.field)):
+                piece = (token.field, token.spec)
+                key = keys.get(piece)
+                if key is None:
+                    # Field names can't contain ':', so the key can't shadow
+                    # a name used in the template.
+                    key = keys[piece] = "%s:%d" % (token.field, len(keys))
+                token = token._replace(field=key, spec='')
+            else:
+                piece = token
+            tokens.append(token)
+            pieces.append(piece)
+        if not keys:
+            return section, rows
+
+        if not (section.conversion or section.format) and \
+                all(piece.__class__ in (str, tuple) for piece in pieces):
+            blocks = formatblocks(rows, pieces, self.blocksize)
+            token = Token('', ':', ':', None, '', None)
+            return section._replace(tokens=[token]), \
+                ({':': block} for block in blocks)
+
+        columns = dict(columns)
+        for (field, spec), key in keys.items():
+            columns[key] = formatcolumn(columns[field], spec)
+        return section._replace(tokens=tokens), Columns(columns)
+
+    def names(self, tokens):
+        """Return the set of names used by the fields and sections in *tokens*.
+
+        Only the first part of each field name is included (so "a" for
+        "{a.b[0]}"). Nested sections and format specifications are searched,
+        too.
+        """
+        names = set()
+        for token in tokens:
+            if isinstance(token, Section):
+                names.add(formatter_field_name_split(token.name)[0])
+                names.update(self.names(token.tokens))
+            elif isinstance(token, Token):
+                names.add(formatter_field_name_split(token.field)[0])
+                if token.spec.__class__ is not str:
+                    names.update(self.names(token.spec))
+        return names
+
+    def fields(self, tokens):
+        """Return the tree of fields and sections used by *tokens*.
+
+        The tree is a dictionary mapping each name used at this level to None
+        (for a plain field) or to the tree of the names used inside it: the
+        fields of each row of a section, or the attributes of a field like
+        "{user.name}" (attributes after an index, as in "{a[0].b}", are left
+        out). A value also used as a whole (like "{user}" next to
+        "{user.name}") maps to None, since all of it is needed. Unlike
+        :meth:`names`, the tree follows the structure of the data, so it
+        tells which values (and which of their columns and relations) a
+        render needs. Names used in a section may also come from an
+        enclosing scope, so they are listed under the section and again at
+        each enclosing level; the tree is a superset of what a render reads.
+        """
+        tree = {}
         for token in tokens:
-            section = sections and sections[-1] or Section(None, [], {}, [], None, None)
-            text = token.text
-
-            # Short circuit parsing if...
-            if depth == 0 and section.name == token.field and token.marker == "endsection":
-                # ...we're closing the topmost section (depth=0); render the
-                # subsection and continue.
-                section.tokens.append(Token(text, None, None, None, None, None))
-                _data, _ = self.get_field(token.field, (), [data] + scopes)
-                for d in _data:
-                    content = self.formatsection(section.tokens, d, [data] + scopes)
-                    if section.conversion:
-                        content = self.convert_field(content, section.conversion)
-                    if section.format:
-                        content = self.format_field(content, section.format)
-                    result.append(content)
-                sections.pop()
-                continue
-            elif section.name is not None:
-                # ...we're in a section; add our token to the section's list and
-                # continue.
-                section.tokens.append(token)
-
-                # Track depth (but not the subsections themselves).
-                if token.marker == "startsection": depth += 1
-                elif token.marker == "endsection": depth -= 1
-                continue
-
-            # Always add the token's text to the result. Since the parser produces
-            # tokens with preceding text, this has to happen early.
-            if text:    
-                result.append(text)
-
-            if token.marker == "startsection":
-                section = Section(name=token.field, tokens=[], data=data,
-                    scopes=scopes, conversion=token.conversion, format=token.spec)
-                sections.append(section)
-            elif token.marker == "endsection": # pragma: nocover
-                # Already handled.
-                pass
-            elif token.field is not None:
-                # Perform the usual string formatting on the field.
-                obj, _ = self.get_field(token.field, (), [data] + scopes)
-                obj = self.convert_field(obj, token.conversion)
-                spec, arg_index = super(Formatter, self)._vformat(token.spec, (), data, (), 2)
-                result.append(self.format_field(obj, spec))
-
-        return ''.join(result)
+            if isinstance(token, Section):
+                subtree = self.fields(token.tokens)
+                if token.cache and token.cache[1]:
+                    merge(tree, fieldtree(token.cache[1]))
+                merge(tree, fieldtree(token.name, subtree))
+                merge(tree, copy.deepcopy(subtree))
+            elif isinstance(token, Token):
+                merge(tree, fieldtree(token.field))
+                if token.spec.__class__ is not str:
+                    merge(tree, self.fields(token.spec))
+        return tree
 
     def get_value(self, field, args, scopes):
         """Look up the value of *field* in *scopes*.
 
-        *scopes* is a list of data dictionaries associated with each successive
-        parent of the current section. :meth:`get_value` searches for a key
-        matching *field* in each of these dictionaries, in order. If no match is
-        found, an empty string is returned. Otherwise, the key's value (a list
-        of data dictionaries or a string) is returned.
+        *scopes* is a :class:`Scopes` instance holding the data dictionaries
+        associated with the current section and each successive parent (or a
+        single data dictionary). If no match is found, an empty string is
+        returned. Otherwise, the key's value (a list of data dictionaries or a
+        string) is returned.
         """
-        _scopes = list(scopes)
-        value = ''
-        while _scopes and value == '':
-            scope = _scopes.pop(0)
-            value = scope.get(field, '')
-
-        return value
+        return scopes.get(field, '')
 
     def convert_field(self, value, conversion):
         """Convert a field *value* according to a *conversion* specification.
@@ -240,7 +862,116 @@ class Formatter(string.Formatter):
         """
         converter = self.converters.get(conversion, None)
         if callable(converter):
-            value = converter(value)
+            if self.memo is not None:
+                value = self.remember(converter, value)
+            else:
+                value = converter(value)
         else:
             value = super(Formatter, self).convert_field(value, conversion)
         return value
+
+    def remember(self, converter, value):
+        """Return the output of *converter* for *value*, using :attr:`memo`.
+
+        Values are cached by type and value; unhashable values are simply
+        converted.
+        """
+        try:
+            key = (converter, value.__class__, value)
+            return self.memo[key]
+        except KeyError:
+            pass
+        except TypeError:
+            return converter(value)
+        value = self.memo[key] = converter(value)
+        return value
+
+    def converter(self, conversion):
+        """Return a callable that applies *conversion* to a value.
+
+        Converters registered in :attr:`converters` are returned directly;
+        other conversions are delegated to :meth:`convert_field`. Callers that
+        convert many values with the same *conversion* can use this to resolve
+        it once. If :attr:`memo` is set, registered converters are wrapped by
+        :meth:`remember`.
+        """
+        converter = self.converters.get(conversion, None)
+        if callable(converter):
+            if self.memo is not None:
+                return partial(self.remember, converter)
+            return converter
+        return lambda value: self.convert_field(value, conversion)
+
+    def profiled(self, profile):
+        """Return a copy of this formatter that records its work in *profile*.
+
+        The copy counts the time and rows of each section, field lookups (and
+        how many scopes each walked), and the time of each converter in
+        *profile*, a :class:`ptemplate.profiling.Profile`; see
+        :func:`ptemplate.profiling.profiled`. This formatter is left as it
+        is, so formatting without a profile costs nothing extra.
+        """
+        return profiling.profiled(self, profile)
+
+    def __getstate__(self):
+        # Executors can't be pickled (and workers render chunks serially).
+        state = self.__dict__.copy()
+        state.pop("executor", None)
+        return state
+
+def same(old, new):
+    """Return True if *old* and *new* are the same or equal values."""
+    if old is new:
+        return True
+    try:
+        return old.__class__ is new.__class__ and bool(old == new)
+    except Exception:
+        return False
+
+def formatchunk(formatter, section, rows, outer):
+    """Format *section* for *rows* with *formatter*.
+
+    This is the task :meth:`Formatter.formatparallel` submits to the
+    executor.
+    """
+    return ''.join(formatter.formatrows(section, rows, Scopes(outer)))
+
+def conversions(tokens):
+    """Return the set of conversions used by the fields and sections in *tokens*."""
+    used = set()
+    for token in tokens:
+        if isinstance(token, Section):
+            used.update(conversions(token.tokens))
+        elif not isinstance(token, Token):
+            continue
+        elif token.spec.__class__ is not str:
+            used.update(conversions(token.spec))
+        if token.conversion:
+            used.add(token.conversion)
+    return used
+
+def fieldtree(field, subtree=None):
+    """Return the :meth:`Formatter.fields` tree of *field* (holding *subtree*)."""
+    first, rest = formatter_field_name_split(field)
+    attributes = []
+    for isattr, key in rest:
+        if not isattr:
+            subtree = None
+            break
+        attributes.append(key)
+    for key in reversed(attributes):
+        subtree = {key: subtree}
+    return {first: subtree}
+
+def merge(tree, other):
+    """Merge the :meth:`Formatter.fields` tree *other* into *tree*.
+
+    A value used in full (None) stays so, whatever else uses parts of it.
+    """
+    for name, subtree in other.items():
+        if name not in tree:
+            tree[name] = subtree
+        elif subtree is None:
+            tree[name] = None
+        elif tree[name] is not None:
+            merge(tree[name], subtree)
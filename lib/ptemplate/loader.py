@@ -0,0 +1,242 @@
+"""\
+:mod:`ptemplate.loader` -- loading templates by name
+----------------------------------------------------
+
+A :class:`Loader` finds template files by name in a list of directories (or,
+for Buffet-style dotted names like "mypackage.templates.index", in Python
+packages), compiles them and keeps the compiled templates in memory. The
+cache is bounded by the number of templates and, optionally, by the total
+size of their sources. A template requested by several threads at once is
+read and compiled only once; the other threads wait for the result. If
+asked to, the loader watches the modification times of template files and
+recompiles templates that have changed (or include templates that have
+changed).
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+from importlib.util import find_spec
+from operator import attrgetter
+
+from ptemplate.util import LRU, logger
+
+__all__ = ["Loader"]
+
+class Entry(object):
+    """A compiled template and what is known about its files."""
+    __slots__ = ("template", "files", "size", "checked")
+
+    def __init__(self, template, files, size, checked):
+        self.template = template
+        self.files = files
+        """The template's files (and those it includes) and their stamps."""
+        self.size = size
+        self.checked = checked
+        """When :attr:`files` were last compared with the files."""
+
+def stamp(stat):
+    """Return a value that changes when the file described by *stat* changes."""
+    return stat.st_mtime_ns, stat.st_size
+
+class Loader(object):
+    """Load templates by name.
+
+    *path* is a list of directories searched for templates (see
+    :meth:`find`). *factory* is called with a *template* keyword argument
+    holding a template's source and should return a
+    :class:`ptemplate.template.Template` (or something like it); it defaults
+    to :class:`ptemplate.template.Template` itself. At most *maxsize* compiled
+    templates are kept; if *maxbytes* is not None, templates are also
+    discarded (least recently used first) while the sizes of their files add
+    up to more than *maxbytes*.
+
+    If *interval* is None, template files are read once and never checked
+    again. Otherwise, a template's file is checked (at most once every
+    *interval* seconds) when the template is loaded; if the file has changed,
+    the template is read and compiled again.
+    """
+    extensions = (".html", ".txt")
+    """The file name extensions tried when resolving dotted names."""
+    encoding = "utf-8"
+    """The encoding of template files."""
+    clock = staticmethod(time.monotonic)
+    """The function returning the current time (in seconds) for *interval*."""
+
+    def __init__(self, path=(), factory=None, maxsize=128, maxbytes=None,
+            interval=None):
+        self.log = logger(__name__, self)
+        if factory is None:
+            from ptemplate.template import Template as factory
+        self.path = list(path)
+        self.factory = factory
+        self.interval = interval
+        self.cache = LRU(maxsize, maxweight=maxbytes, weigh=attrgetter("size"))
+        """The compiled templates, keyed by name."""
+        self.lock = threading.Lock()
+        self.flights = {}
+        """Futures for the templates being compiled, keyed by name."""
+
+    def candidates(self, name):
+        """Yield the relative file names that *name* may refer to.
+
+        *name* itself comes first. Dotted names are then tried as paths, with
+        each of :attr:`extensions`; "pages.index" may refer to
+        "pages/index.html".
+        """
+        yield name
+        base = name.replace('.', os.sep)
+        for extension in self.extensions:
+            yield base + extension
+
+    def find(self, name):
+        """Return the path of the file holding the template *name*.
+
+        The directories in :attr:`path` are searched first. If *name* isn't
+        found there and is a dotted name, its last component is looked for
+        (with each of :attr:`extensions`) in the package named by the rest,
+        so "mypackage.templates.index" may refer to "index.html" in the
+        "mypackage.templates" package. Raises :exc:`IOError` if no file is
+        found. Names referring to files outside the search path are never
+        found.
+        """
+        for candidate in self.candidates(name):
+            if os.path.isabs(candidate) or \
+                    os.path.normpath(candidate).split(os.sep)[0] == os.pardir:
+                continue
+            for directory in self.path:
+                path = os.path.join(directory, candidate)
+                if os.path.isfile(path):
+                    return path
+
+        package, _, base = name.rpartition('.')
+        for directory in self.packagepath(package):
+            for extension in self.extensions:
+                path = os.path.join(directory, base + extension)
+                if os.path.isfile(path):
+                    return path
+
+        raise IOError("template %r not found in %s" % (name, self.path))
+
+    def packagepath(self, package):
+        """Return the directories of the Python package *package*."""
+        if not package:
+            return []
+        try:
+            spec = find_spec(package)
+        except (ImportError, ValueError):
+            return []
+        return list(getattr(spec, "submodule_search_locations", None) or [])
+
+    def source(self, name):
+        """Return the source of the template *name*."""
+        with open(self.find(name), encoding=self.encoding) as f:
+            return f.read()
+
+    def create(self, source):
+        """Return a new (uncompiled) template for the string *source*.
+
+        The template is made by :attr:`factory`. Templates without a loader
+        of their own are given this one, so they find their includes with it.
+        """
+        template = self.factory(template=source)
+        if getattr(template, "loader", False) is None:
+            template.loader = self
+        return template
+
+    def read(self, name):
+        """Read and compile the template *name*, returning an :class:`Entry`.
+
+        The files of the templates it includes (listed in the compiled
+        template's *included* attribute, if any) are watched along with its
+        own.
+        """
+        path = self.find(name)
+        stats = {path: os.stat(path)}
+        with open(path, encoding=self.encoding) as f:
+            source = f.read()
+        template = self.create(source)
+        template.compile()
+        for included in getattr(template, "included", ()):
+            included = self.find(included)
+            stats[included] = os.stat(included)
+        files = dict((path, stamp(stat)) for path, stat in stats.items())
+        size = sum(stat.st_size for stat in stats.values())
+        return Entry(template, files, size, self.clock())
+
+    def fresh(self, entry):
+        """Return True if *entry*'s files haven't changed (see *interval*)."""
+        if self.interval is None:
+            return True
+        now = self.clock()
+        if now - entry.checked < self.interval:
+            return True
+        for path, current in entry.files.items():
+            try:
+                if stamp(os.stat(path)) != current:
+                    return False
+            except OSError:
+                return False
+        entry.checked = now
+        return True
+
+    def load(self, name):
+        """Return the compiled template *name*.
+
+        The template is read and compiled (see :meth:`read`) unless it is
+        cached and up to date (see :meth:`fresh`). Threads loading the same
+        template at the same time share one compilation.
+        """
+        entry = self.cache.get(name)
+        if entry is not None and self.fresh(entry):
+            return entry.template
+
+        with self.lock:
+            flight = self.flights.get(name)
+            if flight is not None:
+                leader = False
+            else:
+                # Another thread may have finished compiling the template
+                # since it was looked up.
+                current = self.cache.get(name)
+                if current is not None and current is not entry:
+                    return current.template
+                leader = True
+                flight = self.flights[name] = Future()
+
+        if not leader:
+            return flight.result()
+
+        try:
+            entry = self.read(name)
+            self.cache[name] = entry
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(entry.template)
+            return entry.template
+        finally:
+            with self.lock:
+                del self.flights[name]
+
+    def clear(self):
+        """Discard all compiled templates."""
+        self.cache.clear()
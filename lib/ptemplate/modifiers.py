@@ -0,0 +1,226 @@
+"""\
+:mod:`ptemplate.modifiers` -- ctemplate variable modifiers
+----------------------------------------------------------
+
+This module implements the variable modifiers of Google's ctemplate
+(``{{VAR:h}}``, ``{{VAR:j}}``, ``{{VAR:u}}`` and so on) for
+:class:`ptemplate.ctemplate.CTemplate`. Most modifiers replace each character
+of their input independently; they are described by translation tables
+(:class:`Table`) rather than functions. :func:`fuse` compiles a chain of
+modifiers like ``h:j`` into a single callable, composing runs of tables into
+one table so the chain escapes its input in one pass instead of one pass per
+modifier.
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import re
+from urllib.parse import quote_plus
+
+__all__ = ["Table", "aliases", "fuse", "modifiers"]
+
+class Table(dict):
+    """A modifier that replaces characters independently of each other.
+
+    A :class:`Table` is a translation table (as used by :meth:`str.translate`)
+    mapping character ordinals to replacement strings. Calling it applies it
+    to a value.
+    """
+
+    def __call__(self, value):
+        return value.translate(self)
+
+    def then(self, other):
+        """Return a :class:`Table` applying this table and then *other*."""
+        table = Table((k, other(v)) for k, v in self.items())
+        for k, v in other.items():
+            table.setdefault(k, v)
+        return table
+
+HTML = Table({
+    ord('&'): "&amp;",
+    ord('"'): "&quot;",
+    ord("'"): "&#39;",
+    ord('<'): "&lt;",
+    ord('>'): "&gt;",
+})
+"""pre_escape: HTML escaping that preserves whitespace."""
+html = Table(HTML)
+html.update(dict((ord(c), ' ') for c in "\r\n\v\f\t"))
+"""html_escape: HTML escaping; whitespace becomes spaces."""
+xml = Table(HTML)
+"""xml_escape: XML escaping."""
+javascript = Table({
+    ord('"'): "\\x22",
+    ord("'"): "\\x27",
+    ord('\\'): "\\\\",
+    ord('\t'): "\\t",
+    ord('\r'): "\\r",
+    ord('\n'): "\\n",
+    ord('\b'): "\\b",
+    ord('&'): "\\x26",
+    ord('<'): "\\x3c",
+    ord('>'): "\\x3e",
+    ord('='): "\\x3d",
+    0x2028: "\\u2028",
+    0x2029: "\\u2029",
+})
+"""javascript_escape: escaping for JavaScript string literals."""
+json = Table({
+    ord('"'): "\\\"",
+    ord('\\'): "\\\\",
+    ord('/'): "\\/",
+    ord('\b'): "\\b",
+    ord('\f'): "\\f",
+    ord('\n'): "\\n",
+    ord('\r'): "\\r",
+    ord('\t'): "\\t",
+    ord('<'): "\\u003C",
+    ord('>'): "\\u003E",
+    ord('&'): "\\u0026",
+})
+"""json_escape: escaping for JSON string literals."""
+attribute = Table(html)
+attribute[ord('=')] = "&#61;"
+"""html_escape_with_arg=attribute: escaping for unquoted attribute values."""
+
+def none(value):
+    """none: return *value* unchanged."""
+    return value
+
+def query(value):
+    """url_query_escape: escape *value* for a URL query string."""
+    return quote_plus(value, safe=".,-_*/!'()")
+
+cssunsafe = re.compile(r"[^-a-zA-Z0-9 _.,!#%]")
+
+def css(value):
+    """cleanse_css: remove everything but letters, digits and ' _.,!#%-'."""
+    return cssunsafe.sub('', value)
+
+scheme = re.compile(r"\s*([^/?#:]*):")
+
+def validurl(value):
+    """Return *value* if it is a relative, http or https URL, '#' otherwise."""
+    match = scheme.match(value)
+    if match is not None and match.group(1).lower() not in ("http", "https"):
+        return '#'
+    return value
+
+def urlhtml(value):
+    """url_escape_with_arg=html: validate a URL and escape it for HTML."""
+    return html(validurl(value))
+
+def urljavascript(value):
+    """url_escape_with_arg=javascript: validate a URL and escape it for JavaScript."""
+    return javascript(validurl(value))
+
+snippettags = re.compile(r"(<(?:br|wbr|/?b|/?i)>|&(?:#\d+|#x[0-9a-fA-F]+|[a-zA-Z]+);)")
+
+def snippet(value):
+    """html_escape_with_arg=snippet: escape HTML except for simple tags and entities."""
+    parts = snippettags.split(value)
+    parts[::2] = [html(part) for part in parts[::2]]
+    return ''.join(parts)
+
+number = re.compile(r"\s*(true|false|-?(0[xX][0-9a-fA-F]+|\d*\.?\d+([eE][-+]?\d+)?))\s*$")
+
+def jsnumber(value):
+    """javascript_escape_with_arg=number: pass numbers and booleans, else 'null'."""
+    if number.match(value) is None:
+        return "null"
+    return value
+
+modifiers = {
+    "none": none,
+    "html_escape": html,
+    "pre_escape": HTML,
+    "xml_escape": xml,
+    "javascript_escape": javascript,
+    "json_escape": json,
+    "url_query_escape": query,
+    "cleanse_css": css,
+    "html_escape_with_arg=snippet": snippet,
+    "html_escape_with_arg=pre": HTML,
+    "html_escape_with_arg=attribute": attribute,
+    "html_escape_with_arg=url": urlhtml,
+    "url_escape_with_arg=html": urlhtml,
+    "url_escape_with_arg=javascript": urljavascript,
+    "url_escape_with_arg=query": query,
+    "javascript_escape_with_arg=number": jsnumber,
+}
+"""The modifiers understood by :func:`fuse`, keyed by name.
+
+Each modifier is a :class:`Table` or a function taking and returning a
+string. Custom modifiers (by convention, with names starting with 'x-') can be
+registered in :attr:`ptemplate.ctemplate.CFormatter.modifiers`.
+"""
+aliases = {
+    "h": "html_escape",
+    "p": "pre_escape",
+    "j": "javascript_escape",
+    "o": "json_escape",
+    "u": "url_query_escape",
+    "c": "cleanse_css",
+    "H": "html_escape_with_arg",
+    "U": "url_escape_with_arg",
+    "J": "javascript_escape_with_arg",
+}
+"""Short modifier names and the names they stand for."""
+
+def canonical(name):
+    """Return the full name of the modifier *name* (like 'h' or 'H=pre')."""
+    base, sep, arg = name.partition('=')
+    return aliases.get(base, base) + sep + arg
+
+def fuse(chain, modifiers=modifiers):
+    """Return a function that applies the modifiers in *chain* in order.
+
+    *chain* is a list of modifier names looked up in *modifiers*. Adjacent
+    :class:`Table` modifiers are composed into one table, which is applied
+    only if its input contains a character it replaces. Raises
+    :exc:`KeyError` for unknown modifiers.
+    """
+    steps = []
+    for name in chain:
+        modifier = modifiers[canonical(name)]
+        if isinstance(modifier, Table) and steps and isinstance(steps[-1], Table):
+            steps[-1] = steps[-1].then(modifier)
+        else:
+            steps.append(modifier)
+
+    steps = [translator(step) if isinstance(step, Table) else step for step in steps]
+    if len(steps) == 1:
+        step = steps[0]
+        return lambda value: step(value if value.__class__ is str else str(value))
+
+    def apply(value):
+        if value.__class__ is not str:
+            value = str(value)
+        for step in steps:
+            value = step(value)
+        return value
+    return apply
+
+def translator(table):
+    """Return a function that applies *table*, skipping values it won't change."""
+    search = re.compile("[%s]" % re.escape(''.join(map(chr, table)))).search
+    def translate(value):
+        if search(value) is None:
+            return value
+        return value.translate(table)
+    return translate
@@ -0,0 +1,193 @@
+"""\
+:mod:`ptemplate.profiling` -- render profiling
+----------------------------------------------
+
+This module tells where the time of a render goes. A :class:`Profile`
+collects, over any number of renders, the time spent in each section (by
+name), the number of times each section was expanded and the rows it went
+through, the number of lookups of each field and how far out in the scopes
+the field was found, the time spent in each converter (by conversion key) and
+the size of the output.
+
+Profiles are filled by formatters returned by
+:meth:`ptemplate.formatter.Formatter.profiled`: copies of a formatter whose
+class is extended with :class:`Profiling`. The formatter itself is never
+changed, so templates that aren't being profiled pay nothing. Set
+:attr:`ptemplate.template.Template.profile` to profile a template's renders.
+Profiled renders are interpreted and serial, whatever the template's engine
+and the formatter's executor.
+"""
+
+__license__ = """Copyright (c) 2010 Will Maier <will@m.aier.us>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted, provided that the above
+copyright notice and this permission notice appear in all copies.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+
+import copy
+import time
+from collections import defaultdict
+
+__all__ = ["Profile", "Profiling", "profiled"]
+
+class Stat(object):
+    """Counters for one section, field or converter in a :class:`Profile`."""
+    __slots__ = ("calls", "time", "items", "size")
+
+    def __init__(self):
+        self.calls = 0
+        """The number of expansions, lookups or conversions."""
+        self.time = 0.0
+        """The seconds spent (including nested sections)."""
+        self.items = 0
+        """The number of rows (of sections) or scopes walked (by lookups)."""
+        self.size = 0
+        """The number of characters of output (of sections)."""
+
+    def __repr__(self):
+        return "Stat(calls=%d, time=%f, items=%d, size=%d)" % (self.calls,
+            self.time, self.items, self.size)
+
+class Profile(object):
+    """Statistics about profiled renders.
+
+    :attr:`sections`, :attr:`fields` and :attr:`converters` map section
+    names, field names and conversion keys to :class:`Stat` instances.
+    Counters aren't locked, so renders profiled concurrently may lose a few
+    counts.
+    """
+    clock = staticmethod(time.perf_counter)
+    """The function returning the current time (in seconds)."""
+
+    def __init__(self):
+        self.renders = 0
+        """The number of profiled renders."""
+        self.time = 0.0
+        """The seconds spent in profiled renders."""
+        self.size = 0
+        """The number of characters the profiled renders produced."""
+        self.sections = defaultdict(Stat)
+        self.fields = defaultdict(Stat)
+        self.converters = defaultdict(Stat)
+
+    def record(self, started, size):
+        """Count a render that started at *started* and produced *size* characters."""
+        self.time += self.clock() - started
+        self.renders += 1
+        self.size += size
+
+    def clear(self):
+        """Reset all counters."""
+        self.__init__()
+
+    def report(self, limit=10):
+        """Return a table of the *limit* most expensive entries of each kind."""
+        lines = ["%d renders in %.3f ms, %d characters" % (self.renders,
+            self.time * 1000, self.size)]
+
+        lines.append("")
+        lines.append("%-24s %8s %10s %10s %12s" % ("section", "calls", "rows",
+            "ms", "characters"))
+        for name, stat in self.top(self.sections, limit, "time"):
+            lines.append("%-24s %8d %10d %10.3f %12d" % (name, stat.calls,
+                stat.items, stat.time * 1000, stat.size))
+
+        lines.append("")
+        lines.append("%-24s %8s %10s" % ("field", "lookups", "depth"))
+        for name, stat in self.top(self.fields, limit, "calls"):
+            lines.append("%-24s %8d %10.2f" % (name, stat.calls,
+                float(stat.items) / stat.calls))
+
+        lines.append("")
+        lines.append("%-24s %8s %10s" % ("converter", "calls", "ms"))
+        for name, stat in self.top(self.converters, limit, "time"):
+            lines.append("%-24s %8d %10.3f" % (name, stat.calls, stat.time * 1000))
+        return "\n".join(lines)
+
+    def top(self, stats, limit, key):
+        return sorted(stats.items(), key=lambda item: -getattr(item[1], key))[:limit]
+
+def depth(scopes, field):
+    """Return how many scopes out from the innermost *field* was found in."""
+    maps = getattr(scopes, "maps", None)
+    if maps is None:
+        return 0
+    for depth, scope in enumerate(reversed(maps)):
+        value = scope.get(field, '')
+        if value.__class__ is not str or value:
+            return depth
+    return len(maps)
+
+class Profiling(object):
+    """A formatter mixin that records what the formatter does in :attr:`profile`.
+
+    See :func:`profiled`.
+    """
+    profile = None
+    """The :class:`Profile` being filled."""
+
+    def formatrows(self, section, rows, scopes):
+        stat = self.profile.sections[section.name]
+        stat.calls += 1
+        clock = self.profile.clock
+        started = clock()
+        try:
+            for content in super(Profiling, self).formatrows(section,
+                    self.countrows(rows, stat), scopes):
+                stat.size += len(content)
+                yield content
+        finally:
+            stat.time += clock() - started
+
+    def countrows(self, rows, stat):
+        for row in rows:
+            stat.items += 1
+            yield row
+
+    def get_value(self, field, args, scopes):
+        stat = self.profile.fields[field]
+        stat.calls += 1
+        stat.items += depth(scopes, field)
+        return super(Profiling, self).get_value(field, args, scopes)
+
+    def convert_field(self, value, conversion):
+        if not conversion:
+            return super(Profiling, self).convert_field(value, conversion)
+        stat = self.profile.converters[conversion]
+        clock = self.profile.clock
+        started = clock()
+        try:
+            return super(Profiling, self).convert_field(value, conversion)
+        finally:
+            stat.calls += 1
+            stat.time += clock() - started
+
+classes = {}
+
+def profiled(formatter, profile):
+    """Return a copy of *formatter* that records its work in *profile*.
+
+    The copy's class is a subclass of the formatter's class and
+    :class:`Profiling`. It shares the formatter's converters and caches but
+    has no executor.
+    """
+    cls = formatter.__class__
+    profiling = classes.get(cls)
+    if profiling is None:
+        profiling = classes[cls] = type("Profiling" + cls.__name__,
+            (Profiling, cls), {"__module__": __name__})
+    formatter = copy.copy(formatter)
+    formatter.__class__ = profiling
+    formatter.profile = profile
+    formatter.executor = None
+    return formatter
@@ -22,11 +22,22 @@ OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 """
 
-from ptemplate.formatter import Formatter
-from ptemplate.util import logger
+import copy
+import hashlib
+from functools import partial
+
+from ptemplate import escape
+from ptemplate.codegen import Generator
+from ptemplate.formatter import Formatter, Scopes
+from ptemplate.loader import Loader
+from ptemplate.util import buffered, logger
 
 __all__ = ["Template"]
 
+def digest(source):
+    """Return a digest of the template string *source*."""
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
 class Template(object):
     """A templater.
 
@@ -40,6 +51,8 @@ class Template(object):
     .. _interface:  http://docs.turbogears.org/1.0/TemplatePlugins
     """
     options = {}
+    formatterclass = Formatter
+    """The class of :attr:`formatter`."""
     preprocessor = None
     """Template preprocessor callable.
 
@@ -51,40 +64,332 @@ class Template(object):
     converters = {}
     """A dictionary of object converters.
 
-    These converters will be passed to the template's
-    :class:`ptemplate.formatter.Formatter` instance.
+    Each :class:`Template` starts with its own copy of this dictionary. When
+    the template is compiled, its converters are merged with those of its
+    :class:`ptemplate.formatter.Formatter` instance into the dispatch table
+    used while rendering. Converters changed after the template is compiled
+    take effect the next time it is compiled.
+    """
+    engine = "interpreter"
+    """The rendering engine.
+
+    With the default "interpreter" engine, the compiled template is rendered
+    by :meth:`ptemplate.formatter.Formatter.formatsection`. With the "python"
+    engine, it is translated to a dedicated Python function by
+    :class:`ptemplate.codegen.Generator`, which is faster for large templates
+    and data sets.
+    """
+    autoescape = False
+    """Whether fields are escaped for HTML automatically.
+
+    If True, :meth:`compile` passes the compiled template to
+    :func:`ptemplate.escape.autoescape`, which gives each field without a
+    conversion the escaper for its context in the surrounding HTML. The
+    escapers (:data:`ptemplate.escape.escapers`) are added to the converters
+    unless converters with the same names are already registered.
+    """
+    buffersize = 8192
+    """The approximate size (in characters) of chunks produced by :meth:`generate`."""
+    cache = None
+    """A persistent cache of compiled templates.
+
+    If not None, this should be a :class:`ptemplate.cache.DiskCache`.
+    :meth:`compile` loads compiled templates from the cache when possible and
+    stores newly compiled templates in it.
+    """
+    path = ()
+    """Directories searched for templates by :meth:`load_template` and includes.
+
+    If empty, the "ptemplate.path" entry of the Buffet *options* is used.
+    """
+    loader = None
+    """The :class:`ptemplate.loader.Loader` used by :meth:`load_template`.
+
+    If None, a loader searching :attr:`path` is created when the first
+    template is loaded. Templates it loads are configured like this one (see
+    :meth:`derive`).
+    """
+    profile = None
+    """A :class:`ptemplate.profiling.Profile` recording the template's renders.
+
+    If not None, :meth:`render`, :meth:`render_many` and :meth:`generate`
+    interpret the compiled template with a formatter that records where the
+    time goes (see :meth:`ptemplate.formatter.Formatter.profiled`), whatever
+    the :attr:`engine`.
     """
-    
+
     def __init__(self, extra_vars_func=None, options=None, template=''):
         self.log = logger(__name__, self)
         self.options = options
-        self.template = template
-        self.formatter = Formatter()
+        self.formatter = self.formatterclass()
         """The template's formatter.
 
         The formatter performs the actual templating work and should
-        have a :meth:`ptemplate.formatter.Formatter.format` method and a
+        have :meth:`ptemplate.formatter.Formatter.compile` and
+        :meth:`ptemplate.formatter.Formatter.formatsection` methods and a
         :attr:`ptemplate.formatter.Formatter.converters` dictionary. The
         converters dictionary will be updated with any converters specified in
-        the Template.
+        the Template when the template is compiled.
         """
+        self.converters = dict(self.converters)
+        self.template = template
 
-        self.formatter.converters.update(self.converters)
+    @property
+    def template(self):
+        """The template string.
 
-    def render(self, data, format="html", fragment=False, template=None):
-        """Render the template using *data*.
+        Setting :attr:`template` discards the compiled form of the previous
+        template; the new one is compiled by the next call to :meth:`render`.
+        """
+        return self._template
+
+    @template.setter
+    def template(self, template):
+        self._template = template
+        self.compiled = None
+        self.renderer = None
+        self.streamer = None
+        self.rendered = None
+        """The output of the last :meth:`rerender` (or None).
+
+        This is a :class:`ptemplate.formatter.Rendered`.
+        """
+        self.included = {}
+        """The templates included by the compiled template.
+
+        Maps the names of the templates (see :meth:`include`) to digests of
+        their sources.
+        """
+
+    def compile(self):
+        """Compile the template.
+
+        :attr:`template` is passed to :attr:`preprocessor` (if necessary) and
+        compiled by :attr:`formatter`, whose converters are bound to the
+        template's :attr:`converters`. The result is stored in :attr:`compiled`
+        and reused by :meth:`render` until :attr:`template` changes. The
+        compiled template is also prepared for :attr:`engine`; the resulting
+        callables are stored in :attr:`renderer` and :attr:`streamer`. If :attr:`cache` is set, the
+        compiled template is loaded from (or stored in) the cache; entries
+        whose included templates have changed are compiled again. If
+        :attr:`autoescape` is set, fields are bound to escapers here. Unless
+        the formatter has its own
+        :attr:`ptemplate.formatter.Formatter.includes`, included templates are
+        read by :meth:`include`.
+        """
+        if self.engine not in ("interpreter", "python"):
+            raise ValueError("unknown engine %r" % self.engine)
+
+        generator = Generator()
+        preprocessor = getattr(self, "preprocessor", None)
+        if not callable(preprocessor):
+            preprocessor = None
+
+        converters = dict(self.formatter.converters)
+        converters.update(self.converters)
+        if self.autoescape:
+            for name, escaper in escape.escapers.items():
+                converters.setdefault(name, escaper)
+        self.formatter.converters = converters
+
+        entry = key = None
+        if self.cache is not None:
+            key = self.cache.key(self.template, self.formatter, preprocessor,
+                converters, self.engine, self.autoescape)
+            if key is not None:
+                entry = self.cache.load(key)
+
+        if entry is not None:
+            compiled, code, included = entry
+            try:
+                if any(digest(self.getloader().source(name)) != value
+                        for name, value in included.items()):
+                    entry = None
+            except IOError:
+                entry = None
+            self.included = included
+
+        if entry is None:
+            template = self.template
+            if preprocessor is not None:
+                template = preprocessor(template)
+            self.included = {}
+            # The formatter only holds on to include() while compiling, so it
+            # stays picklable (see Formatter.executor).
+            includes = self.formatter.includes
+            if includes is None:
+                self.formatter.includes = self.include
+            try:
+                compiled = self.formatter.compile(template)
+            finally:
+                self.formatter.includes = includes
+            if self.autoescape:
+                compiled = self.formatter.identify(escape.autoescape(compiled))
+            code = None
+            if self.engine == "python":
+                code = generator.compile(compiled)
+            if key is not None:
+                self.cache.store(key, compiled, code, self.included)
+
+        if entry is not None:
+            self.formatter.prepare(compiled)
+        self.compiled = compiled
+        self.rendered = None
+        if self.engine == "python":
+            self.renderer, self.streamer = generator.load(code, self.formatter)
+        else:
+            bound = compiled
+            if self.autoescape:
+                bound = self.formatter.bind(compiled, escape.escapers)
+            self.renderer = partial(self.formatter.formatsection, bound)
+            self.streamer = partial(self.formatter.iterformat, bound)
+        return self.compiled
+
+    def include(self, name):
+        """Return the source of the template *name* for an include marker.
 
-        The *format*, *fragment* and *template* arguments are ignored. Instead,
-        :class:`Template` uses :attr:`template` as the template, passing it to
-        :attr:`preprocessor` if necessary. It then expands the template (using
-        :attr:`formatter`) and returns the result as a string.
+        The source is read by the :attr:`loader` (see :meth:`getloader`),
+        recorded in :attr:`included` and passed to :attr:`preprocessor` (if
+        necessary).
         """
-        template = self.template
+        source = self.getloader().source(name)
+        self.included[name] = digest(source)
         preprocessor = getattr(self, "preprocessor", None)
         if callable(preprocessor):
-            template = preprocessor(template)
-        self.formatter.converters.update(self.converters)
-        return self.formatter.format(template, **data)
+            source = preprocessor(source)
+        return source
+
+    def derive(self, template=''):
+        """Return a new template with this template's configuration.
+
+        The new template renders the string *template*. It has its own copy
+        of :attr:`converters` and its own formatter, but shares the
+        formatter's caches and executor (and this template's :attr:`loader`).
+        """
+        derived = copy.copy(self)
+        derived.converters = dict(self.converters)
+        derived.formatter = copy.copy(self.formatter)
+        derived.template = template
+        return derived
+
+    def render(self, data, format="html", fragment=False, template=None):
+        """Render the template using *data*.
+
+        The *format* and *fragment* arguments are ignored. If *template* is
+        given, it names a template to render instead (see
+        :meth:`load_template`). Otherwise, :class:`Template` uses
+        :attr:`template` as the template, compiling it (see :meth:`compile`) if
+        necessary. It then expands the template (using :attr:`formatter`) and
+        returns the result as a string.
+        """
+        if template is not None:
+            return self.load_template(template).render(data)
+        if self.compiled is None:
+            self.compile()
+        if self.profile is not None:
+            return ''.join(self.profiled(data, self.scopes()))
+        return self.renderer(data, self.scopes())
+
+    def render_many(self, datas):
+        """Render the template once for each data dictionary in *datas*.
+
+        Returns an iterator over the rendered strings. The template is
+        compiled and its outermost scopes (see :meth:`scopes`) are set up once
+        for the whole batch, so rendering many small documents costs little
+        more than the rendering itself.
+        """
+        if self.compiled is None:
+            self.compile()
+        if self.profile is not None:
+            return (''.join(self.profiled(data, self.scopes())) for data in datas)
+        return map(partial(self.renderer, scopes=self.scopes()), datas)
+
+    def rerender(self, data, changes=None):
+        """Render the template using *data*, reusing the last :meth:`rerender`.
+
+        The output of each field, section and section row from the previous
+        call is kept in :attr:`rendered`; only the parts whose data changed
+        are formatted again (see
+        :meth:`ptemplate.formatter.Formatter.formatincremental`, which also
+        describes *changes*). This suits pages rendered over and over with a
+        few changed values. The compiled template is always interpreted,
+        whatever the :attr:`engine`. A template shouldn't be rerendered by
+        several threads at once.
+        """
+        if self.compiled is None:
+            self.compile()
+        output, self.rendered = self.formatter.formatincremental(self.compiled,
+            data, self.rendered, changes, self.scopes())
+        return output
+
+    def fields(self):
+        """Return the tree of fields and sections the template uses.
+
+        The template is compiled if necessary, so included templates are
+        covered too. See :meth:`ptemplate.formatter.Formatter.fields`; a data
+        layer can use the tree to fetch only the values a render needs.
+        """
+        if self.compiled is None:
+            self.compile()
+        return self.formatter.fields(self.compiled)
+
+    def scopes(self):
+        """Return the scopes that enclose the data dictionary while rendering.
+
+        By default, the template has no data outside the data dictionary
+        passed to :meth:`render`, so this returns an empty
+        :class:`ptemplate.formatter.Scopes`.
+        """
+        return Scopes()
+
+    def render_async(self, data):
+        """Render the template using *data* asynchronously.
+
+        Returns a coroutine. Values in *data* may be awaitables or
+        asynchronous iterables; they are resolved concurrently before the
+        template is rendered (see :mod:`ptemplate.aio`).
+        """
+        from ptemplate.aio import render
+        return render(self, data)
+
+    def generate(self, data):
+        """Render the template using *data*, yielding chunks of output.
+
+        Unlike :meth:`render`, :meth:`generate` never holds the whole output
+        in memory; chunks of about :attr:`buffersize` characters are yielded as
+        soon as they are ready.
+        """
+        if self.compiled is None:
+            self.compile()
+        if self.profile is not None:
+            return buffered(self.profiled(data, self.scopes()), self.buffersize)
+        return buffered(self.streamer(data, self.scopes()), self.buffersize)
+
+    def profiled(self, data, scopes):
+        """Render the template using *data*, recording the render in :attr:`profile`.
+
+        Yields the output like :meth:`ptemplate.formatter.Formatter.iterformat`.
+        """
+        profile = self.profile
+        started = profile.clock()
+        size = 0
+        try:
+            for chunk in self.formatter.profiled(profile).iterformat(
+                    self.compiled, data, scopes):
+                size += len(chunk)
+                yield chunk
+        finally:
+            profile.record(started, size)
+
+    def render_to(self, data, fileobj):
+        """Render the template using *data*, writing the output to *fileobj*.
+
+        *fileobj* may be any object with a :meth:`write` method accepting
+        strings; the output is written in chunks (see :meth:`generate`).
+        """
+        write = fileobj.write
+        for chunk in self.generate(data):
+            write(chunk)
 
     def transform(self, info, template): # pragma: nocover
         """Render the output to Elements.
@@ -93,9 +398,18 @@ class Template(object):
         """
         raise NotImplementedError
 
-    def load_template(self, templatename): # pragma: nocover
+    def load_template(self, templatename):
         """Find a template specified in Python 'dot' notation.
 
-        Required by Buffet; not supported.
+        Returns a compiled template loaded by :attr:`loader`, which finds
+        *templatename* (a file name relative to :attr:`path` or a dotted name;
+        see :meth:`ptemplate.loader.Loader.find`) and caches the result.
         """
-        raise NotImplementedError
+        return self.getloader().load(templatename)
+
+    def getloader(self):
+        """Return :attr:`loader`, creating it if necessary."""
+        if self.loader is None:
+            path = self.path or (self.options or {}).get("ptemplate.path", ())
+            self.loader = Loader(path, self.derive)
+        return self.loader
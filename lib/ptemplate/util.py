@@ -15,8 +15,130 @@ OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
 
-__all__ = ["logger"]
+def buffered(chunks, size):
+    """Join the strings in *chunks* into strings of at least *size* characters.
+
+    Yields the joined strings (the last may be shorter). Only about *size*
+    characters are held at once.
+    """
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+class LRU(object):
+    """A size-bounded mapping that discards its least recently used items.
+
+    At most *maxsize* items are kept. If *maxweight* is not None, items are
+    also discarded while the sum of their weights (as returned by *weigh*)
+    exceeds it. If *ttl* is not None, items expire *ttl* seconds (as
+    measured by :attr:`clock`) after they were stored. Lookups and
+    insertions are safe to use from several threads and are counted in
+    :attr:`hits` and :attr:`misses`. A pickled :class:`LRU` keeps its limits
+    but not its contents.
+    """
+    clock = staticmethod(time.monotonic)
+    """The function returning the current time (in seconds) for *ttl*."""
+
+    def __init__(self, maxsize=128, ttl=None, maxweight=None, weigh=len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.items = OrderedDict()
+        self.deadlines = {}
+        self.weights = {}
+        self.weight = 0
+        """The sum of the weights of the items (if *maxweight* is set)."""
+        self.lock = threading.Lock()
+        self.hits = 0
+        """The number of lookups that found their key."""
+        self.misses = 0
+        """The number of lookups that didn't find their key."""
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items and not self.expired(key)
+
+    def expired(self, key):
+        """Return True if the item for *key* has outlived the *ttl*."""
+        return self.ttl is not None and self.deadlines[key] <= self.clock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            try:
+                value = self.items[key]
+                if self.ttl is not None and self.expired(key):
+                    self.discard(key)
+                    raise KeyError(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            if key in self.items:
+                self.discard(key)
+            self.items[key] = value
+            if self.ttl is not None:
+                self.deadlines[key] = self.clock() + self.ttl
+            if self.maxweight is not None:
+                self.weights[key] = weight = self.weigh(value)
+                self.weight += weight
+            while len(self.items) > self.maxsize or \
+                    (self.maxweight is not None and self.weight > self.maxweight):
+                self.discard(next(iter(self.items)))
+
+    def __delitem__(self, key):
+        with self.lock:
+            self.discard(key)
+
+    def discard(self, key):
+        """Remove *key* (the caller must hold :attr:`lock`)."""
+        del self.items[key]
+        self.deadlines.pop(key, None)
+        self.weight -= self.weights.pop(key, 0)
+
+    def get(self, key, default=None):
+        """Return the value for *key* or *default* if it isn't cached."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        """Discard all items and reset the counters."""
+        with self.lock:
+            self.items.clear()
+            self.deadlines.clear()
+            self.weights.clear()
+            self.weight = 0
+            self.hits = self.misses = 0
+
+    def __getstate__(self):
+        return {"maxsize": self.maxsize, "ttl": self.ttl,
+            "maxweight": self.maxweight, "weigh": self.weigh}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+__all__ = ["LRU", "buffered", "logger"]
 
 def logger(base, cls):
     """Return a logger.
@@ -164,17 +164,12 @@ def ptemplate(dirname, verbose=False):
     except ImportError:
         return lambda: None
 
-    def read(fname):
-        f = open(os.path.join(dirname, fname), 'r')
-        template = Template(template=f.read())
-        template.converters["h"] = cgi.escape
-
-        return template
+    engine = Template()
+    engine.path = [dirname]
+    engine.converters["h"] = cgi.escape
 
     def render():
-        template = read("template.html")
-        header = read("header.html")
-        footer = read("footer.html")
+        template = engine.load_template("template.html")
         data = {
             "title": "Just a test",
             "user": "joe",
@@ -182,8 +177,6 @@ def ptemplate(dirname, verbose=False):
             "items": [{"item": "Number %d" % num} for num in range(1, 15)]
         }
         data["items"][-1]["last"] = [{}]
-        data["header"] = header.render(data)
-        data["footer"] = footer.render(data)
         return template.render(data)
 
     if verbose:
@@ -200,17 +193,12 @@ def ctemplate(dirname, verbose=False):
     except ImportError:
         return lambda: None
 
-    def read(fname):
-        f = open(os.path.join(dirname, fname), 'r')
-        template = CTemplate(template=f.read())
-        template.converters["h"] = cgi.escape
-
-        return template
+    engine = CTemplate()
+    engine.path = [dirname]
+    engine.converters["h"] = cgi.escape
 
     def render():
-        template = read("template.html")
-        header = read("header.html")
-        footer = read("footer.html")
+        template = engine.load_template("template.html")
         data = {
             "title": "Just a test",
             "user": "joe",
@@ -218,8 +206,6 @@ def ctemplate(dirname, verbose=False):
             "items": [{"item": "Number %d" % num} for num in range(1, 15)]
         }
         data["items"][-1]["last"] = [{}]
-        data["header"] = header.render(data)
-        data["footer"] = footer.render(data)
         return template.render(data)
 
     if verbose:
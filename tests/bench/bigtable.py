@@ -111,7 +111,6 @@ if MakoTemplate:
 if PTemplate:
     import cgi
     escape = lambda field: cgi.escape(str(field))
-    PTemplate.converters.update({"h": escape})
     ptmpl = PTemplate(template="""\
 <table>
 {#rows}
@@ -123,6 +122,7 @@ if PTemplate:
 {/rows}
 </table>
 """)
+    ptmpl.converters["h"] = escape
     data = {
         "rows": [{"columns": [{"col": v} for v in r.values()]} for r in table],
     }
@@ -130,10 +130,29 @@ if PTemplate:
         """PTemplate"""
         ptmpl.render(data)
 
+    ptmpl_python = PTemplate(template=ptmpl.template)
+    ptmpl_python.converters["h"] = escape
+    ptmpl_python.engine = "python"
+    def test_ptemplate_python():
+        """PTemplate (python engine)"""
+        ptmpl_python.render(data)
+
+    # The same table fed as columns (one list per column) instead of a list
+    # of rows of single-column dictionaries.
+    ptmpl_columns = PTemplate(template="<table>\n{#rows}\n    <tr>\n" +
+        "".join("        <td>{%s!h}\n" % k for k in sorted(table[0])) +
+        "    </tr>\n{/rows}\n</table>\n")
+    ptmpl_columns.converters["h"] = escape
+    columns = {
+        "rows": dict((k, [r[k] for r in table]) for k in sorted(table[0])),
+    }
+    def test_ptemplate_columns():
+        """PTemplate (columns)"""
+        ptmpl_columns.render(columns)
+
 if CTemplate:
     import cgi
     escape = lambda field: cgi.escape(str(field))
-    CTemplate.converters.update({"h": escape})
     ctmpl = CTemplate(template="""\
 <table>
 {{#rows}}
@@ -145,6 +164,7 @@ if CTemplate:
 {{/rows}}
 </table>
 """)
+    ctmpl.converters["h"] = escape
     data = {
         "rows": [{"columns": [{"col": v} for v in r.values()]} for r in table],
     }
@@ -253,7 +273,8 @@ def run(which=None, number=10):
     tests = ['test_builder', 'test_genshi', 'test_genshi_text',
              'test_genshi_builder', 'test_mako', 'test_kid', 'test_kid_et',
              'test_et', 'test_cet', 'test_clearsilver', 'test_django',
-             'test_ptemplate', 'test_ctemplate']
+             'test_ptemplate', 'test_ptemplate_python',
+             'test_ptemplate_columns', 'test_ctemplate']
 
     if which:
         tests = filter(lambda n: n[5:] in which, tests)
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+# Template memory benchmark
+#
+# Objective: Show that streaming a section fed by a generator renders in
+# constant memory, whatever the number of rows.
+#
+# Each measurement runs in a fresh interpreter since peak RSS never shrinks.
+# Usage: python memory.py [-p] [rows ...]  (-p: use the python engine)
+
+import os
+import resource
+import subprocess
+import sys
+
+template = """\
+<table>
+{#rows}
+    <tr>{#columns}<td>{col}</td>{/columns}</tr>
+{/rows}
+</table>
+"""
+
+def measure(rows, engine):
+    from ptemplate.template import Template
+
+    def generate():
+        for i in range(rows):
+            yield {"columns": [{"col": i * 10 + j} for j in range(10)]}
+
+    templater = Template(template=template)
+    templater.engine = engine
+    with open(os.devnull, "w") as devnull:
+        templater.render_to({"rows": generate()}, devnull)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run(counts, engine):
+    print("%-12s %-12s %s" % ("rows", "engine", "peak RSS (KB)"))
+    for rows in counts:
+        output = subprocess.check_output([sys.executable, __file__,
+            "--measure", str(rows), engine])
+        print("%-12d %-12s %s" % (rows, engine, output.decode().strip()))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        print(measure(int(sys.argv[2]), sys.argv[3]))
+        sys.exit()
+
+    engine = "python" if "-p" in sys.argv else "interpreter"
+    counts = [int(arg) for arg in sys.argv[1:] if arg[0] != '-']
+    run(counts or [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6], engine)
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+# Numeric column benchmark
+#
+# Objective: Compare formatting a report of float columns a cell at a time
+# with formatting each column in one batch (Formatter.vectorize).
+#
+# Usage: python numeric.py [rows]
+
+import sys
+import timeit
+
+import numpy
+
+from ptemplate.columnar import formatcolumn
+from ptemplate.formatter import Formatter
+from ptemplate.template import Template
+
+names = ["open", "high", "low", "close", "volume"]
+template = "<table>\n{#rows}<tr>%s</tr>\n{/rows}</table>\n" % "".join(
+    "<td>{%s:,.2f}</td>" % name for name in names)
+
+class CellFormatter(Formatter):
+    """A formatter that formats every cell separately."""
+
+    def vectorize(self, section, rows):
+        return section, rows
+
+class CellTemplate(Template):
+    formatterclass = CellFormatter
+
+def run(rows, number=5):
+    columns = dict((name, numpy.random.rand(rows) * 1000) for name in names)
+    dicts = [dict(zip(names, values)) for values in zip(*columns.values())]
+    tests = [
+        ("rows of dicts", Template(template=template), {"rows": dicts}),
+        ("columns, per cell", CellTemplate(template=template), {"rows": columns}),
+        ("columns, batched", Template(template=template), {"rows": columns}),
+    ]
+
+    print("%-24s %s" % ("test", "ms per render (%d rows)" % rows))
+    for name, templater, data in tests:
+        time = timeit.timeit(lambda: templater.render(data), number=number)
+        print("%-24s %.2f" % (name, time * 1000 / number))
+
+    time = timeit.timeit(lambda: [formatcolumn(column, ",.2f")
+        for column in columns.values()], number=number)
+    print("%-24s %.2f" % ("formatcolumn only", time * 1000 / number))
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if sys.argv[1:] else 10 ** 5)
@@ -0,0 +1,255 @@
+# -*- encoding: utf-8 -*-
+# ptemplate benchmark suite
+#
+# Objective: Track the speed of ptemplate itself -- tokenizing, compiling and
+# rendering small, large, deeply nested and wide templates with Template and
+# CTemplate (and both rendering engines) -- and catch regressions.
+#
+# Each benchmark is warmed up and then timed in several runs. Results can be
+# written as JSON (-o) and compared with an earlier result (--compare); the
+# comparison flags benchmarks that got slower by more than --threshold with a
+# Mann-Whitney U test significant at --alpha, and exits with status 1 if any
+# did.
+#
+# Usage: python suite.py [-k PATTERN] [-r RUNS] [-o FILE] [--compare BASELINE]
+#                        [--load FILE]
+
+import argparse
+import html
+import json
+import math
+import platform
+import re
+import statistics
+import sys
+import time
+import timeit
+
+import ptemplate
+from ptemplate.ctemplate import CTemplate
+from ptemplate.template import Template
+
+def small(start, end):
+    """A page like the one in basic.py."""
+    return """\
+<html>
+  <head><title>{s}title{e}</title></head>
+  <body>
+    <div id="header"><h1>{s}title!h{e}</h1></div>
+    {s}#users{e}<p>Hello, {s}user!h{e}!</p>{s}/users{e}
+    <ul>
+    {s}#items{e}<li{s}#last{e} class="last"{s}/last{e}>{s}item!h{e}</li>{s}/items{e}
+    </ul>
+  </body>
+</html>
+""".format(s=start, e=end)
+
+def smalldata():
+    data = {
+        "title": "Just a test",
+        "user": "joe",
+        "users": [{"user": u} for u in "joe me world".split()],
+        "items": [{"item": "Number %d" % num} for num in range(1, 15)],
+    }
+    data["items"][-1]["last"] = [{}]
+    return data
+
+def large(start, end):
+    """The 1000x10 table from bigtable.py."""
+    cells = "".join("<td>{s}%s{e}</td>" % c for c in "abcdefghij")
+    template = "<table>\n{s}#table{e}<tr>%s</tr>\n{s}/table{e}</table>\n" % cells
+    return template.format(s=start, e=end)
+
+def largedata():
+    return {"table": [dict(a=1, b=2, c=3, d=4, e=5, f=6, g=7, h=8, i=9, j=10)
+        for x in range(1000)]}
+
+def nested(start, end, depth=6):
+    """Sections nested *depth* deep."""
+    template = "{s}value{e}"
+    for level in reversed(range(depth)):
+        template = "<div>{s}label{e}{s}#n%d{e}%s{s}/n%d{e}</div>" % (
+            level, template, level)
+    return template.format(s=start, e=end)
+
+def nesteddata(depth=6, width=3):
+    data = {"value": "leaf", "label": "node"}
+    for level in reversed(range(depth)):
+        data = {"n%d" % level: [dict(data) for _ in range(width)]}
+    data.update(value="leaf", label="node")
+    return data
+
+def wide(start, end, columns=200):
+    """Rows of many fields."""
+    cells = "".join("{s}c%d{e}," % c for c in range(columns))
+    return ("{s}#rows{e}%s\n{s}/rows{e}" % cells).format(s=start, e=end)
+
+def widedata(rows=20, columns=200):
+    return {"rows": [dict(("c%d" % c, c * r) for c in range(columns))
+        for r in range(rows)]}
+
+templates = [
+    ("small", small, smalldata),
+    ("large", large, largedata),
+    ("nested", nested, nesteddata),
+    ("wide", wide, widedata),
+]
+
+flavors = [
+    ("ptemplate", Template, "{", "}"),
+    ("ctemplate", CTemplate, "{{", "}}"),
+]
+
+def templater(cls, source, engine="interpreter"):
+    templater = cls(template=source)
+    templater.converters["h"] = html.escape
+    templater.engine = engine
+    return templater
+
+def benchmarks():
+    """Yield (name, function) pairs; each function runs the benchmark once."""
+    for size, build, data in templates:
+        for flavor, cls, start, end in flavors:
+            source = build(start, end)
+            formatter = cls.formatterclass()
+            prefix = "%s/%s" % (size, flavor)
+            yield ("tokenize/" + prefix,
+                lambda f=formatter, s=source: list(f.tokenize(s)))
+            yield ("compile/" + prefix,
+                lambda cls=cls, s=source: templater(cls, s).compile())
+            for engine in ("interpreter", "python"):
+                t = templater(cls, source, engine)
+                t.compile()
+                yield ("render/%s/%s" % (prefix, engine),
+                    lambda t=t, d=data(): t.render(d))
+
+def measure(function, runs, warmup, target):
+    """Return the seconds per call of *function* in each of *runs* runs.
+
+    *function* is first run for about *warmup* seconds; the number of calls
+    per run is chosen so a run takes about *target* seconds.
+    """
+    timer = timeit.Timer(function)
+    deadline = time.perf_counter() + warmup
+    calls, elapsed = timer.autorange()
+    while time.perf_counter() < deadline:
+        timer.timeit(calls)
+    number = max(1, int(calls * target / elapsed))
+    return [t / number for t in timer.repeat(runs, number)]
+
+def run(pattern=None, runs=10, warmup=0.2, target=0.05, out=sys.stdout):
+    """Run the benchmarks whose names match *pattern*; return the results."""
+    results = {}
+    for name, function in benchmarks():
+        if pattern is not None and not re.search(pattern, name):
+            continue
+        times = measure(function, runs, warmup, target)
+        results[name] = times
+        out.write("%-44s %10.3f ms  (+/- %.1f%%)\n" % (name,
+            statistics.median(times) * 1000,
+            100 * statistics.stdev(times) / statistics.mean(times)))
+        out.flush()
+    return {
+        "ptemplate": ptemplate.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+def mannwhitney(a, b):
+    """Return the two-sided p-value of a Mann-Whitney U test of *a* and *b*.
+
+    Uses the normal approximation (with a correction for ties), which is
+    reasonable for the ten or so samples of a benchmark.
+    """
+    ranked = sorted((value, i < len(a)) for i, value in enumerate(a + b))
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+
+    n1, n2 = len(a), len(b)
+    n = n1 + n2
+    r1 = sum(rank for rank, (_, first) in zip(ranks, ranked) if first)
+    u = r1 - n1 * (n1 + 1) / 2.0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2.0) / sigma
+    return math.erfc(abs(z) / math.sqrt(2))
+
+def compare(baseline, current, threshold=0.05, alpha=0.05, out=sys.stdout):
+    """Compare *current* results with *baseline*; return the regressions.
+
+    A benchmark regressed if its median time grew by more than *threshold*
+    (a fraction) and the difference is significant at *alpha*.
+    """
+    regressions = []
+    out.write("%-44s %10s %10s %8s %8s\n" % ("benchmark", "baseline", "current",
+        "change", "p"))
+    for name in sorted(current["results"]):
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]
+        new = current["results"][name]
+        change = statistics.median(new) / statistics.median(old) - 1
+        p = mannwhitney(old, new)
+        flag = ""
+        if p < alpha and change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif p < alpha and change < -threshold:
+            flag = "  faster"
+        out.write("%-44s %8.3fms %8.3fms %+7.1f%% %8.3f%s\n" % (name,
+            statistics.median(old) * 1000, statistics.median(new) * 1000,
+            change * 100, p, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ptemplate benchmarks.")
+    parser.add_argument("-k", dest="pattern",
+        help="only run benchmarks whose names match this regular expression")
+    parser.add_argument("-r", "--runs", type=int, default=10,
+        help="timed runs per benchmark (default: %(default)s)")
+    parser.add_argument("-w", "--warmup", type=float, default=0.2,
+        help="seconds of warmup per benchmark (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--load", help="load results from this JSON file instead "
+        "of running the benchmarks")
+    parser.add_argument("--compare", metavar="BASELINE",
+        help="compare the results with those in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.05,
+        help="slowdown (as a fraction) that counts as a regression "
+        "(default: %(default)s)")
+    parser.add_argument("--alpha", type=float, default=0.05,
+        help="significance level of the comparison (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.load:
+        with open(args.load) as f:
+            results = json.load(f)
+    else:
+        results = run(args.pattern, args.runs, args.warmup)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, args.alpha)
+        if regressions:
+            print("%d regression(s): %s" % (len(regressions), ", ".join(regressions)))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from tests import BaseTest
+
+from ptemplate.aio import resolve
+from ptemplate.template import Template
+
+async def value(value, delay=0):
+    await asyncio.sleep(delay)
+    return value
+
+async def rows(*values):
+    for v in values:
+        await asyncio.sleep(0)
+        yield {"v": v}
+
+class TestResolve(BaseTest):
+
+    def resolve(self, data):
+        return asyncio.run(resolve(data))
+
+    def test_plain(self):
+        data = {"a": 1, "s": [{"b": 2}]}
+        self.assertEqual(data, self.resolve(data))
+
+    def test_awaitable(self):
+        self.assertEqual({"a": 1}, self.resolve({"a": value(1)}))
+
+    def test_async_iterable(self):
+        self.assertEqual({"s": [{"v": 1}, {"v": 2}]},
+            self.resolve({"s": rows(1, 2)}))
+
+    def test_nested(self):
+        data = {"s": value([{"a": value(1)}, {"a": value(value(2))}])}
+        self.assertEqual({"s": [{"a": 1}, {"a": 2}]}, self.resolve(data))
+
+    def test_not_modified(self):
+        data = {"a": value(1)}
+        awaitable = data["a"]
+        self.resolve(data)
+        self.assertTrue(data["a"] is awaitable)
+
+    def test_shared(self):
+        table = [{"a": i} for i in range(10)]
+        data = {"table": table, "s": [{"b": value(1)}, {"b": 2}]}
+        resolved = self.resolve(data)
+        self.assertTrue(resolved["table"] is table)
+        self.assertTrue(resolved["s"][1] is data["s"][1])
+        self.assertEqual({"b": 1}, resolved["s"][0])
+        plain = {"table": table}
+        self.assertTrue(self.resolve(plain) is plain)
+
+    def test_tuples(self):
+        from collections import namedtuple
+        Pair = namedtuple("Pair", "a b")
+        data = {"t": ({"a": value(1)}, 2), "p": Pair(value(1), (3,)), "u": (4,)}
+        resolved = self.resolve(data)
+        self.assertEqual(({"a": 1}, 2), resolved["t"])
+        self.assertEqual(Pair(1, (3,)), resolved["p"])
+        self.assertTrue(isinstance(resolved["p"], Pair))
+        self.assertTrue(resolved["u"] is data["u"])
+        self.assertTrue(self.resolve((value(1),)) == (1,))
+
+    def test_concurrent(self):
+        start = time.time()
+        self.resolve({"a": value(1, 0.1), "b": [{"c": value(2, 0.1)}]})
+        self.assertTrue(time.time() - start < 0.19)
+
+class TestRenderAsync(BaseTest):
+
+    def test_render_async(self):
+        templater = Template(template="{title}: {#items}{v} {/items}")
+        data = {"title": value("items"), "items": rows(1, 2, 3)}
+        output = asyncio.run(templater.render_async(data))
+        self.assertEqual("items: 1 2 3 ", output)
@@ -0,0 +1,96 @@
+import io
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from unittest import mock
+
+from tests import BaseTest
+
+from ptemplate.bundle import Bundle, BundleLoader, main, pack
+from ptemplate.ctemplate import CTemplate
+from ptemplate.formatter import Formatter
+from ptemplate.template import Template
+
+class TestBundle(BaseTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.templates = os.path.join(self.directory, "templates")
+        self.filename = os.path.join(self.directory, "templates.ptb")
+        self.write("index.html", "[{>parts.header}]{#items}{item!h}{/items}")
+        self.write("parts/header.html", "<h1>{title}</h1>")
+        self.write("notes.txt", "notes")
+        self.write("README", "not a template")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        path = os.path.join(self.templates, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(source)
+
+    def engine(self, cls=Template):
+        engine = cls()
+        engine.converters["h"] = str.upper
+        return engine
+
+    def test_pack(self):
+        names = pack(self.templates, self.filename, self.engine().derive)
+        self.assertEqual(["index.html", "notes.txt", "parts/header.html"], names)
+        with Bundle(self.filename) as bundle:
+            self.assertEqual(names, list(bundle))
+            self.assertEqual("notes", bundle.source("notes.txt"))
+            self.assertEqual(3, len(bundle.entries))
+
+    def test_load(self):
+        engine = self.engine()
+        pack(self.templates, self.filename, engine.derive)
+        shutil.rmtree(self.templates)
+
+        engine = self.engine()
+        engine.loader = BundleLoader(Bundle(self.filename), engine.derive)
+        with mock.patch.object(Formatter, "compile", side_effect=AssertionError):
+            template = engine.load_template("index")
+            self.assertEqual("[<h1>t</h1>]AB", template.render(
+                {"title": "t", "items": [{"item": "a"}, {"item": "b"}]}))
+        self.assertTrue(template is engine.load_template("index"))
+        self.assertEqual("[<h1>t</h1>]",
+            engine.load_template("index.html").render({"title": "t"}))
+        self.assertEqual("notes", engine.load_template("notes").render({}))
+        self.assertRaises(IOError, engine.load_template, "README")
+
+    def test_different_configuration(self):
+        pack(self.templates, self.filename, self.engine().derive)
+        engine = self.engine()
+        engine.engine = "python"
+        engine.loader = BundleLoader(Bundle(self.filename), engine.derive)
+        template = engine.load_template("index")
+        self.assertEqual("[<h1>t</h1>]A", template.render(
+            {"title": "t", "items": [{"item": "a"}]}))
+
+    def test_ctemplate(self):
+        self.write("c.html", "{{>parts.c}}{{title:h}}")
+        self.write("parts/c.html", "{{#items}}{{item}}{{/items}}")
+        pack(self.templates, self.filename, CTemplate().derive)
+        loader = BundleLoader(Bundle(self.filename), CTemplate)
+        self.assertEqual("ab&lt;", loader.load("c").render(
+            {"title": "<", "items": [{"item": "a"}, {"item": "b"}]}))
+
+    def test_not_a_bundle(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"\0" * 64)
+        self.assertRaises(ValueError, Bundle, self.filename)
+
+    def test_main(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main([self.templates, self.filename, "--template",
+                "ptemplate.ctemplate:CTemplate", "--engine", "python"])
+        self.assertEqual("3 templates packed into %s\n" % self.filename,
+            output.getvalue())
+        with Bundle(self.filename) as bundle:
+            self.assertEqual(3, len(bundle.entries))
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+
+from tests import BaseTest
+
+from ptemplate.cache import DiskCache, describe
+from ptemplate.ctemplate import CTemplate
+from ptemplate.template import Template
+
+class TestDiskCache(BaseTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DiskCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def templater(self, cls=Template, engine="interpreter", template="{#a}{b}{/a}"):
+        templater = cls(template=template)
+        templater.cache = self.cache
+        templater.engine = engine
+        return templater
+
+    def entries(self):
+        return [n for n in os.listdir(self.directory) if n.endswith(".ptc")]
+
+    def test_store_and_load(self):
+        data = {"a": [{"b": 1}, {"b": 2}]}
+        self.assertEqual("12", self.templater().render(data))
+        self.assertEqual(1, len(self.entries()))
+
+        templater = self.templater()
+        templater.formatter.compile = None
+        self.assertEqual("12", templater.render(data))
+
+    def test_code(self):
+        data = {"a": [{"b": 1}]}
+        self.assertEqual("1", self.templater(engine="python").render(data))
+        templater = self.templater(engine="python")
+        templater.formatter.compile = None
+        self.assertEqual("1", templater.render(data))
+
+    def test_key_source(self):
+        self.templater().render({})
+        self.templater(template="{a}").render({})
+        self.assertEqual(2, len(self.entries()))
+
+    def test_key_engine(self):
+        self.templater().render({})
+        self.templater(engine="python").render({})
+        self.assertEqual(2, len(self.entries()))
+
+    def test_key_template_class(self):
+        self.templater(template="{a}").render({})
+        self.templater(cls=CTemplate, template="{a}").render({})
+        self.assertEqual(2, len(self.entries()))
+
+    def test_key_preprocessor(self):
+        first = lambda s: s.replace("X", "a")
+        second = lambda s: s.replace("Y", "a")
+        self.assertNotEqual(describe(first), describe(second))
+        data = {"a": 1, "X": "x", "Y": "y"}
+        templater = self.templater(template="{X}{Y}")
+        templater.preprocessor = first
+        self.assertEqual("1y", templater.render(data))
+        templater = self.templater(template="{X}{Y}")
+        templater.preprocessor = second
+        self.assertEqual("x1", templater.render(data))
+        self.assertEqual(2, len(self.entries()))
+
+    def test_key_closure(self):
+        def preprocessor(marker, default="{"):
+            return lambda s, default=default: s.replace(marker, default)
+        self.assertEqual(describe(preprocessor("[[")), describe(preprocessor("[[")))
+        self.assertNotEqual(describe(preprocessor("[[")), describe(preprocessor("<<")))
+        self.assertNotEqual(describe(preprocessor("[[")),
+            describe(preprocessor("[[", "{{")))
+
+    def test_key_partial(self):
+        from functools import partial
+        from re import sub
+        data = {"x": 1}
+        templater = self.templater(template="[[x}")
+        templater.preprocessor = partial(sub, r"\[\[", "{")
+        self.assertEqual("1", templater.render(data))
+        templater = self.templater(template="[[x}")
+        templater.preprocessor = partial(sub, r"\[\[x\}", "lit")
+        self.assertEqual("lit", templater.render(data))
+        self.assertEqual(2, len(self.entries()))
+
+    def test_key_unstable(self):
+        class Preprocessor(object):
+            def __call__(self, template):
+                return template.replace("X", "a")
+        self.assertRaises(ValueError, describe, Preprocessor())
+        self.assertEqual(None, self.cache.key("{X}", preprocessor=Preprocessor()))
+        templater = self.templater(template="{X}")
+        templater.preprocessor = Preprocessor()
+        self.assertEqual("1", templater.render({"a": 1}))
+        self.assertEqual(0, len(self.entries()))
+
+    def test_key_version(self):
+        key = self.cache.key("{a}")
+        self.cache.version += 1
+        self.assertNotEqual(key, self.cache.key("{a}"))
+
+    def test_damaged_entry(self):
+        key = self.cache.key("{a}")
+        with open(self.cache.path(key), "wb") as f:
+            f.write(b"garbage")
+        self.assertEqual(None, self.cache.load(key))
+
+    def test_included(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "inner.html")
+            with open(path, 'w') as f:
+                f.write("old")
+            templater = self.templater(template="{>inner}")
+            templater.path = [directory]
+            self.assertEqual("old", templater.render({}))
+
+            with open(path, 'w') as f:
+                f.write("new")
+            templater = self.templater(template="{>inner}")
+            templater.path = [directory]
+            self.assertEqual("new", templater.render({}))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_clear(self):
+        self.templater().render({})
+        self.cache.clear()
+        self.assertEqual([], self.entries())
@@ -0,0 +1,91 @@
+from tests import TemplateTest
+import tests.test_ctemplate as ctemplate
+import tests.test_loader as loader
+import tests.test_template as template
+
+from ptemplate.codegen import Generator
+from ptemplate.ctemplate import CTemplate
+from ptemplate.formatter import Formatter
+from ptemplate.template import Template
+
+class PythonTemplate(Template):
+    engine = "python"
+
+class PythonCTemplate(CTemplate):
+    engine = "python"
+
+class TestPythonTemplate(template.TestTemplate):
+    cls = PythonTemplate
+
+class TestPythonFormatting(template.TestFormatting):
+    cls = PythonTemplate
+
+class TestPythonCTemplateSection(ctemplate.TestCTemplateSection):
+    cls = PythonCTemplate
+
+class TestPythonCTemplateInheritance(ctemplate.TestCTemplateInheritance):
+    cls = PythonCTemplate
+
+class TestPythonCompile(template.TestCompile):
+    cls = PythonTemplate
+
+class TestPythonConverters(template.TestConverters):
+    cls = PythonTemplate
+
+class TestPythonStreaming(template.TestStreaming):
+    cls = PythonTemplate
+
+class TestPythonRenderMany(template.TestRenderMany):
+    cls = PythonTemplate
+
+class TestPythonCTemplateModifiers(ctemplate.TestCTemplateModifiers):
+    cls = PythonCTemplate
+
+class TestPythonCTemplateGlobals(ctemplate.TestCTemplateGlobals):
+    cls = PythonCTemplate
+
+class TestPythonAutoescape(template.TestAutoescape):
+    cls = PythonTemplate
+
+class TestPythonFragments(template.TestFragments):
+    cls = PythonTemplate
+
+class TestPythonColumns(template.TestColumns):
+    cls = PythonTemplate
+
+class TestPythonRerender(template.TestRerender):
+    cls = PythonTemplate
+
+class TestPythonIncludes(loader.TestIncludes):
+    cls = PythonTemplate
+
+class TestGenerator(TemplateTest):
+    cls = PythonTemplate
+
+    def test_generate_loop(self):
+        source = Generator().generate(Formatter().compile("{#a}{b}{/a}"))
+        self.assertTrue("for data1 in rows(get('a')):" in source)
+
+    def test_converter(self):
+        templater = self.cls(template="{#a!u}{b!u}{/a}")
+        templater.formatter.converters["u"] = lambda s: str(s).upper()
+        self.assertEqual("XY", templater.render({"a": [{"b": "x"}, {"b": "y"}]}))
+
+    def test_builtin_conversion(self):
+        self.assertProduces("{a!r}", "'x'", {"a": "x"})
+
+    def test_field_attribute(self):
+        self.assertProduces("{a.real}", "1", {"a": 1})
+
+    def test_unknown_engine(self):
+        templater = Template(template="{a}")
+        templater.engine = "dne"
+        self.assertRaises(ValueError, templater.render, {})
+
+    def test_get_value_override(self):
+        class UpperFormatter(Formatter):
+            def get_value(self, field, args, scopes):
+                return scopes.get(field.upper(), '')
+        templater = self.cls(template="{a}")
+        templater.formatter = UpperFormatter()
+        self.assertEqual("x", templater.render({"A": "x"}))
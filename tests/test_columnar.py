@@ -0,0 +1,107 @@
+import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tests import BaseTest
+
+from ptemplate.columnar import Columns, formatcolumn
+from ptemplate.formatter import Formatter
+
+class TestColumns(BaseTest):
+
+    def setUp(self):
+        self.columns = Columns({"a": [1, 2, 3], "b": ("x", "y", "z")})
+
+    def test_len(self):
+        self.assertEqual(3, len(self.columns))
+        self.assertEqual(0, len(Columns({})))
+
+    def test_iter(self):
+        self.assertEqual([{"a": 1, "b": "x"}, {"a": 2, "b": "y"},
+            {"a": 3, "b": "z"}], list(self.columns))
+
+    def test_lengths(self):
+        self.assertRaises(ValueError, Columns, {"a": [1, 2], "b": [1]})
+
+    def test_not_sequences(self):
+        self.assertRaises(ValueError, Columns, {"a": "xyz"})
+        self.assertRaises(ValueError, Columns, {"a": [1], "b": 1})
+        self.assertRaises(ValueError, Columns, {"a": {"b": [1]}})
+
+    def test_section_record(self):
+        formatter = Formatter()
+        compiled = formatter.compile("{#user}{name}{/user}")
+        self.assertRaises(ValueError, formatter.formatsection, compiled,
+            {"user": {"name": "bob"}})
+        self.assertRaises(ValueError, formatter.formatsection, compiled,
+            {"user": {"name": "bob", "age": 30}})
+        self.assertEqual("bob", formatter.formatsection(compiled,
+            {"user": {"name": ["bob"]}}))
+
+    def test_slice(self):
+        self.assertEqual([{"a": 2, "b": "y"}], list(self.columns.slice(1, 2)))
+
+    def test_chunks(self):
+        chunks = [list(chunk) for chunk in self.columns.chunks(2)]
+        self.assertEqual([[{"a": 1, "b": "x"}, {"a": 2, "b": "y"}],
+            [{"a": 3, "b": "z"}]], chunks)
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class TestFormatColumn(BaseTest):
+    specs = [".2f", "g", "e", "10.1f", ",.2f", "+08.3f", "%", "d", "5d", "x"]
+
+    def assertFormats(self, column):
+        for spec in self.specs:
+            try:
+                expect = [format(value, spec) for value in column]
+            except ValueError:
+                continue
+            self.assertEqual(expect, formatcolumn(column, spec))
+
+    def test_floats(self):
+        column = numpy.array([0.0, -1.5, 1e20, 123.456, numpy.nan, numpy.inf])
+        self.assertFormats(column)
+        self.assertFormats(column.astype(numpy.float32))
+
+    def test_integers(self):
+        self.assertFormats(numpy.array([0, -1, 255, 10 ** 12]))
+        self.assertFormats(numpy.arange(10, dtype=numpy.uint8))
+
+    def test_empty(self):
+        self.assertEqual([], formatcolumn(numpy.array([]), ".2f"))
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class TestVectorize(BaseTest):
+
+    def setUp(self):
+        self.formatter = Formatter()
+        self.rows = Columns({"a": numpy.array([1.5, 2.25]), "b": ["x", "y"]})
+
+    def vectorize(self, string):
+        section = self.formatter.compile(string)[0]
+        return self.formatter.vectorize(section, self.rows)
+
+    def test_blocks(self):
+        self.formatter.blocksize = 1
+        section, rows = self.vectorize("{#r}<{a:.1f}>{/r}")
+        self.assertEqual([{":": "<1.5>"}, {":": "<2.2>"}], list(rows))
+
+    def test_vectorize(self):
+        section, rows = self.vectorize("{#r}{a:.1f}{b}{a:.1f}{/r}")
+        self.assertEqual(["a:0", "b", "a:0"],
+            [token.field for token in section.tokens])
+        self.assertEqual(["1.5", "2.2"], rows.columns["a:0"])
+
+    def test_unchanged(self):
+        for string in ["{#r}{a}{/r}", "{#r}{a!s:.1f}{/r}", "{#r}{b:>2}{/r}",
+                "{#r}{a.real:.1f}{/r}", "{#r}{#s}{a:.1f}{/s}{/r}"]:
+            section = self.formatter.compile(string)[0]
+            self.assertEqual((section, self.rows),
+                self.formatter.vectorize(section, self.rows))
+
+    def test_rows(self):
+        section = self.formatter.compile("{#r}{a:.1f}{/r}")[0]
+        rows = [{"a": 1.5}]
+        self.assertEqual((section, rows), self.formatter.vectorize(section, rows))
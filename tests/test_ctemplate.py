@@ -1,6 +1,7 @@
 from tests import TemplateTest
+from tests.test_loader import LoaderTest
 
-from ptemplate.ctemplate import CTemplate
+from ptemplate.ctemplate import CFormatter, CTemplate
 
 class TestCTemplate(TemplateTest):
     cls = CTemplate
@@ -12,7 +13,6 @@ class TestCTemplate(TemplateTest):
     # starting around line 400.
 
     def test_weird_syntax_triple_nested(self):
-        self.skipTest("needs better-than-naive preprocessor")
         self.assertProduces("hi {{{! VAR {{!VAR} }} lo", "hi { lo")
 
     def test_weird_syntax_triple(self):
@@ -20,7 +20,6 @@ class TestCTemplate(TemplateTest):
             "fn(){\n x=4;\n}")
 
     def test_weird_syntax_tons_of_brackets(self):
-        self.skipTest("needs better-than-naive preprocessor")
         self.assertProduces("{{{{{{VAR}}}}}}}}", "{{{{}}}}}}")
 
     def test_comment(self):
@@ -30,11 +29,52 @@ class TestCTemplate(TemplateTest):
         self.assertProduces("hi {{!VAR {VAR} }} lo", "hi  lo")
 
     def test_comment_nested_broken(self):
-        self.skipTest("needs better-than-naive preprocessor")
         self.assertProduces("hi {{! VAR {{!VAR} }} lo", "hi  lo")
 
+    def test_single_braces(self):
+        self.assertProduces("if (x) { y(); }", "if (x) { y(); }")
+
+    def test_format_spec(self):
+        self.assertProduces("->{{foo:^5}}<-", "->  a  <-", {"foo": "a"})
+
+    def test_conversion(self):
+        self.assertProduces("{{foo!r}}", "'a'", {"foo": "a"})
+
+    def test_comment_percent(self):
+        self.assertProduces("a{{% comment}}b", "ab")
+
+    def test_unterminated(self):
+        self.assertRaises(ValueError, self.cls(template="a {{b").render, {})
+
+    def test_tokenize(self):
+        tokens = list(CFormatter().tokenize("a{{#S}}b{{!c}}{{x!h:>3}}{{/S}}"))
+        self.assertEqual(("a", "S", "#S", "startsection", "", None), tokens[0])
+        self.assertEqual(("b", "c", "!c", "comment", "", None), tokens[1])
+        self.assertEqual(("", "x", "x", None, ">3", "h"), tokens[2])
+        self.assertEqual(("", "S", "/S", "endsection", "", None), tokens[3])
+        self.assertEqual(4, len(tokens))
+
     # Skipping TestSetMarkerDelimiters; no plans to support that feature.
 
+class TestCTemplateGlobals(TemplateTest):
+    cls = CTemplate
+
+    def test_globals_render_many(self):
+        templater = self.cls(template="{{A}}{{BI_SPACE}}{{B}}")
+        self.assertEqual(["1 2", "3 4"], list(templater.render_many(
+            [{"A": 1, "B": 2}, {"A": 3, "B": 4}])))
+
+    def test_globals_overridden(self):
+        self.assertProduces("{{BI_SPACE}}", "_", {"BI_SPACE": "_"})
+
+    def test_globals_generate(self):
+        templater = self.cls(template="a{{BI_NEWLINE}}b")
+        self.assertEqual("a\nb", "".join(templater.generate({})))
+
+    def test_globals_unchanged(self):
+        self.cls(template="{{A}}").render({"A": 1})
+        self.assertEqual(["BI_NEWLINE", "BI_SPACE"], sorted(CTemplate.globals))
+
 class TestCTemplateVariables(TemplateTest):
     cls = CTemplate
 
@@ -56,7 +96,107 @@ class TestCTemplateVariables(TemplateTest):
         self.data["var"] = "noyo3"
         self.assertProduces(self.input, "hi yoyo lo", self.data)
 
-    # Skipping TestVariableWithModifiers; modifiers should come eventually.
+class TestCTemplateModifiers(TemplateTest):
+    cls = CTemplate
+
+    def setUp(self):
+        self.data = {"VAR": "<a href='x'>\"\n&</a>"}
+
+    def test_html_escape(self):
+        expect = "&lt;a href=&#39;x&#39;&gt;&quot; &amp;&lt;/a&gt;"
+        self.assertProduces("{{VAR:html_escape}}", expect, self.data)
+        self.assertProduces("{{VAR:h}}", expect, self.data)
+
+    def test_pre_escape(self):
+        self.assertProduces("{{VAR:p}}", "&lt;a href=&#39;x&#39;&gt;&quot;\n&amp;&lt;/a&gt;",
+            self.data)
+
+    def test_javascript_escape(self):
+        self.assertProduces("{{VAR:j}}",
+            "\\x3ca href\\x3d\\x27x\\x27\\x3e\\x22\\n\\x26\\x3c/a\\x3e", self.data)
+
+    def test_json_escape(self):
+        self.assertProduces("{{VAR:json_escape}}",
+            "\\u003Ca href='x'\\u003E\\\"\\n\\u0026\\u003C\\/a\\u003E", self.data)
+        self.assertProduces("{{VAR:o:none}}",
+            "\\u003Ca href='x'\\u003E\\\"\\n\\u0026\\u003C\\/a\\u003E", self.data)
+
+    def test_url_query_escape(self):
+        self.assertProduces("{{VAR:u}}", "a+b%26c%3Dd/e", {"VAR": "a b&c=d/e"})
+
+    def test_url_escape_with_arg(self):
+        self.assertProduces("{{VAR:U=html}}", "#", {"VAR": "javascript:alert(1)"})
+        self.assertProduces("{{VAR:U=html}}", "http://x/?a=1&amp;b=2",
+            {"VAR": "http://x/?a=1&b=2"})
+
+    def test_snippet(self):
+        self.assertProduces("{{VAR:H=snippet}}", "<b>a&amp;b</b>&lt;p&gt;&nbsp;",
+            {"VAR": "<b>a&b</b><p>&nbsp;"})
+
+    def test_javascript_number(self):
+        self.assertProduces("{{A:J=number}} {{B:J=number}}", "1.5 null",
+            {"A": 1.5, "B": "alert(1)"})
+
+    def test_cleanse_css(self):
+        self.assertProduces("{{VAR:cleanse_css}}", "red bgexpression",
+            {"VAR": "red;} bg:expression("})
+
+    def test_format_types(self):
+        self.assertProduces("{{n:o}} {{n:c}}", "101 A", {"n": 65})
+
+    def test_chain(self):
+        self.assertProduces("{{VAR:h:j}}",
+            "\\x26lt;a href\\x3d\\x26#39;x\\x26#39;\\x26gt;\\x26quot; \\x26amp;\\x26lt;/a\\x26gt;",
+            self.data)
+        self.assertProduces("{{VAR:none:h:u}}", "%26lt%3Bb%26gt%3B", {"VAR": "<b>"})
+
+    def test_fused_at_compile(self):
+        templater = self.cls(template="{{#S}}{{VAR:h:j}}{{/S}}{{VAR:u}}")
+        templater.compile()
+        converters = dict(templater.formatter.converters)
+        self.assertTrue(":h:j" in converters and ":u" in converters)
+        templater.render({"S": [self.data], "VAR": "a b"})
+        self.assertEqual(converters, templater.formatter.converters)
+
+    def test_fused_pickle(self):
+        import pickle
+        templater = self.cls(template="{{VAR:h}}")
+        templater.compile()
+        formatter = pickle.loads(pickle.dumps(templater.formatter))
+        self.assertEqual("&lt;", formatter.formatsection(templater.compiled,
+            {"VAR": "<"}))
+        self.assertTrue(":h" in templater.formatter.converters)
+
+    def test_fused_cache(self):
+        import shutil, tempfile
+        from ptemplate.cache import DiskCache
+        directory = tempfile.mkdtemp()
+        try:
+            for compile in (True, False):
+                templater = self.cls(template="{{VAR:h}}")
+                templater.cache = DiskCache(directory)
+                if not compile:
+                    templater.formatter.compile = None
+                self.assertEqual("&lt;", templater.render({"VAR": "<"}))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_custom(self):
+        templater = self.cls(template="{{VAR:x-shout:h}}")
+        templater.formatter.modifiers["x-shout"] = lambda s: s.upper() + "!"
+        self.assertEqual("&lt;B&gt;!", templater.render({"VAR": "<b>"}))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, self.cls(template="{{VAR:x-unknown}}").render, {})
+        self.assertRaises(ValueError, self.cls(template="{{VAR:h:bogus}}").render, {})
+
+    def test_format_spec(self):
+        self.assertProduces("{{VAR:>4}}{{VAR:s}}", "   aa", {"VAR": "a"})
+
+    def test_section(self):
+        self.assertProduces("{{#S}}{{VAR:h}}{{/S}}", "&lt;&amp;",
+            {"S": [{"VAR": "<"}, {"VAR": "&"}]})
+
 
 class TestCTemplateSection(TemplateTest):
     cls = CTemplate
@@ -82,10 +222,75 @@ class TestCTemplateSection(TemplateTest):
     # Skipping TestSectionSeparator; separators probably won't be supported in
     # the language itself.
 
-    # Skipping TestInclude; include files probably wont' be supported in the
-    # language itself (though it'd be easy).
-    # Skipping TestIncludeWithModifiers; see above.
-    # Skipping TestRecursiveInclude; see above.
+class TestCTemplateInclude(LoaderTest):
+    cls = CTemplate
+
+    def setUp(self):
+        super(TestCTemplateInclude, self).setUp()
+        self.write("INC.html", "include file\n")
+        self.write("inc2.html", "inc2a\ninc2b\n")
+
+    def assertProduces(self, input, expect, data={}):
+        templater = self.cls(template=input)
+        templater.path = [self.directory]
+        self.assertEqual(expect, templater.render(data))
+
+    def test_include(self):
+        self.assertProduces("hi {{>INC}} bar\n", "hi include file\n bar\n")
+
+    def test_include_twice(self):
+        self.assertProduces("hi {{>INC}}{{>inc2}} bar",
+            "hi include file\ninc2a\ninc2b\n bar")
+
+    def test_include_section(self):
+        # Includes share the including template's dictionary, so a section
+        # stands in for ctemplate's include dictionaries.
+        self.write("row.html", "<{{VAR}}>")
+        self.assertProduces("hi {{#INC}}{{>row}}{{/INC}} bar", "hi <a><b> bar",
+            {"INC": [{"VAR": "a"}, {"VAR": "b"}]})
+
+    def test_include_missing(self):
+        templater = self.cls(template="hi {{>missing}} bar")
+        templater.path = [self.directory]
+        self.assertRaises(IOError, templater.render, {})
+
+    def test_include_syntax_error(self):
+        self.write("bad.html", "{{syntax_error")
+        templater = self.cls(template="hi {{>bad}} bar")
+        templater.path = [self.directory]
+        self.assertRaises(ValueError, templater.render, {})
+
+    # Includes are inlined when the template is compiled, so they can't have
+    # modifiers (TestIncludeWithModifiers); use them on the included fields.
+
+    def test_include_with_modifiers(self):
+        templater = self.cls(template="hi {{>INC:h}} bar")
+        templater.path = [self.directory]
+        self.assertRaises(ValueError, templater.render, {})
+
+    def test_included_modifiers(self):
+        self.write("esc.html", "{{VAR:h}} {{VAR}}")
+        self.assertProduces("hi {{>esc}} bar", "hi yo&amp;yo yo&yo bar",
+            {"VAR": "yo&yo"})
+
+class TestCTemplateRecursiveInclude(LoaderTest):
+    cls = CTemplate
+
+    # ctemplate expands a recursive include once (its include dictionary
+    # ends the recursion); inlined includes can't, so they're refused.
+
+    def test_recursive_include(self):
+        self.write("INC.html", "hi {{>INC}} bar\n  {{>INC}}!")
+        templater = self.cls(template="{{>INC}}")
+        templater.path = [self.directory]
+        self.assertRaises(ValueError, templater.compile)
+
+    def test_mutual_include(self):
+        self.write("a.html", "a{{>b}}")
+        self.write("b.html", "b{{#S}}{{>a}}{{/S}}")
+        templater = self.cls(template="{{>a}}")
+        templater.path = [self.directory]
+        self.assertRaises(ValueError, templater.compile)
 
 class TestCTemplateInheritance(TemplateTest):
     cls = CTemplate
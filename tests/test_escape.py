@@ -0,0 +1,115 @@
+from tests import BaseTest
+
+from ptemplate.escape import Lexer, autoescape, escapers
+from ptemplate.formatter import Formatter, Section
+
+class TestLexer(BaseTest):
+
+    def assertContext(self, context, text):
+        lexer = Lexer()
+        lexer.feed(text)
+        self.assertEqual(context, lexer.context)
+
+    def test_text(self):
+        self.assertContext("text", "")
+        self.assertContext("text", "<p class='a'>x < y")
+        self.assertContext("text", "<!-- <a href='")
+
+    def test_attribute(self):
+        self.assertContext("attribute", "<p class='")
+        self.assertContext("attribute", '<p title="a > b')
+        self.assertContext("attribute", "<p class=")
+        self.assertContext("attribute", "<p id=x class = 'a")
+
+    def test_url(self):
+        self.assertContext("url", "<a href='")
+        self.assertContext("url", "<IMG SRC=")
+        self.assertContext("urlpart", "<a href='/search?q=")
+
+    def test_script(self):
+        self.assertContext("script", "<script>var a = ")
+        self.assertContext("string", "<script>var a = '")
+        self.assertContext("string", "<script>var a = 'it\\'s ")
+        self.assertContext("script", "<script>var a = 'x', b = ")
+        self.assertContext("text", "<script>var a = 1;</script>")
+
+    def test_unescapable(self):
+        self.assertContext(None, "<p ")
+        self.assertContext(None, "<a onclick='")
+        self.assertContext(None, "<p style=")
+        self.assertContext(None, "<style>body { color: ")
+        self.assertContext("text", "<style>p {}</STYLE>")
+
+class TestEscapers(BaseTest):
+
+    def test_text(self):
+        self.assertEqual("&lt;a href=&#34;x&#34;&gt;&amp;&#39;",
+            escapers["text"]("<a href=\"x\">&'"))
+
+    def test_attribute(self):
+        self.assertEqual("a&#32;b&#61;&#96;c&#96;", escapers["attribute"]("a b=`c`"))
+
+    def test_url(self):
+        self.assertEqual("http://x/a%20b?c=d&amp;e",
+            escapers["url"]("http://x/a b?c=d&e"))
+        self.assertEqual("#", escapers["url"]("javascript:alert(1)"))
+        self.assertEqual("#", escapers["url"](" JavaScript:alert(1)"))
+        self.assertEqual("a%26b%3Dc%2Fd", escapers["urlpart"]("a&b=c/d"))
+
+    def test_script(self):
+        self.assertEqual("\\u0027\\u003c/script\\u003e\\\\",
+            escapers["string"]("'</script>\\"))
+        self.assertEqual('"\\u003c/script\\u003e"', escapers["script"]("</script>"))
+        self.assertEqual('{"a": [true, null]}', escapers["script"]({"a": [True, None]}))
+
+    def test_numbers(self):
+        for escaper in escapers.values():
+            self.assertEqual(1.5, escaper(1.5))
+
+class TestAutoescape(BaseTest):
+
+    def conversions(self, string):
+        nodes = autoescape(Formatter().compile(string))
+        conversions = []
+        for node in nodes:
+            if isinstance(node, Section):
+                conversions.extend(t.conversion for t in node.tokens
+                    if not isinstance(t, str))
+            elif not isinstance(node, str):
+                conversions.append(node.conversion)
+        return conversions
+
+    def test_autoescape(self):
+        self.assertEqual(["attribute", "text", "url", "text", "urlpart"],
+            self.conversions("<p class='{a}'>{b}<a href='{c}'>{d}</a><a href='/?q={e}'>"))
+
+    def test_section(self):
+        self.assertEqual(["attribute", "text", "text"],
+            self.conversions("{#s}<li id='{a}'>{b}{/s}{c}"))
+
+    def test_conversion(self):
+        self.assertEqual(["s", "text"], self.conversions("{a!s}{b}"))
+
+    def test_unescapable(self):
+        self.assertRaises(ValueError, self.conversions, "<p {a}>")
+        self.assertRaises(ValueError, self.conversions, "<a onclick='{a}'>")
+        self.assertRaises(ValueError, self.conversions, "<style>{a}</style>")
+
+    def test_section_context(self):
+        self.assertRaises(ValueError, self.conversions,
+            "<script>var a = 1;{#c}</script>{/c}{y}")
+        self.assertRaises(ValueError, self.conversions,
+            "{#rows}<a title=\"{/rows}{y}\">")
+        self.assertEqual(["attribute"],
+            self.conversions("<a{#s} class='x'{/s} title='{y}'>"))
+
+    def test_section_url(self):
+        self.assertEqual(["urlpart", "urlpart"],
+            self.conversions("<a href='{#s}x{/s}{y}'><a href='x{#s}{/s}{z}'>"))
+
+    def test_precision(self):
+        self.assertRaises(ValueError, self.conversions, "<p>{n:.3}</p>")
+        self.assertRaises(ValueError, self.conversions, "<p>{n:>9.3s}</p>")
+        self.assertRaises(ValueError, self.conversions, "<p>{n:.{p}}</p>")
+        self.assertEqual(["text", "text", "s"],
+            self.conversions("<p>{n:.2f}{n:>{w}}{n!s:.3}</p>"))
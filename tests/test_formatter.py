@@ -0,0 +1,201 @@
+from tests import BaseTest
+
+from ptemplate.formatter import Formatter, Scopes
+
+class TestScopes(BaseTest):
+
+    def test_innermost(self):
+        scopes = Scopes({"a": 1}, {"a": 2})
+        self.assertEqual(2, scopes.get("a"))
+
+    def test_enclosing(self):
+        scopes = Scopes({"a": 1, "b": 1}, {"b": 2})
+        self.assertEqual(1, scopes.get("a"))
+
+    def test_missing(self):
+        scopes = Scopes({"a": 1})
+        self.assertEqual('', scopes.get("b"))
+        self.assertEqual(None, scopes.get("b", None))
+        self.assertEqual('', Scopes().get("b"))
+
+    def test_empty_string_falls_through(self):
+        scopes = Scopes({"a": 1}, {"a": ''})
+        self.assertEqual(1, scopes.get("a"))
+
+    def test_push_pop(self):
+        scopes = Scopes({"a": 1})
+        self.assertEqual(1, scopes.get("a"))
+        scopes.push({"a": 2})
+        self.assertEqual(2, scopes.get("a"))
+        self.assertEqual({"a": 2}, scopes.pop())
+        self.assertEqual(1, scopes.get("a"))
+
+    def test_memo(self):
+        outer = {"a": 1}
+        scopes = Scopes(outer)
+        scopes.push({})
+        self.assertEqual(1, scopes.get("a"))
+        scopes.pop()
+        scopes.push({})
+        self.assertEqual(1, scopes.get("a"))
+        self.assertEqual({"a": 1}, scopes.memos[0])
+
+class TestFormatter(BaseTest):
+
+    def test_nested_spec(self):
+        formatter = Formatter()
+        self.assertEqual("  a", formatter.format("{a:>{w}}", a="a", w=3))
+
+    def test_constant_spec(self):
+        token = Formatter().compile("{a:>3}")[0]
+        self.assertEqual(">3", token.spec)
+
+    def test_dynamic_spec(self):
+        token = Formatter().compile("{a:>{w}}")[0]
+        self.assertEqual(">", token.spec[0])
+        self.assertEqual("w", token.spec[1].field)
+
+    def test_section_in_spec(self):
+        self.assertRaises(ValueError, Formatter().compile, "{a:{#s}{/s}}")
+
+    def test_cached_section(self):
+        formatter = Formatter()
+        plain, cached, keyed = formatter.compile("{#a}x{/a}{@a}x{/a}{@a:k}x{/a}")
+        self.assertEqual(None, plain.cache)
+        self.assertEqual('', cached.cache[1])
+        self.assertEqual(('k', ''), (keyed.cache[1], keyed.format))
+        self.assertNotEqual(cached.cache[0], keyed.cache[0])
+
+    def test_include(self):
+        formatter = Formatter()
+        formatter.includes = {"inner": "<{a}>", "outer": "{#s}{>inner}{/s}!"}.get
+        compiled = formatter.compile("x{>outer}y")
+        self.assertEqual("x", compiled[0])
+        self.assertEqual("!y", compiled[-1])
+        self.assertEqual("x<1><2>!y",
+            formatter.formatsection(compiled, {"s": [{"a": 1}, {"a": 2}]}))
+
+    def test_include_cycle(self):
+        formatter = Formatter()
+        formatter.includes = {"a": "{>b}", "b": "{>a}"}.get
+        self.assertRaises(ValueError, formatter.compile, "{>a}")
+
+    def test_include_errors(self):
+        formatter = Formatter()
+        self.assertRaises(ValueError, formatter.compile, "{>a}")
+        formatter.includes = {"a": "a"}.get
+        self.assertRaises(ValueError, formatter.compile, "{>a!r}")
+        self.assertRaises(ValueError, formatter.compile, "{>a:>3}")
+
+    def test_fields(self):
+        formatter = Formatter()
+        fields = formatter.fields(formatter.compile(
+            "{t}{u.name}{u.mail}{a[0].b}{#s}{c:{w}}{#i}{d}{/i}{/s}{#s}{e}{/s}"
+            "{#x}x{/x}{@n:k}{f}{/n}"))
+        self.assertEqual({
+            "t": None,
+            "u": {"name": None, "mail": None},
+            "a": None,
+            "s": {"c": None, "w": None, "i": {"d": None}, "d": None, "e": None},
+            "c": None, "w": None, "i": {"d": None}, "d": None, "e": None,
+            "x": {},
+            "k": None,
+            "n": {"f": None}, "f": None,
+        }, fields)
+
+    def test_fields_merged(self):
+        formatter = Formatter()
+        self.assertEqual({"s": {"a": None, "b": None}, "a": None, "b": None},
+            formatter.fields(formatter.compile("{#s}{a}{/s}{#s}{b}{/s}")))
+        self.assertEqual({"u": {"a": None, "b": None}, "b": None},
+            formatter.fields(formatter.compile("{u.a}{#u}{b}{/u}")))
+
+    def test_fields_whole(self):
+        formatter = Formatter()
+        for template in ("{a}{a.b}", "{a.b}{a}"):
+            self.assertEqual({"a": None},
+                formatter.fields(formatter.compile(template)))
+        for template in ("{#a}{b}{/a}{a}", "{a}{#a}{b}{/a}"):
+            self.assertEqual({"a": None, "b": None},
+                formatter.fields(formatter.compile(template)))
+
+    def test_fields_enclosing(self):
+        formatter = Formatter()
+        compiled = formatter.compile("{#rows}{title}:{v} {/rows}")
+        fields = formatter.fields(compiled)
+        self.assertEqual({"rows": {"title": None, "v": None},
+            "title": None, "v": None}, fields)
+        data = {"title": "T", "rows": [{"v": 1}], "extra": "x"}
+        projected = dict((k, v) for k, v in data.items() if k in fields)
+        self.assertEqual("T:1 ", formatter.formatsection(compiled, data))
+        self.assertEqual(formatter.formatsection(compiled, data),
+            formatter.formatsection(compiled, projected))
+
+    def test_scope_restored(self):
+        formatter = Formatter()
+        scopes = Scopes()
+        formatter.formatsection(formatter.compile("{#s}{a}{/s}"),
+            {"s": [{"a": 1}]}, scopes)
+        self.assertEqual([], scopes.maps)
+
+class TestParallel(BaseTest):
+
+    def setUp(self):
+        self.formatter = Formatter()
+        self.formatter.chunksize = 10
+        self.data = {"title": "t", "rows": [{"i": i} for i in range(95)]}
+        self.template = self.formatter.compile("{#rows}{title}{i} {/rows}")
+        self.output = "".join("t%d " % i for i in range(95))
+
+    def render(self, executor, data=None):
+        self.formatter.executor = executor
+        try:
+            return self.formatter.formatsection(self.template, data or self.data)
+        finally:
+            executor.shutdown()
+
+    def test_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.assertEqual(self.output, self.render(ThreadPoolExecutor(4)))
+
+    def test_processes(self):
+        from concurrent.futures import ProcessPoolExecutor
+        self.assertEqual(self.output, self.render(ProcessPoolExecutor(2)))
+
+    def test_iterator(self):
+        from concurrent.futures import ThreadPoolExecutor
+        data = dict(self.data, rows=iter(self.data["rows"]))
+        self.assertEqual(self.output, self.render(ThreadPoolExecutor(4), data))
+
+    def test_columns(self):
+        from concurrent.futures import ThreadPoolExecutor
+        data = dict(self.data, rows={"i": list(range(95))})
+        self.assertEqual(self.output, self.render(ThreadPoolExecutor(4), data))
+
+    def test_nested_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.formatter.chunksize = 2
+        template = self.formatter.compile("{#a}[{#b}{x}{/b}]{/a}")
+        data = {"a": [{"b": [{"x": i} for i in range(10)]} for _ in range(10)]}
+        executor = ThreadPoolExecutor(2)
+        self.formatter.executor = executor
+        try:
+            future = executor.submit(self.formatter.formatsection, template, data)
+            self.assertEqual("[0123456789]" * 10, future.result(timeout=10))
+        finally:
+            executor.shutdown(wait=False)
+
+    def test_small_section(self):
+        class Executor(object):
+            def submit(self, *args):
+                raise AssertionError("small sections are rendered serially")
+            def shutdown(self):
+                pass
+        data = dict(self.data, rows=self.data["rows"][:9])
+        self.assertEqual("".join("t%d " % i for i in range(9)),
+            self.render(Executor(), data))
+
+    def test_names(self):
+        names = self.formatter.names(
+            self.formatter.compile("{a.b}{#s}{c[0]:{w}}{/s}"))
+        self.assertEqual(set(["a", "s", "c", "w"]), names)
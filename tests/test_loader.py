@@ -0,0 +1,257 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from tests import BaseTest
+
+from ptemplate.ctemplate import CTemplate
+from ptemplate.loader import Loader
+from ptemplate.template import Template
+
+class LoaderTest(BaseTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source, mtime=None):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(source)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+class TestLoader(LoaderTest):
+
+    def setUp(self):
+        super(TestLoader, self).setUp()
+        self.write("index.html", "{a}")
+        self.write("pages/about.html", "about {a}")
+        self.write("pages/notes.txt", "notes")
+        self.loader = Loader([self.directory])
+
+    def test_file_name(self):
+        template = self.loader.load("index.html")
+        self.assertEqual("1", template.render({"a": 1}))
+
+    def test_dotted_name(self):
+        self.assertEqual("about 1", self.loader.load("pages.about").render({"a": 1}))
+        self.assertEqual("notes", self.loader.load("pages.notes").render({}))
+
+    def test_search_path(self):
+        other = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(other, "index.html"), 'w') as f:
+                f.write("other")
+            with open(os.path.join(other, "extra.html"), 'w') as f:
+                f.write("extra")
+            loader = Loader([self.directory, other])
+            self.assertEqual("1", loader.load("index").render({"a": 1}))
+            self.assertEqual("extra", loader.load("extra").render({}))
+        finally:
+            shutil.rmtree(other)
+
+    def test_package(self):
+        package = os.path.join(self.directory, "loaderpackage")
+        self.write("loaderpackage/__init__.py", "")
+        self.write("loaderpackage/page.html", "package {a}")
+        sys.path.insert(0, self.directory)
+        try:
+            loader = Loader()
+            self.assertEqual(os.path.join(package, "page.html"),
+                loader.find("loaderpackage.page"))
+        finally:
+            sys.path.remove(self.directory)
+            sys.modules.pop("loaderpackage", None)
+
+    def test_missing(self):
+        self.assertRaises(IOError, self.loader.load, "missing")
+        self.assertRaises(IOError, self.loader.load, "../index.html")
+
+    def test_cached(self):
+        template = self.loader.load("index")
+        self.write("index.html", "changed")
+        self.assertTrue(template is self.loader.load("index"))
+
+    def test_maxsize(self):
+        loader = Loader([self.directory], maxsize=1)
+        template = loader.load("index")
+        loader.load("pages.about")
+        self.assertEqual(1, len(loader.cache))
+        self.assertFalse(template is loader.load("index"))
+
+    def test_maxbytes(self):
+        loader = Loader([self.directory], maxbytes=11)
+        loader.load("index")
+        loader.load("pages.about")
+        self.assertEqual(["pages.about"], list(loader.cache.items))
+        self.assertEqual(9, loader.cache.weight)
+
+    def test_factory(self):
+        loader = Loader([self.directory], CTemplate)
+        self.write("c.html", "{{a}}")
+        self.assertEqual("1", loader.load("c").render({"a": 1}))
+
+    def test_single_flight(self):
+        compiled = []
+        started = threading.Event()
+        release = threading.Event()
+        class SlowTemplate(Template):
+            def compile(self):
+                compiled.append(self)
+                started.set()
+                release.wait(5)
+                return super(SlowTemplate, self).compile()
+
+        loader = Loader([self.directory], SlowTemplate)
+        results = []
+        def load():
+            results.append(loader.load("index"))
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(compiled))
+        self.assertEqual(8, len(results))
+        self.assertTrue(all(result is compiled[0] for result in results))
+        self.assertEqual({}, loader.flights)
+
+    def test_single_flight_error(self):
+        class BrokenTemplate(Template):
+            def compile(self):
+                raise ValueError("broken")
+        loader = Loader([self.directory], BrokenTemplate)
+        self.assertRaises(ValueError, loader.load, "index")
+        self.assertEqual({}, loader.flights)
+        self.assertEqual(0, len(loader.cache))
+
+class TestReload(LoaderTest):
+
+    def setUp(self):
+        super(TestReload, self).setUp()
+        self.now = 0
+        self.loader = Loader([self.directory], interval=10)
+        self.loader.clock = lambda: self.now
+        self.write("index.html", "old", mtime=1000)
+
+    def test_reload(self):
+        self.assertEqual("old", self.loader.load("index").render({}))
+        self.write("index.html", "new", mtime=2000)
+        self.now = 5
+        self.assertEqual("old", self.loader.load("index").render({}))
+        self.now = 10
+        self.assertEqual("new", self.loader.load("index").render({}))
+
+    def test_unchanged(self):
+        template = self.loader.load("index")
+        self.now = 100
+        self.assertTrue(template is self.loader.load("index"))
+
+    def test_every_load(self):
+        self.loader.interval = 0
+        self.loader.load("index")
+        self.write("index.html", "new", mtime=2000)
+        self.assertEqual("new", self.loader.load("index").render({}))
+
+class TestLoadTemplate(LoaderTest):
+
+    def setUp(self):
+        super(TestLoadTemplate, self).setUp()
+        self.write("page.html", "<{a!h}>")
+
+    def test_load_template(self):
+        engine = Template()
+        engine.path = [self.directory]
+        engine.converters["h"] = lambda value: value.upper()
+        template = engine.load_template("page")
+        self.assertEqual("<X>", template.render({"a": "x"}))
+        self.assertTrue(template is engine.load_template("page"))
+        self.assertFalse(template.formatter is engine.formatter)
+
+    def test_options(self):
+        engine = Template(options={"ptemplate.path": [self.directory]})
+        engine.converters["h"] = str.upper
+        self.assertEqual("<X>", engine.render({"a": "x"}, template="page"))
+
+    def test_engine(self):
+        engine = Template()
+        engine.path = [self.directory]
+        engine.engine = "python"
+        engine.converters["h"] = str.upper
+        template = engine.load_template("page")
+        self.assertEqual("python", template.engine)
+        self.assertEqual("<X>", template.render({"a": "x"}))
+
+class TestIncludes(LoaderTest):
+    cls = Template
+
+    def setUp(self):
+        super(TestIncludes, self).setUp()
+        self.write("header.html", "<h1>{title}</h1>")
+        self.write("parts/item.html", "<li>{item}</li>")
+
+    def templater(self, template):
+        templater = self.cls(template=template)
+        templater.path = [self.directory]
+        return templater
+
+    def test_include(self):
+        templater = self.templater("{>header}<ul>{#items}{>parts.item}{/items}</ul>")
+        self.assertEqual("<h1>t</h1><ul><li>a</li><li>b</li></ul>",
+            templater.render({"title": "t", "items": [{"item": "a"}, {"item": "b"}]}))
+        self.assertEqual(set(["header", "parts.item"]), set(templater.included))
+
+    def test_fields(self):
+        templater = self.templater("{>header}<ul>{#items}{>parts.item}{/items}</ul>")
+        self.assertEqual({"title": None, "items": {"item": None}, "item": None},
+            templater.fields())
+
+    def test_inlined(self):
+        templater = self.templater("a{>header}b")
+        self.assertEqual(["a<h1>", "</h1>b"],
+            [node for node in templater.compile() if isinstance(node, str)])
+
+    def test_nested(self):
+        self.write("page.html", "[{>header}]")
+        templater = self.templater("{>page}")
+        self.assertEqual("[<h1>t</h1>]", templater.render({"title": "t"}))
+
+    def test_cycle(self):
+        self.write("a.html", "{>b}")
+        self.write("b.html", "{>a}")
+        self.assertRaises(ValueError, self.templater("{>a}").compile)
+
+    def test_missing(self):
+        self.assertRaises(IOError, self.templater("{>missing}").compile)
+
+    def test_autoescape(self):
+        self.write("link.html", '<a href="{url}">')
+        templater = self.templater("{>link}{text}")
+        templater.autoescape = True
+        self.assertEqual('<a href="#">&lt;', templater.render(
+            {"url": "javascript:x", "text": "<"}))
+
+    def test_reload(self):
+        self.write("page.html", "[{>header}]", mtime=1000)
+        self.write("header.html", "old", mtime=1000)
+        loader = Loader([self.directory], self.cls, interval=0)
+        self.assertEqual("[old]", loader.load("page").render({}))
+        self.write("header.html", "new", mtime=2000)
+        self.assertEqual("[new]", loader.load("page").render({}))
+
+    def test_ctemplate(self):
+        self.write("c.html", "<{{title:h}}>")
+        templater = CTemplate(template="{{>c}}{{!comment}}")
+        templater.path = [self.directory]
+        self.assertEqual("<&lt;>", templater.render({"title": "<"}))
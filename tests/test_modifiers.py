@@ -0,0 +1,28 @@
+from tests import BaseTest
+
+from ptemplate import modifiers
+from ptemplate.modifiers import Table, fuse
+
+class TestModifiers(BaseTest):
+
+    def test_then(self):
+        table = Table({ord('a'): "b"}).then(Table({ord('b'): "c"}))
+        self.assertEqual("cc", table("ab"))
+
+    def test_fuse(self):
+        value = "<a href='x'>\"\n&\\</a>\u2028"
+        for chain in (["h", "j"], ["p", "o"], ["j", "h", "p"], ["h", "u", "j"]):
+            expect = value
+            for name in chain:
+                expect = modifiers.modifiers[modifiers.canonical(name)](expect)
+            self.assertEqual(expect, fuse(chain)(value))
+
+    def test_fuse_tables(self):
+        # Adjacent tables become one step.
+        self.assertEqual("&amp;lt;", fuse(["h", "h"])("<"))
+        self.assertEqual("1", fuse(["h"])(1))
+
+    def test_canonical(self):
+        self.assertEqual("html_escape", modifiers.canonical("h"))
+        self.assertEqual("url_escape_with_arg=html", modifiers.canonical("U=html"))
+        self.assertEqual("x-foo=bar", modifiers.canonical("x-foo=bar"))
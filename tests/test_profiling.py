@@ -0,0 +1,100 @@
+import io
+
+from tests import TemplateTest
+
+from ptemplate.ctemplate import CTemplate
+from ptemplate.formatter import Formatter
+from ptemplate.profiling import Profile, Profiling
+from ptemplate.template import Template
+
+class TestProfile(TemplateTest):
+    cls = Template
+    source = "{title!h}{#rows}<{a}{title}>{#inner}{b}{/inner}{/rows}"
+
+    def setUp(self):
+        self.templater = self.cls(template=self.source)
+        self.templater.converters["h"] = str.upper
+        self.profile = self.templater.profile = Profile()
+        self.data = {"title": "x", "rows": [{"a": 1, "inner": [{"b": 2}]}, {"a": 3}]}
+
+    def test_render(self):
+        self.assertEqual("X<1x>2<3x>", self.templater.render(self.data))
+        self.assertEqual(1, self.profile.renders)
+        self.assertEqual(10, self.profile.size)
+        self.assertTrue(self.profile.time > 0)
+
+    def test_sections(self):
+        self.templater.render(self.data)
+        rows = self.profile.sections["rows"]
+        self.assertEqual((1, 2, 9), (rows.calls, rows.items, rows.size))
+        inner = self.profile.sections["inner"]
+        self.assertEqual((2, 1, 1), (inner.calls, inner.items, inner.size))
+        self.assertTrue(rows.time >= inner.time)
+
+    def test_fields(self):
+        self.templater.render(self.data)
+        fields = self.profile.fields
+        self.assertEqual(3, fields["title"].calls)
+        self.assertEqual(2, fields["title"].items)
+        self.assertEqual(0, fields["a"].items)
+
+    def test_converters(self):
+        self.templater.render(self.data)
+        self.assertEqual(["h"], list(self.profile.converters))
+        self.assertEqual(1, self.profile.converters["h"].calls)
+
+    def test_accumulates(self):
+        self.templater.render(self.data)
+        self.templater.render(self.data)
+        self.assertEqual(2, self.profile.renders)
+        self.assertEqual(4, self.profile.sections["rows"].items)
+        self.profile.clear()
+        self.assertEqual(0, self.profile.renders)
+        self.assertEqual({}, dict(self.profile.sections))
+
+    def test_generate(self):
+        output = io.StringIO()
+        self.templater.render_to(self.data, output)
+        self.assertEqual("X<1x>2<3x>", output.getvalue())
+        self.assertEqual((1, 10), (self.profile.renders, self.profile.size))
+
+    def test_render_many(self):
+        self.assertEqual(["X", "Y"], list(self.templater.render_many(
+            [{"title": "x"}, {"title": "y"}])))
+        self.assertEqual(2, self.profile.renders)
+
+    def test_engine(self):
+        self.templater.engine = "python"
+        self.assertEqual("X<1x>2<3x>", self.templater.render(self.data))
+        self.assertEqual(2, self.profile.sections["rows"].items)
+
+    def test_disabled(self):
+        self.templater.profile = None
+        self.assertEqual("X<1x>2<3x>", self.templater.render(self.data))
+        self.assertEqual(0, self.profile.renders)
+        self.assertFalse(isinstance(self.templater.formatter, Profiling))
+
+    def test_report(self):
+        self.templater.render(self.data)
+        report = self.profile.report()
+        self.assertTrue(report.startswith("1 renders in "))
+        self.assertTrue("rows" in report)
+        self.assertTrue("title" in report)
+
+    def test_ctemplate(self):
+        templater = CTemplate(template="{{#s}}{{a:h}}{{/s}}")
+        templater.profile = profile = Profile()
+        self.assertEqual("&lt;", templater.render({"s": [{"a": "<"}]}))
+        self.assertEqual(1, profile.converters[":h"].calls)
+
+class TestProfiled(TemplateTest):
+
+    def test_copy(self):
+        formatter = Formatter()
+        formatter.executor = object()
+        profiled = formatter.profiled(Profile())
+        self.assertTrue(isinstance(profiled, Formatter))
+        self.assertTrue(isinstance(profiled, Profiling))
+        self.assertEqual(None, profiled.executor)
+        self.assertFalse(isinstance(formatter, Profiling))
+        self.assertTrue(type(profiled) is type(Formatter().profiled(Profile())))
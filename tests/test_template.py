@@ -1,3 +1,9 @@
+import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from tests import ModifierTest, TemplateTest
 
 from ptemplate.template import Template
@@ -67,6 +73,13 @@ class TestTemplate(TemplateTest):
             "end"])
         self.assertProduces(input, output, data)
 
+    def test_sections_iterator(self):
+        def rows():
+            for i in range(3):
+                yield {"i": i, "inner": ({"j": j} for j in range(i))}
+        input = "{#rows}{i}:{#inner}{j}{/inner} {/rows}"
+        self.assertProduces(input, "0: 1:0 2:01 ", {"rows": rows()})
+
     def test_sections_nodata(self):
         data = {}
         input = '\n'.join([
@@ -143,8 +156,416 @@ class TestFormatting(TemplateTest):
         output = "->  center this  <-"
         self.assertProduces(input, output, data)
     
+    def test_variable_formatting_nested(self):
+        input = """->{foo:^{width}}<-"""
+        data = {"foo": "center this", "width": 15}
+        output = "->  center this  <-"
+        self.assertProduces(input, output, data)
+
+    def test_variable_formatting_nested_scope(self):
+        input = """{#rows}{price:.{digits}f} {/rows}"""
+        data = {"digits": 2, "rows": [{"price": 1}, {"price": 2.5, "digits": 1}]}
+        output = "1.00 2.5 "
+        self.assertProduces(input, output, data)
+
     def test_section_formatting(self):
         input = """->{#section:^5}|{foo}|{/section}<-"""
         data = {"section": [{"foo": "a"},{"foo": "b"},{"foo": "c"}]}
         output = "-> |a|  |b|  |c| <-"
         self.assertProduces(input, output, data)
+
+class TestCompile(TemplateTest):
+    cls = Template
+
+    def test_compile_once(self):
+        templater = self.cls(template="{#a}{b}{/a}")
+        compiled = templater.compile()
+        templater.render({"a": [{"b": 1}]})
+        self.assertTrue(templater.compiled is compiled)
+
+    def test_compile_template_changed(self):
+        templater = self.cls(template="{foo}")
+        self.assertEqual("bar", templater.render({"foo": "bar"}))
+        templater.template = "<{foo}>"
+        self.assertEqual("<bar>", templater.render({"foo": "bar"}))
+
+    def test_compile_tree(self):
+        tree = self.cls().formatter.compile("a{%c}b{#s}c{f}{/s}d")
+        self.assertEqual("ab", tree[0])
+        self.assertEqual("s", tree[1].name)
+        self.assertEqual("c", tree[1].tokens[0])
+        self.assertEqual("f", tree[1].tokens[1].field)
+        self.assertEqual("d", tree[2])
+
+    def test_compile_unterminated_section(self):
+        self.assertRaises(ValueError, self.cls(template="{#a}").render, {})
+
+    def test_compile_mismatched_section(self):
+        self.assertRaises(ValueError, self.cls(template="{#a}{/b}").render, {})
+
+    def test_compile_unmatched_end(self):
+        self.assertRaises(ValueError, self.cls(template="{/a}").render, {})
+
+class TestConverters(TemplateTest):
+    cls = Template
+
+    def test_converters_per_template(self):
+        one = self.cls(template="{a!h}")
+        two = self.cls(template="{a!h}")
+        one.converters["h"] = lambda v: "one"
+        two.converters["h"] = lambda v: "two"
+        self.assertEqual("one", one.render({"a": 1}))
+        self.assertEqual("two", two.render({"a": 1}))
+        self.assertEqual({}, Template.converters)
+        self.assertEqual({}, one.formatter.__class__.converters)
+
+    def test_converters_bound_at_compile(self):
+        templater = self.cls(template="{a!h}")
+        templater.converters["h"] = lambda v: "before"
+        self.assertEqual("before", templater.render({"a": 1}))
+        templater.converters["h"] = lambda v: "after"
+        self.assertEqual("before", templater.render({"a": 1}))
+        templater.compile()
+        self.assertEqual("after", templater.render({"a": 1}))
+
+    def test_converters_threads(self):
+        import threading
+        templaters = []
+        for i in range(4):
+            templater = self.cls(template="{#rows}{a!h}{/rows}")
+            templater.converters["h"] = lambda v, i=i: str(i)
+            templaters.append(templater)
+        data = {"rows": [{"a": 1}] * 1000}
+        results = {}
+        def render(i):
+            results[i] = [templaters[i].render(data) for n in range(5)]
+        threads = [threading.Thread(target=render, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(4):
+            self.assertEqual([str(i) * 1000] * 5, results[i])
+
+    def test_converters_memo(self):
+        from ptemplate.util import LRU
+        calls = []
+        def upper(value):
+            calls.append(value)
+            return str(value).upper()
+        templater = self.cls(template="{#rows}{a!u}{a!u:>2}{/rows}{b!u}")
+        templater.converters["u"] = upper
+        templater.formatter.memo = LRU(10)
+        data = {"rows": [{"a": "x"}, {"a": "y"}, {"a": "x"}, {"a": 1},
+            {"a": True}, {"a": [1]}], "b": "x"}
+        self.assertEqual("X XY YX X1 1TRUETRUE[1][1]X", templater.render(data))
+        self.assertEqual(["x", "y", 1, True, [1], [1]], calls)
+        self.assertEqual(7, templater.formatter.memo.hits)
+        self.assertEqual(4, templater.formatter.memo.misses)
+
+class TestAutoescape(TemplateTest):
+    cls = Template
+
+    def assertProduces(self, input, expect, kwargs={}, args=()):
+        templater = self.cls(template=input)
+        templater.autoescape = True
+        self.assertEqual(expect, templater.render(kwargs))
+
+    def test_autoescape(self):
+        self.assertProduces("<p title='{a}'>{a}</p>",
+            "<p title='&lt;b&gt;&#32;&amp;'>&lt;b&gt; &amp;</p>", {"a": "<b> &"})
+
+    def test_autoescape_url(self):
+        self.assertProduces("<a href='{u}?q={q}'>", "<a href='#?q=a%26b'>",
+            {"u": "javascript:x", "q": "a&b"})
+
+    def test_autoescape_script(self):
+        self.assertProduces("<script>f({a}, '{b}')</script>{b}",
+            "<script>f([1, \"\\u003c\"], '\\u0027')</script>&#39;",
+            {"a": [1, "<"], "b": "'"})
+
+    def test_autoescape_section(self):
+        self.assertProduces("<ul>{#items}<li>{item:.1f} {name}</li>{/items}</ul>",
+            "<ul><li>1.5 &lt;a&gt;</li><li>2.0 b</li></ul>",
+            {"items": [{"item": 1.5, "name": "<a>"}, {"item": 2, "name": "b"}]})
+
+    def test_autoescape_bypass(self):
+        self.assertProduces("{a!s}{a}", "<b>&lt;b&gt;", {"a": "<b>"})
+
+    def test_autoescape_converters(self):
+        templater = self.cls(template="{a}")
+        templater.autoescape = True
+        templater.converters["text"] = lambda v: "custom"
+        self.assertEqual("custom", templater.render({"a": "<"}))
+
+    def test_autoescape_bound(self):
+        templater = self.cls(template="{#s}<p title='{a}'>{a}</p>{/s}")
+        templater.autoescape = True
+        templater.compile()
+        def convert_field(value, conversion):
+            raise AssertionError("escapers are bound when compiling")
+        templater.formatter.convert_field = convert_field
+        self.assertEqual("<p title='&lt;'>&lt;</p>",
+            templater.render({"s": [{"a": "<"}]}))
+
+class TestFragments(TemplateTest):
+    cls = Template
+
+    def setUp(self):
+        from ptemplate.util import LRU
+        self.templater = self.cls(
+            template="<{@nav}{title}{/nav}|{@side:version}{item!u}{/side}>")
+        self.templater.converters["u"] = self.count
+        self.templater.formatter.fragments = LRU(10, ttl=60)
+        self.calls = 0
+
+    def count(self, value):
+        self.calls += 1
+        return str(value).upper()
+
+    def test_fragments(self):
+        data = {"nav": [{"title": "a"}], "side": [{"item": "x"}, {"item": "y"}],
+            "version": 1}
+        self.assertEqual("<a|XY>", self.templater.render(data))
+        self.assertEqual("<a|XY>", self.templater.render(data))
+        self.assertEqual(2, self.calls)
+        self.assertEqual(2, self.templater.formatter.fragments.hits)
+
+    def test_fragments_data(self):
+        data = {"nav": [{"title": "a"}], "side": [], "version": 1}
+        self.assertEqual("<a|>", self.templater.render(data))
+        data["nav"] = [{"title": "b"}]
+        self.assertEqual("<b|>", self.templater.render(data))
+
+    def test_fragments_outer(self):
+        self.templater.template = "{@nav}{title}{/nav}"
+        self.assertEqual("a", self.templater.render({"nav": [{}], "title": "a"}))
+        self.assertEqual("b", self.templater.render({"nav": [{}], "title": "b"}))
+
+    def test_fragments_key(self):
+        data = {"nav": [], "side": [{"item": "x"}], "version": 1}
+        self.assertEqual("<|X>", self.templater.render(data))
+        data["side"] = [{"item": "y"}]
+        self.assertEqual("<|X>", self.templater.render(data))
+        data["version"] = 2
+        self.assertEqual("<|Y>", self.templater.render(data))
+
+    def test_fragments_ttl(self):
+        fragments = self.templater.formatter.fragments
+        now = [0]
+        fragments.clock = lambda: now[0]
+        data = {"nav": [], "side": [{"item": "x"}], "version": 1}
+        self.templater.render(data)
+        now[0] = 61
+        data["side"] = [{"item": "y"}]
+        self.assertEqual("<|Y>", self.templater.render(data))
+
+    def test_fragments_iterator(self):
+        data = {"nav": iter([{"title": "a"}]), "side": [], "version": 1}
+        self.assertEqual("<a|>", self.templater.render(data))
+        data["nav"] = iter([{"title": "a"}])
+        self.assertEqual("<a|>", self.templater.render(data))
+
+    def test_fragments_shared(self):
+        fragments = self.templater.formatter.fragments
+        data = {"nav": [{"x": "aB"}], "version": 1}
+        templaters = []
+        for converter, autoescape in ((str.upper, False), (str.lower, False),
+                (str.lower, True)):
+            templater = self.cls(template="{@nav:version}{x!h}{y}{/nav}")
+            templater.converters["h"] = converter
+            templater.autoescape = autoescape
+            templater.formatter.fragments = fragments
+            templaters.append(templater)
+        self.assertEqual(["AB", "ab", "ab"],
+            [t.render(dict(data, y="")) for t in templaters])
+        self.assertEqual(["AB<", "ab<", "ab&lt;"],
+            [t.render(dict(data, y="<", version=2)) for t in templaters])
+        same = self.cls(template="{@nav:version}{x!h}{y}{/nav}")
+        same.converters["h"] = str.upper
+        same.formatter.fragments = fragments
+        self.assertEqual("AB<", same.render(dict(data, y="?", version=2)))
+
+    def test_fragments_disabled(self):
+        self.templater.formatter.fragments = None
+        data = {"nav": [{"title": "a"}], "side": [{"item": "x"}], "version": 1}
+        self.assertEqual("<a|X>", self.templater.render(data))
+        self.assertEqual("<a|X>", self.templater.render(data))
+        self.assertEqual(2, self.calls)
+
+class TestStreaming(TemplateTest):
+    cls = Template
+
+    def setUp(self):
+        self.input = "<{#rows}[{a}]{/rows}>"
+        self.data = {"rows": [{"a": i} for i in range(100)]}
+        self.output = "<%s>" % "".join("[%d]" % i for i in range(100))
+
+    def test_generate(self):
+        templater = self.cls(template=self.input)
+        self.assertEqual(self.output, "".join(templater.generate(self.data)))
+
+    def test_generate_chunks(self):
+        templater = self.cls(template=self.input)
+        templater.buffersize = 10
+        chunks = list(templater.generate(self.data))
+        self.assertTrue(len(chunks) > 10)
+        self.assertEqual(self.output, "".join(chunks))
+
+    def test_generate_lazy(self):
+        consumed = []
+        def rows():
+            for i in range(100):
+                consumed.append(i)
+                yield {"a": i}
+        templater = self.cls(template=self.input)
+        templater.buffersize = 10
+        chunks = templater.generate({"rows": rows()})
+        next(chunks)
+        self.assertTrue(len(consumed) < 10)
+
+    def test_generate_empty(self):
+        for input in ("", "{%comment}"):
+            templater = self.cls(template=input)
+            self.assertEqual([], list(templater.generate(self.data)))
+
+    def test_generate_converted_section(self):
+        templater = self.cls(template="{#rows!u}{a}{/rows}")
+        templater.converters["u"] = lambda s: s.upper()
+        data = {"rows": [{"a": "x"}, {"a": "y"}]}
+        self.assertEqual("XY", "".join(templater.generate(data)))
+
+    def test_render_to(self):
+        import io
+        templater = self.cls(template=self.input)
+        fileobj = io.StringIO()
+        templater.render_to(self.data, fileobj)
+        self.assertEqual(self.output, fileobj.getvalue())
+
+class TestRenderMany(TemplateTest):
+    cls = Template
+
+    def test_render_many(self):
+        templater = self.cls(template="Dear {name},{#items} {item}{/items}")
+        datas = [{"name": n, "items": [{"item": i} for i in range(k)]}
+            for k, n in enumerate(["a", "b", "c"])]
+        self.assertEqual(["Dear a,", "Dear b, 0", "Dear c, 0 1"],
+            list(templater.render_many(datas)))
+
+    def test_render_many_lazy(self):
+        templater = self.cls(template="{a}")
+        results = templater.render_many({"a": i} for i in range(10 ** 9))
+        self.assertEqual("0", next(results))
+        self.assertEqual("1", next(results))
+
+class TestRerender(TemplateTest):
+    cls = Template
+
+    def setUp(self):
+        self.seen = []
+        self.templater = self.cls(
+            template="{title!c}:{#rows}[{title}{v!c}]{/rows}<{total!c}>")
+        self.templater.converters["c"] = self.convert
+        self.data = {"title": "t", "total": 3,
+            "rows": [{"v": 1}, {"v": 2}, {"v": 3}]}
+
+    def convert(self, value):
+        self.seen.append(value)
+        return value
+
+    def rerender(self, data, changes=None):
+        del self.seen[:]
+        return self.templater.rerender(data, changes)
+
+    def test_first(self):
+        self.assertEqual(self.templater.render(self.data), self.rerender(self.data))
+        self.assertEqual(5, len(self.seen))
+
+    def test_unchanged(self):
+        self.rerender(self.data)
+        self.assertEqual("t:[t1][t2][t3]<3>", self.rerender(dict(self.data)))
+        self.assertEqual([], self.seen)
+
+    def test_changed_row(self):
+        self.rerender(self.data)
+        rows = [{"v": 1}, {"v": 20}, {"v": 3}, {"v": 4}]
+        self.assertEqual("t:[t1][t20][t3][t4]<4>",
+            self.rerender(dict(self.data, rows=rows, total=4)))
+        self.assertEqual([20, 4, 4], self.seen)
+
+    def test_removed_rows(self):
+        self.rerender(self.data)
+        self.assertEqual("t:[t1]<3>",
+            self.rerender(dict(self.data, rows=self.data["rows"][:1])))
+        self.assertEqual([], self.seen)
+
+    def test_changed_enclosing(self):
+        self.rerender(self.data)
+        self.assertEqual("u:[u1][u2][u3]<3>", self.rerender(dict(self.data, title="u")))
+        self.assertEqual(["u", 1, 2, 3], self.seen)
+
+    def test_changes(self):
+        self.rerender(self.data)
+        self.data["rows"][1]["v"] = 20
+        self.assertEqual("t:[t1][t2][t3]<3>", self.rerender(self.data))
+        self.assertEqual("t:[t1][t20][t3]<3>",
+            self.rerender(self.data, [("rows", 1)]))
+        self.assertEqual([20], self.seen)
+        self.data["total"] = 4
+        self.assertEqual("t:[t1][t20][t3]<4>", self.rerender(self.data, ["total"]))
+        self.assertEqual([4], self.seen)
+
+    def test_changes_section(self):
+        self.rerender(self.data)
+        self.data["rows"].append({"v": 4})
+        self.assertEqual("t:[t1][t2][t3][t4]<3>", self.rerender(self.data, ["rows"]))
+        self.assertEqual([1, 2, 3, 4], self.seen)
+
+    def test_recompile(self):
+        self.rerender(self.data)
+        self.templater.template = "{title}"
+        self.assertEqual("t", self.rerender(self.data))
+
+class TestColumns(TemplateTest):
+    cls = Template
+
+    def test_columns(self):
+        self.assertProduces("{#rows}{a}{b} {/rows}", "1x 2y 3z ",
+            {"rows": {"a": [1, 2, 3], "b": ["x", "y", "z"]}})
+
+    def test_columns_enclosing(self):
+        self.assertProduces("{#rows}{title}{a} {/rows}", "t1 t2 ",
+            {"title": "t", "rows": {"a": [1, 2]}})
+
+    def test_columns_nested(self):
+        self.assertProduces("{#rows}{a}:{#inner}{b}{/inner} {/rows}", "1:xy 2:z ",
+            {"rows": {"a": [1, 2],
+                "inner": [{"b": ["x", "y"]}, [{"b": "z"}]]}})
+
+    def test_columns_empty(self):
+        self.assertProduces("<{#rows}{a}{/rows}>", "<>", {"rows": {}})
+        self.assertProduces("<{#rows}{a}{/rows}>", "<>", {"rows": {"a": []}})
+
+    def test_columns_lengths(self):
+        templater = self.cls(template="{#rows}{a}{/rows}")
+        self.assertRaises(ValueError, templater.render,
+            {"rows": {"a": [1, 2], "b": [1]}})
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_columns_numpy(self):
+        self.assertProduces("{#rows}{a}:{b:.1f} {/rows}", "0:0.5 1:1.5 ",
+            {"rows": {"a": numpy.arange(2), "b": numpy.arange(2) + 0.5}})
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_columns_numpy_formatting(self):
+        self.assertProduces("{#rows}{a:.2f}|{a}|{a!s:>5}|{b:03d} {/rows}",
+            "0.50|0.5|  0.5|000 1.25|1.25| 1.25|001 ",
+            {"rows": {"a": numpy.array([0.5, 1.25]), "b": numpy.arange(2)}})
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_columns_numpy_blocks(self):
+        templater = self.cls(template="{#rows}<{a:.1f}|{b:d}|{a:.1f}>{/rows}")
+        templater.formatter.blocksize = 2
+        data = {"rows": {"a": numpy.arange(5) / 2.0, "b": numpy.arange(5)}}
+        self.assertEqual("".join("<%.1f|%d|%.1f>" % (i / 2.0, i, i / 2.0)
+            for i in range(5)), templater.render(data))
@@ -0,0 +1,53 @@
+import pickle
+
+from tests import BaseTest
+
+from ptemplate.util import LRU, buffered
+
+class TestLRU(BaseTest):
+
+    def setUp(self):
+        self.lru = LRU(2)
+        self.lru["a"] = 1
+        self.lru["b"] = 2
+
+    def test_get(self):
+        self.assertEqual(1, self.lru["a"])
+        self.assertEqual(None, self.lru.get("c"))
+        self.assertRaises(KeyError, lambda: self.lru["c"])
+        self.assertEqual((1, 2), (self.lru.hits, self.lru.misses))
+
+    def test_evict(self):
+        self.lru["a"]
+        self.lru["c"] = 3
+        self.assertEqual(2, len(self.lru))
+        self.assertTrue("a" in self.lru)
+        self.assertFalse("b" in self.lru)
+
+    def test_clear(self):
+        self.lru["a"]
+        self.lru.clear()
+        self.assertEqual((0, 0, 0), (len(self.lru), self.lru.hits, self.lru.misses))
+
+    def test_ttl(self):
+        lru = LRU(2, ttl=10)
+        now = [0]
+        lru.clock = lambda: now[0]
+        lru["a"] = 1
+        now[0] = 9
+        self.assertEqual(1, lru["a"])
+        now[0] = 10
+        self.assertFalse("a" in lru)
+        self.assertEqual(None, lru.get("a"))
+        self.assertEqual(0, len(lru))
+
+    def test_pickle(self):
+        lru = pickle.loads(pickle.dumps(self.lru))
+        self.assertEqual((2, 0), (lru.maxsize, len(lru)))
+        lru["c"] = 3
+        self.assertEqual(3, lru["c"])
+
+class TestBuffered(BaseTest):
+
+    def test_buffered(self):
+        self.assertEqual(["abc", "de"], list(buffered(["a", "bc", "d", "e"], 3)))